@@ -0,0 +1,212 @@
+"""
+Admission control and load shedding for webhook traffic
+
+Each subsystem (the webhook tier as a whole, database writes, response
+generation) admits a bounded number of concurrent operations and lets a
+bounded number more wait briefly for a slot. Anything beyond that, or
+anything still waiting when its queue timeout expires, is refused with
+Overloaded at once. The caller then degrades: a webhook answers with a
+precomputed "please hold" TwiML, a transcript write is skipped, and a
+generated reply falls back to the scripted one. Nothing queues until
+Twilio's own timeout does.
+
+New calls are also rate limited per caller ID with token buckets, so a
+robocall flood from a few numbers cannot crowd out everyone else.
+"""
+import asyncio
+import collections
+import time
+from typing import Deque, Dict, Optional
+
+from metrics import registry
+
+IN_FLIGHT = registry.gauge(
+    "voice_ai_admission_in_flight",
+    "Operations currently admitted, by subsystem",
+    ("subsystem",)
+)
+QUEUED = registry.gauge(
+    "voice_ai_admission_queued",
+    "Operations waiting for a slot, by subsystem",
+    ("subsystem",)
+)
+SHED = registry.counter(
+    "voice_ai_shed_total",
+    "Work refused by admission control, by subsystem and reason",
+    ("subsystem", "reason")
+)
+
+
+class Overloaded(Exception):
+    """A subsystem refused work because it is saturated"""
+
+    def __init__(self, subsystem: str, reason: str):
+        super().__init__(f"{subsystem} overloaded ({reason})")
+        self.subsystem = subsystem
+        self.reason = reason
+
+
+class Subsystem:
+    """
+    Concurrency limit with a bounded FIFO wait queue
+
+    Used from the event loop only: acquire and release are not thread-safe,
+    but the work they guard may run in a thread pool.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_queue: int = 0, queue_timeout: float = 0.0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+        self._publish()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def saturated(self) -> bool:
+        """True when new work would have to wait"""
+        return self.in_flight >= self.max_in_flight
+
+    def _publish(self):
+        IN_FLIGHT.set(self.in_flight, self.name)
+        QUEUED.set(len(self._waiters), self.name)
+
+    def _refuse(self, reason: str):
+        SHED.inc(self.name, reason)
+        raise Overloaded(self.name, reason)
+
+    async def acquire(self):
+        """
+        Take a slot, waiting at most queue_timeout for one
+
+        Raises:
+            Overloaded: The queue is full or the wait timed out
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self._publish()
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._refuse("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._publish()
+        try:
+            # release() hands its slot directly to the first waiter
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._refuse("timeout")
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            self._publish()
+
+    def release(self):
+        """Free a slot, passing it to the next waiter if there is one"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._publish()
+                return
+        self.in_flight -= 1
+        self._publish()
+
+    async def __aenter__(self) -> "Subsystem":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        self.release()
+        return False
+
+
+class CallerRateLimiter:
+    """Token bucket per caller ID"""
+
+    def __init__(self, rate_per_minute: float, burst: int, max_callers: int = 100000):
+        """
+        Args:
+            rate_per_minute: Sustained calls per minute allowed from one number
+            burst: Calls a number may place back to back
+            max_callers: Buckets kept; the least recently seen are dropped first
+        """
+        self.rate = rate_per_minute / 60.0
+        self.burst = float(burst)
+        self.max_callers = max_callers
+        # number -> [tokens, monotonic time of last update]
+        self._buckets: "collections.OrderedDict[str, list]" = collections.OrderedDict()
+        # CallSid -> decision, so a retried webhook is not charged again
+        self._decisions: "collections.OrderedDict[str, bool]" = collections.OrderedDict()
+
+    def allow(self, number: Optional[str], call_sid: Optional[str] = None, now: Optional[float] = None) -> bool:
+        """
+        Take a token for a new call from a number; False if it is over its rate
+
+        A call identified by `call_sid` is charged once; asking again
+        repeats the first answer.
+        """
+        if self.rate <= 0:
+            return True
+        if call_sid is not None:
+            decision = self._decisions.get(call_sid)
+            if decision is None:
+                decision = self._decisions[call_sid] = self.allow(number, now=now)
+                if len(self._decisions) > self.max_callers:
+                    self._decisions.popitem(last=False)
+            return decision
+        now = time.monotonic() if now is None else now
+        key = number or "anonymous"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+            if len(self._buckets) > self.max_callers:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1.0:
+            SHED.inc("caller", "rate_limited")
+            return False
+        bucket[0] -= 1.0
+        return True
+
+
+class AdmissionController:
+    """The subsystems of one process"""
+
+    def __init__(self, subsystems: Dict[str, Subsystem], callers: CallerRateLimiter):
+        self.subsystems = subsystems
+        self.callers = callers
+
+    def __getitem__(self, name: str) -> Subsystem:
+        return self.subsystems[name]
+
+
+def from_settings(settings) -> AdmissionController:
+    """Build the controller from the ADMISSION_* and CALLER_* settings"""
+    timeout = settings.admission_queue_timeout
+    return AdmissionController(
+        {
+            "webhook": Subsystem("webhook", settings.admission_max_webhooks,
+                                 settings.admission_webhook_queue, timeout),
+            "db": Subsystem("db", settings.admission_max_db_writes, settings.admission_db_queue, timeout),
+            # Generation is optional; never wait for it
+            "generate": Subsystem("generate", settings.admission_max_generations),
+        },
+        CallerRateLimiter(settings.caller_rate_per_minute, settings.caller_burst),
+    )
@@ -0,0 +1,439 @@
+"""
+In-process telephony audio codecs and resampling (NumPy)
+
+Twilio media is 8 kHz G.711 (μ-law), Whisper expects 16 kHz float32 and
+Coqui TTS produces 22.05 kHz float32. Everything here is vectorized and
+accepts an optional ``out`` buffer so hot paths can reuse allocations.
+"""
+import io
+import logging
+import struct
+import threading
+import wave
+from math import gcd
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TWILIO_SAMPLE_RATE = 8000
+WHISPER_SAMPLE_RATE = 16000
+COQUI_SAMPLE_RATE = 22050
+
+_ULAW_BIAS = 0x84
+_ULAW_CLIP = 32635
+
+
+def _build_ulaw_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """Build the 256-entry μ-law decode table and 65536-entry encode table"""
+    codes = np.arange(256, dtype=np.int32)
+    inverted = ~codes & 0xFF
+    sign = inverted & 0x80
+    exponent = (inverted >> 4) & 0x07
+    mantissa = inverted & 0x0F
+    magnitude = (((mantissa << 3) + _ULAW_BIAS) << exponent) - _ULAW_BIAS
+    decode = np.where(sign != 0, -magnitude, magnitude).astype(np.int16)
+
+    # Reference G.711 encoder operating on 14-bit magnitudes
+    pcm = np.arange(-32768, 32768, dtype=np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(pcm), _ULAW_CLIP >> 2) + (_ULAW_BIAS >> 2)
+    # Segment is the position of the highest set bit above bit 5
+    segment = np.clip(np.floor(np.log2(magnitude)).astype(np.int32) - 5, 0, 7)
+    mantissa = (magnitude >> (segment + 1)) & 0x0F
+    encode = (((segment << 4) | mantissa) ^ mask).astype(np.uint8)
+    return decode, encode
+
+
+def _build_alaw_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """Build the 256-entry A-law decode table and 65536-entry encode table"""
+    codes = np.arange(256, dtype=np.int32) ^ 0x55
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = np.where(
+        exponent == 0,
+        (mantissa << 4) + 8,
+        ((mantissa << 4) + 0x108) << np.maximum(exponent - 1, 0)
+    )
+    decode = np.where(sign != 0, magnitude, -magnitude).astype(np.int16)
+
+    pcm = np.arange(-32768, 32768, dtype=np.int32)
+    sign = np.where(pcm >= 0, 0x80, 0)
+    magnitude = np.minimum(np.where(pcm >= 0, pcm, -pcm - 1), 0x7FFF)
+    exponent = np.clip(np.floor(np.log2(np.maximum(magnitude, 1))).astype(np.int32) - 7, 0, 7)
+    shift = np.where(exponent == 0, 4, exponent + 3)
+    mantissa = (magnitude >> shift) & 0x0F
+    encode = (((sign | (exponent << 4) | mantissa) ^ 0x55) & 0xFF).astype(np.uint8)
+    return decode, encode
+
+
+_ULAW_DECODE, _ULAW_ENCODE = _build_ulaw_tables()
+_ALAW_DECODE, _ALAW_ENCODE = _build_alaw_tables()
+
+
+def _as_codes(data) -> np.ndarray:
+    """View bytes-like G.711 data as a uint8 array without copying"""
+    if isinstance(data, np.ndarray):
+        return data.view(np.uint8) if data.dtype != np.uint8 else data
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def ulaw_decode(data, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Decode μ-law bytes to 16-bit PCM
+
+    Args:
+        data: μ-law encoded bytes or uint8 array
+        out: Optional int16 buffer of the same length
+
+    Returns:
+        int16 PCM samples
+    """
+    return np.take(_ULAW_DECODE, _as_codes(data), out=out)
+
+
+def ulaw_encode(pcm: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Encode 16-bit PCM to μ-law
+
+    Args:
+        pcm: int16 PCM samples
+        out: Optional uint8 buffer of the same length
+
+    Returns:
+        uint8 μ-law codes (use .tobytes() for the wire format)
+    """
+    indices = pcm.astype(np.int32) + 32768
+    return np.take(_ULAW_ENCODE, indices, out=out)
+
+
+def alaw_decode(data, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Decode A-law bytes to 16-bit PCM
+
+    Args:
+        data: A-law encoded bytes or uint8 array
+        out: Optional int16 buffer of the same length
+
+    Returns:
+        int16 PCM samples
+    """
+    return np.take(_ALAW_DECODE, _as_codes(data), out=out)
+
+
+def alaw_encode(pcm: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Encode 16-bit PCM to A-law
+
+    Args:
+        pcm: int16 PCM samples
+        out: Optional uint8 buffer of the same length
+
+    Returns:
+        uint8 A-law codes
+    """
+    indices = pcm.astype(np.int32) + 32768
+    return np.take(_ALAW_ENCODE, indices, out=out)
+
+
+def as_float32(samples) -> np.ndarray:
+    """View a sequence of samples as a float32 array, copying only if needed"""
+    return np.asarray(samples, dtype=np.float32)
+
+
+def pcm16_to_float32(pcm: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Convert int16 PCM to float32 in [-1, 1)"""
+    return np.multiply(pcm, np.float32(1.0 / 32768.0), out=out, dtype=np.float32)
+
+
+def float32_to_pcm16(samples: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Convert float32 samples to int16 PCM, clipping out-of-range values"""
+    if out is None:
+        out = np.empty(len(samples), dtype=np.int16)
+    scaled = np.multiply(samples, 32767.0, dtype=np.float32)
+    np.clip(scaled, -32768, 32767, out=scaled)
+    np.copyto(out, scaled, casting='unsafe')
+    return out
+
+
+class Resampler:
+    """
+    Polyphase FIR resampler for a fixed rational rate change
+
+    The Kaiser-windowed sinc filter and the gather plan for one block of
+    input are built once per rate pair; input is processed block by block
+    through preallocated work buffers. Instances are shared, so the buffers
+    are guarded by a lock.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, taps_per_phase: int = 16,
+                 beta: float = 8.0, rolloff: float = 0.94, block_size: int = 2048):
+        """
+        Initialize the resampler
+
+        Args:
+            src_rate: Input sample rate in Hz
+            dst_rate: Output sample rate in Hz
+            taps_per_phase: Filter taps per polyphase branch
+            beta: Kaiser window shape parameter
+            rolloff: Cutoff as a fraction of the lower Nyquist frequency
+            block_size: Approximate input samples processed per block
+        """
+        divisor = gcd(src_rate, dst_rate)
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.up = dst_rate // divisor
+        self.down = src_rate // divisor
+        self.taps_per_phase = taps_per_phase
+
+        length = taps_per_phase * self.up
+        # Design an odd-length filter so the group delay is a whole sample,
+        # then zero-pad it to fill the polyphase matrix
+        designed = length if length % 2 else length - 1
+        n = np.arange(designed, dtype=np.float64)
+        cutoff = rolloff * 0.5 / max(self.up, self.down)
+        taps = 2 * cutoff * np.sinc(2 * cutoff * (n - (designed - 1) / 2.0))
+        taps *= np.kaiser(designed, beta) * self.up
+        taps = np.concatenate([taps, np.zeros(length - designed)])
+        # phases[p, k] = taps[k * up + p]
+        phases = taps.reshape(taps_per_phase, self.up).T.astype(np.float32)
+        delay = (designed - 1) // 2
+
+        # A block of a whole number of `down` input samples maps to exactly
+        # block_in * up / down outputs, so one plan serves every block
+        self.block_in = self.down * max(1, -(-block_size // self.down))
+        self.block_out = self.block_in * self.up // self.down
+        positions = np.arange(self.block_out, dtype=np.int64) * self.down + delay
+        offsets = np.arange(taps_per_phase, dtype=np.int64)
+        # Indices into the input padded with taps_per_phase - 1 leading zeros
+        self._indices = (positions // self.up)[:, None] - offsets[None, :] + (taps_per_phase - 1)
+        self._weights = np.ascontiguousarray(phases[positions % self.up])
+        self._reach = int(self._indices.max()) + 1
+
+        self._shifted = np.empty_like(self._indices)
+        self._gathered = np.empty(self._indices.shape, dtype=np.float32)
+        self._block = np.empty(self.block_out, dtype=np.float32)
+        self._padded = np.zeros(0, dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def output_length(self, input_length: int) -> int:
+        """Number of output samples produced for an input of the given length"""
+        return (input_length * self.up + self.down - 1) // self.down
+
+    def process(self, samples: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Resample a buffer of float32 samples
+
+        Args:
+            samples: Input samples (float32, mono)
+            out: Optional float32 buffer of output_length(len(samples))
+
+        Returns:
+            Resampled float32 samples
+        """
+        if self.up == self.down:
+            if out is None:
+                return np.array(samples, dtype=np.float32)
+            np.copyto(out, samples)
+            return out
+
+        total = self.output_length(len(samples))
+        if out is None:
+            out = np.empty(total, dtype=np.float32)
+        blocks = -(-total // self.block_out)
+        pad = self.taps_per_phase - 1
+
+        with self._lock:
+            needed = max(self._reach + (blocks - 1) * self.block_in, pad + len(samples))
+            if len(self._padded) < needed:
+                self._padded = np.zeros(needed, dtype=np.float32)
+            padded = self._padded
+            padded[:pad] = 0.0
+            padded[pad:pad + len(samples)] = samples
+            padded[pad + len(samples):needed] = 0.0
+
+            for block in range(blocks):
+                np.add(self._indices, block * self.block_in, out=self._shifted)
+                np.take(padded, self._shifted, out=self._gathered)
+                np.einsum('ij,ij->i', self._gathered, self._weights, out=self._block)
+                start = block * self.block_out
+                stop = min(start + self.block_out, total)
+                out[start:stop] = self._block[:stop - start]
+        return out
+
+
+_resamplers: Dict[Tuple[int, int], Resampler] = {}
+
+
+_resamplers_lock = threading.Lock()
+
+
+def get_resampler(src_rate: int, dst_rate: int) -> Resampler:
+    """Get a shared resampler for a rate pair (filters are designed once)"""
+    key = (src_rate, dst_rate)
+    resampler = _resamplers.get(key)
+    if resampler is None:
+        with _resamplers_lock:
+            resampler = _resamplers.get(key)
+            if resampler is None:
+                resampler = Resampler(src_rate, dst_rate)
+                _resamplers[key] = resampler
+    return resampler
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int,
+             out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Resample float32 audio between two rates
+
+    Args:
+        samples: float32 mono samples
+        src_rate: Input sample rate in Hz
+        dst_rate: Output sample rate in Hz
+        out: Optional output buffer
+
+    Returns:
+        Resampled float32 samples
+    """
+    return get_resampler(src_rate, dst_rate).process(samples, out=out)
+
+
+def normalize_gain(samples: np.ndarray, target_dbfs: float = -20.0, max_gain_db: float = 30.0,
+                   out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Scale audio to a target RMS level, limited so peaks do not clip
+
+    Args:
+        samples: float32 samples
+        target_dbfs: Target RMS level in dBFS
+        max_gain_db: Largest boost applied to quiet input
+        out: Optional output buffer (may be ``samples`` for in-place)
+
+    Returns:
+        Gain-normalized float32 samples
+    """
+    if out is None:
+        out = np.empty_like(samples, dtype=np.float32)
+    if len(samples) == 0:
+        return out
+
+    rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float32))))
+    peak = float(np.max(np.abs(samples)))
+    if rms <= 0.0 or peak <= 0.0:
+        np.copyto(out, samples)
+        return out
+
+    gain = 10 ** (target_dbfs / 20.0) / rms
+    gain = min(gain, 10 ** (max_gain_db / 20.0), 0.999 / peak)
+    np.multiply(samples, np.float32(gain), out=out)
+    return out
+
+
+def twilio_to_whisper(ulaw_data: bytes) -> np.ndarray:
+    """
+    Convert Twilio 8 kHz μ-law to Whisper's 16 kHz float32
+
+    Args:
+        ulaw_data: μ-law encoded bytes
+
+    Returns:
+        float32 samples at 16 kHz
+    """
+    pcm = pcm16_to_float32(ulaw_decode(ulaw_data))
+    return resample(pcm, TWILIO_SAMPLE_RATE, WHISPER_SAMPLE_RATE)
+
+
+def to_twilio(samples: np.ndarray, sample_rate: int = COQUI_SAMPLE_RATE,
+              normalize: bool = True) -> bytes:
+    """
+    Convert float32 audio (e.g. Coqui output) to Twilio 8 kHz μ-law
+
+    Args:
+        samples: float32 mono samples
+        sample_rate: Input sample rate in Hz
+        normalize: Apply gain normalization before encoding
+
+    Returns:
+        μ-law encoded bytes
+    """
+    samples = as_float32(samples)
+    narrowband = resample(samples, sample_rate, TWILIO_SAMPLE_RATE)
+    if normalize:
+        normalize_gain(narrowband, out=narrowband)
+    return ulaw_encode(float32_to_pcm16(narrowband)).tobytes()
+
+
+def decode_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """
+    Decode a PCM WAV file held in memory to mono float32
+
+    Args:
+        data: WAV file bytes
+
+    Returns:
+        (float32 mono samples, sample rate)
+    """
+    with wave.open(io.BytesIO(data), 'rb') as wav:
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if width == 2:
+        samples = pcm16_to_float32(np.frombuffer(frames, dtype='<i2'))
+    elif width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1, dtype=np.float32)
+    return samples, rate
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """
+    Encode mono float32 samples as a 16-bit PCM WAV file
+
+    Args:
+        samples: float32 mono samples
+        sample_rate: Sample rate in Hz
+
+    Returns:
+        WAV file bytes
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(float32_to_pcm16(np.asarray(samples, dtype=np.float32)).tobytes())
+    return buffer.getvalue()
+
+
+def encode_mulaw_wav(ulaw_data: bytes, sample_rate: int = TWILIO_SAMPLE_RATE) -> bytes:
+    """
+    Wrap μ-law bytes in a WAV container (format 7) without transcoding
+
+    Args:
+        ulaw_data: μ-law encoded mono audio
+        sample_rate: Sample rate in Hz
+
+    Returns:
+        WAV file bytes
+    """
+    ulaw_data = bytes(ulaw_data)
+    fmt = struct.pack("<HHIIHHH", 7, 1, sample_rate, sample_rate, 1, 8, 0)
+    fact = struct.pack("<I", len(ulaw_data))
+    pad = b"\0" if len(ulaw_data) & 1 else b""
+    body = (
+        b"WAVE"
+        + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"fact" + struct.pack("<I", len(fact)) + fact
+        + b"data" + struct.pack("<I", len(ulaw_data)) + ulaw_data + pad
+    )
+    return b"RIFF" + struct.pack("<I", len(body)) + body
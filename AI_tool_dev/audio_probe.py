@@ -0,0 +1,303 @@
+"""
+Header-only audio metadata probing for recordings
+"""
+import collections
+import logging
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AudioInfo(NamedTuple):
+    """Basic audio stream metadata"""
+    duration: float  # seconds
+    sample_rate: int
+    channels: int
+    format: str  # wav, flac, mp3, ogg, or "decoded" when the fallback was used
+
+
+# MPEG audio lookup tables, indexed by [version][layer] where version is
+# 1 (MPEG-1) or 2 (MPEG-2/2.5) and layer is 1-3
+_MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),   # MPEG-2.5
+}
+
+# Bytes read from the start of a file; enough for any header we parse
+_HEAD_SIZE = 64 * 1024
+
+
+def _probe_wav(f, head: bytes, size: int) -> Optional[AudioInfo]:
+    """Walk RIFF chunks for fmt and data without reading sample data"""
+    if len(head) < 12 or head[8:12] != b"WAVE":
+        return None
+
+    offset = 12
+    channels = sample_rate = byte_rate = 0
+    data_size = None
+    while offset + 8 <= size:
+        f.seek(offset)
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            break
+        chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+        if chunk_id == b"fmt ":
+            fmt = f.read(16)
+            if len(fmt) < 16:
+                return None
+            _, channels, sample_rate, byte_rate = struct.unpack("<HHII", fmt[:12])
+        elif chunk_id == b"data":
+            # Streaming writers leave the size at 0 or 0xFFFFFFFF
+            available = size - offset - 8
+            data_size = available if chunk_size in (0, 0xFFFFFFFF) else min(chunk_size, available)
+            if byte_rate:
+                break
+        offset += 8 + chunk_size + (chunk_size & 1)
+
+    if not byte_rate or data_size is None:
+        return None
+    return AudioInfo(data_size / byte_rate, sample_rate, channels, "wav")
+
+
+def _probe_flac(f, head: bytes, size: int) -> Optional[AudioInfo]:
+    """Read the STREAMINFO metadata block"""
+    if len(head) < 42 or head[4] & 0x7F != 0:
+        return None
+    info = int.from_bytes(head[18:26], "big")
+    sample_rate = info >> 44
+    channels = ((info >> 41) & 0x07) + 1
+    total_samples = info & 0xFFFFFFFFF
+    if not sample_rate or not total_samples:
+        return None
+    return AudioInfo(total_samples / sample_rate, sample_rate, channels, "flac")
+
+
+def _probe_ogg(f, head: bytes, size: int) -> Optional[AudioInfo]:
+    """Read the codec ID header and the granule position of the last page"""
+    segments = head[26] if len(head) > 27 else 0
+    packet = head[27 + segments:27 + segments + 32]
+    if packet[:7] == b"\x01vorbis":
+        channels = packet[11]
+        sample_rate = struct.unpack("<I", packet[12:16])[0]
+        granule_rate, pre_skip = sample_rate, 0
+    elif packet[:8] == b"OpusHead":
+        channels = packet[9]
+        pre_skip = struct.unpack("<H", packet[10:12])[0]
+        sample_rate = struct.unpack("<I", packet[12:16])[0] or 48000
+        # Opus granule positions always count 48 kHz samples
+        granule_rate = 48000
+    else:
+        return None
+
+    tail_size = min(size, _HEAD_SIZE)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    last_page = tail.rfind(b"OggS")
+    if last_page < 0 or last_page + 14 > len(tail):
+        return None
+    granule = struct.unpack("<q", tail[last_page + 6:last_page + 14])[0]
+    if granule <= 0 or not granule_rate:
+        return None
+    return AudioInfo(max(granule - pre_skip, 0) / granule_rate, sample_rate, channels, "ogg")
+
+
+def _probe_mp3(f, head: bytes, size: int) -> Optional[AudioInfo]:
+    """Parse the first frame header, using a Xing/VBRI header when present"""
+    # Skip an ID3v2 tag; `base` is the file offset of head[0]
+    base = 0
+    if head[:3] == b"ID3" and len(head) >= 10:
+        base = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+        f.seek(base)
+        head = f.read(_HEAD_SIZE)
+
+    # Find the first frame sync
+    position = 0
+    while position + 4 <= len(head):
+        if head[position] == 0xFF and head[position + 1] & 0xE0 == 0xE0:
+            break
+        position += 1
+    else:
+        return None
+
+    header = struct.unpack(">I", head[position:position + 4])[0]
+    version_bits = (header >> 19) & 0x3
+    layer_bits = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xF
+    rate_index = (header >> 10) & 0x3
+    channel_mode = (header >> 6) & 0x3
+    if version_bits == 1 or layer_bits == 0 or rate_index == 3 or bitrate_index in (0, 15):
+        return None
+
+    version = 1 if version_bits == 3 else 2
+    layer = 4 - layer_bits
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][rate_index]
+    channels = 1 if channel_mode == 3 else 2
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 3 and version == 2:
+        samples_per_frame = 576
+    else:
+        samples_per_frame = 1152
+
+    # VBR files carry a frame count in a Xing/Info or VBRI header
+    if version == 1:
+        side_info = 17 if channels == 1 else 32
+    else:
+        side_info = 9 if channels == 1 else 17
+    xing = position + 4 + side_info
+    if head[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", head[xing + 4:xing + 8])[0]
+        if flags & 0x1:
+            frames = struct.unpack(">I", head[xing + 8:xing + 12])[0]
+            return AudioInfo(frames * samples_per_frame / sample_rate, sample_rate, channels, "mp3")
+    vbri = position + 36
+    if head[vbri:vbri + 4] == b"VBRI":
+        frames = struct.unpack(">I", head[vbri + 14:vbri + 18])[0]
+        return AudioInfo(frames * samples_per_frame / sample_rate, sample_rate, channels, "mp3")
+
+    # Constant bitrate: estimate from the audio payload size
+    bitrate = _MP3_BITRATES[(version, layer)][bitrate_index] * 1000
+    audio_bytes = size - base - position
+    if size >= 128:
+        f.seek(size - 128)
+        if f.read(3) == b"TAG":
+            audio_bytes -= 128
+    return AudioInfo(audio_bytes * 8 / bitrate, sample_rate, channels, "mp3")
+
+
+def probe_header(path: str) -> Optional[AudioInfo]:
+    """
+    Read audio metadata from container headers only
+
+    Args:
+        path: Path to audio file
+
+    Returns:
+        AudioInfo, or None if the format is not recognised
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(_HEAD_SIZE)
+        if head[:4] in (b"RIFF", b"RF64"):
+            return _probe_wav(f, head, size)
+        if head[:4] == b"fLaC":
+            return _probe_flac(f, head, size)
+        if head[:4] == b"OggS":
+            return _probe_ogg(f, head, size)
+        if head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+            return _probe_mp3(f, head, size)
+    return None
+
+
+def _probe_decoded(path: str) -> Optional[AudioInfo]:
+    """Fall back to decoding the whole file with pydub/ffmpeg"""
+    try:
+        from pydub import AudioSegment
+        audio = AudioSegment.from_file(path)
+        return AudioInfo(len(audio) / 1000.0, audio.frame_rate, audio.channels, "decoded")
+    except Exception as e:
+        logger.error(f"Error decoding audio for probe: {str(e)}")
+        return None
+
+
+class ProbeCache:
+    """LRU cache of probe results keyed by (path, mtime, size)"""
+
+    def __init__(self, max_entries: int = 100000):
+        self._entries: "collections.OrderedDict[Tuple[str, int, int], Optional[AudioInfo]]" = collections.OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, int, int]):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return True, self._entries[key]
+        return False, None
+
+    def put(self, key: Tuple[str, int, int], info: Optional[AudioInfo]):
+        with self._lock:
+            self._entries[key] = info
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+probe_cache = ProbeCache()
+
+
+def probe(path: str, allow_decode: bool = True) -> Optional[AudioInfo]:
+    """
+    Get duration, sample rate and channels of an audio file
+
+    Container headers are read first; the file is only decoded when the
+    header cannot be parsed. Results are cached until the file changes,
+    except header misses when `allow_decode` is off.
+
+    Args:
+        path: Path to audio file
+        allow_decode: Decode the file when header probing fails
+
+    Returns:
+        AudioInfo, or None if the file could not be probed
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        logger.error(f"Error probing audio: {str(e)}")
+        return None
+
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    found, info = probe_cache.get(key)
+    if found:
+        return info
+
+    try:
+        info = probe_header(path)
+    except (OSError, struct.error, IndexError, KeyError, ZeroDivisionError) as e:
+        logger.debug(f"Header probe failed for {path}: {str(e)}")
+        info = None
+
+    if info is None and allow_decode:
+        info = _probe_decoded(path)
+
+    # A header miss without decoding says nothing about what decoding would find
+    if info is not None or allow_decode:
+        probe_cache.put(key, info)
+    return info
+
+
+def probe_many(paths: Iterable[str], max_workers: int = 8,
+               allow_decode: bool = True) -> Dict[str, Optional[AudioInfo]]:
+    """
+    Probe many files concurrently
+
+    Args:
+        paths: Audio file paths
+        max_workers: Thread pool size (probing is I/O bound)
+        allow_decode: Decode files whose headers cannot be parsed
+
+    Returns:
+        Mapping of path to AudioInfo (None for files that failed)
+    """
+    paths = list(paths)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(lambda p: probe(p, allow_decode=allow_decode), paths)
+        return dict(zip(paths, results))
@@ -0,0 +1,398 @@
+"""
+Offline batch transcription of recorded calls into CallLog
+
+Usage:
+    python batch_transcribe.py --dir recordings/
+    python batch_transcribe.py --manifest recordings.jsonl --spool tmp/recordings
+    python batch_transcribe.py --recordings ./recordings
+
+Recordings are named by CallSid (e.g. CA123....wav). A manifest is NDJSON
+with one {"call_sid": ..., "url": ...} object per line, pointing at Twilio's
+recordings API or a local stand-in for it. --recordings re-transcribes
+caller audio captured by call_recorder (CALL_RECORDING), reading the
+memory-mapped segments in place.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".ulaw")
+# Manifest URLs on this host (or a regional api.*.twilio.com) get the account credentials
+TWILIO_API_HOST = "api.twilio.com"
+
+# One STT engine per worker process, created by the pool initializer
+_worker_engine = None
+# Recording index of a worker process, opened on its first --recordings task
+_worker_recordings = None
+
+
+def _init_worker(model_size: Optional[str], device: Optional[str], cpu_threads: int):
+    """Load the Whisper model once per worker process"""
+    global _worker_engine
+    from stt_module import STTEngine
+    _worker_engine = STTEngine(model_size=model_size, device=device, cpu_threads=cpu_threads)
+
+
+def _transcribe_file(call_sid: str, path: str, language: str) -> Tuple[str, Optional[str], Optional[float], Optional[str]]:
+    """
+    Transcribe one recording inside a worker process
+
+    Returns:
+        (call_sid, transcript, duration, error)
+    """
+    from audio_probe import probe
+    try:
+        if path.endswith(".ulaw"):
+            with open(path, "rb") as f:
+                text = _worker_engine.transcribe_mulaw(f.read(), language)
+        else:
+            text = _worker_engine.transcribe(path, language)
+        info = probe(path, allow_decode=False)
+        return call_sid, text, info.duration if info else None, None
+    except Exception as e:
+        return call_sid, None, None, str(e)
+
+
+def _transcribe_recording(call_sid: str, directory: str, language: str) -> Tuple[str, Optional[str], Optional[float], Optional[str]]:
+    """
+    Transcribe a call recorded by call_recorder inside a worker process
+
+    The audio is decoded straight from the mapped segment files.
+
+    Returns:
+        (call_sid, transcript, duration, error)
+    """
+    global _worker_recordings
+    import audio_codec
+    from call_recorder import ENCODINGS, RecordingIndex
+    try:
+        if _worker_recordings is None or _worker_recordings.root != directory:
+            _worker_recordings = RecordingIndex(directory)
+        info = _worker_recordings.info(call_sid)
+        audio = _worker_recordings.read(call_sid)
+        try:
+            if info["encoding"] == "mulaw":
+                text = _worker_engine.transcribe_mulaw(audio, language)
+            else:
+                import numpy as np
+                samples = audio_codec.pcm16_to_float32(np.frombuffer(audio, dtype=np.int16))
+                samples = audio_codec.resample(samples, info["rate"], audio_codec.WHISPER_SAMPLE_RATE)
+                text = _worker_engine.transcribe(samples, language)
+        finally:
+            del audio
+            _worker_recordings.release(call_sid)
+        return call_sid, text, info["bytes"] / (info["rate"] * ENCODINGS[info["encoding"]][1]), None
+    except Exception as e:
+        return call_sid, None, None, str(e)
+
+
+class Checkpoint:
+    """Append-only log of CallSids whose transcripts are committed"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Set[str] = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self.done.add(line)
+            logger.info(f"Resuming: {len(self.done)} recordings already transcribed")
+
+    def mark(self, call_sids: Iterable[str]):
+        """Record committed CallSids durably"""
+        call_sids = list(call_sids)
+        with open(self.path, "a") as f:
+            f.write("".join(f"{sid}\n" for sid in call_sids))
+            f.flush()
+            os.fsync(f.fileno())
+        self.done.update(call_sids)
+
+
+async def iter_directory(directory: str) -> AsyncIterator[Tuple[str, str]]:
+    """Yield (call_sid, path) for recordings in a directory"""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            name, ext = os.path.splitext(entry.name)
+            if entry.is_file() and ext.lower() in AUDIO_EXTENSIONS:
+                yield name, entry.path
+            await asyncio.sleep(0)
+
+
+async def iter_recordings(directory: str) -> AsyncIterator[Tuple[str, str]]:
+    """Yield (call_sid, directory) for each call in a call_recorder directory"""
+    from call_recorder import RecordingIndex
+    for call_sid in RecordingIndex(directory).calls():
+        yield call_sid, directory
+        await asyncio.sleep(0)
+
+
+def twilio_auth(url: str, auth: Optional[Tuple[str, str]]) -> Optional[Tuple[str, str]]:
+    """The account credentials if `url` is on Twilio's API, else None so they never leave for other hosts"""
+    import httpx
+    parsed = httpx.URL(url)
+    host = parsed.host
+    if parsed.scheme == "https" and (host == TWILIO_API_HOST or
+                                     (host.startswith("api.") and host.endswith(".twilio.com"))):
+        return auth
+    return None
+
+
+async def iter_manifest(manifest: str, spool_dir: str, skip: Set[str],
+                        concurrency: int = 16, auth: Optional[Tuple[str, str]] = None) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Download recordings listed in a manifest and yield (call_sid, path)
+
+    Downloads share one pooled HTTP client and at most `concurrency` run
+    at once; results are yielded as soon as each file lands. Malformed
+    lines, repeated call_sids and entries whose call_sid is not a Twilio
+    call SID (it names the spool file) are skipped. `auth` is sent to Twilio's API host only.
+
+    Raises:
+        OSError: The manifest cannot be read
+    """
+    import httpx
+    from call_recorder import CALL_SID
+
+    os.makedirs(spool_dir, exist_ok=True)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def download(client, call_sid: str, url: str):
+        async with semaphore:
+            ext = os.path.splitext(url.split("?")[0])[1].lower()
+            if ext not in AUDIO_EXTENSIONS:
+                ext = ".wav"
+            path = os.path.join(spool_dir, f"{call_sid}{ext}")
+            try:
+                if not os.path.exists(path):
+                    partial = f"{path}.part"
+                    async with client.stream("GET", url, auth=twilio_auth(url, auth)) as response:
+                        response.raise_for_status()
+                        with open(partial, "wb") as f:
+                            async for chunk in response.aiter_bytes(65536):
+                                f.write(chunk)
+                    os.replace(partial, path)
+                await queue.put((call_sid, path))
+            except Exception as e:
+                logger.warning(f"Download failed for {call_sid}: {str(e)}")
+
+    async def download_all():
+        async with httpx.AsyncClient(limits=limits, timeout=60.0, follow_redirects=True) as client:
+            tasks = set()
+            queued: Set[str] = set()
+            try:
+                with open(manifest) as f:
+                    for number, line in enumerate(f, 1):
+                        if not line.strip():
+                            continue
+                        try:
+                            item = json.loads(line)
+                            call_sid, url = str(item["call_sid"]), str(item["url"])
+                        except (ValueError, TypeError, KeyError) as e:
+                            logger.warning(f"Skipping malformed manifest line {number}: {e!r}")
+                            continue
+                        if not CALL_SID.match(call_sid):
+                            logger.warning(f"Skipping manifest entry with invalid call_sid: {line.strip()[:80]}")
+                            continue
+                        # A repeated entry would race the first download for the same spool file
+                        if call_sid in skip or call_sid in queued:
+                            continue
+                        queued.add(call_sid)
+                        # Bound the number of pending downloads
+                        while len(tasks) >= concurrency * 2:
+                            _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                        tasks.add(asyncio.ensure_future(download(client, call_sid, url)))
+            except asyncio.CancelledError:
+                for task in tasks:
+                    task.cancel()
+                raise
+            finally:
+                # Downloads must not outlive the client they stream from
+                if tasks:
+                    await asyncio.wait(tasks)
+
+    async def produce():
+        # The end marker is the producer's error, if any, so the consumer never waits forever
+        try:
+            await download_all()
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
+
+def write_transcripts(rows: List[Dict]):
+    """
+    Bulk-write transcripts to CallLog in one transaction
+
+    Existing calls get their transcript (and duration, if unknown) filled
+    in; recordings with no CallLog row get a new completed row.
+    """
+    from database import write_session, CallLog, SQLALCHEMY_AVAILABLE
+    from transcript_search import get_backend
+    import rollups
+    if not SQLALCHEMY_AVAILABLE or not rows:
+        return
+
+    with write_session() as db:
+        search_backend = get_backend()
+        if search_backend:
+            for row in rows:
+                search_backend.index_transcript(db, row["call_sid"], row["transcript"])
+        by_sid = {row["call_sid"]: row for row in rows}
+        existing = db.query(CallLog).filter(CallLog.call_sid.in_(list(by_sid))).all()
+        for call_log in existing:
+            row = by_sid.pop(call_log.call_sid)
+            call_log.transcript = row["transcript"]
+            if not call_log.duration and row["duration"]:
+                old_status, old_duration = call_log.status, call_log.duration
+                call_log.duration = row["duration"]
+                rollups.record_call(db, call_log, old_status, old_duration)
+        for row in by_sid.values():
+            call_log = CallLog(
+                call_sid=row["call_sid"],
+                direction="inbound",
+                status="completed",
+                transcript=row["transcript"],
+                duration=row["duration"]
+            )
+            db.add(call_log)
+            rollups.record_call(db, call_log, is_new=True)
+        db.commit()
+
+
+async def run_pipeline(source: AsyncIterator[Tuple[str, str]], checkpoint: Checkpoint,
+                       workers: int, language: Optional[str] = "en", batch_size: int = 50,
+                       model_size: Optional[str] = None, device: Optional[str] = None,
+                       cpu_threads: int = 1, task: Callable = _transcribe_file) -> Dict[str, int]:
+    """
+    Fan recordings out to a pool of STT worker processes
+
+    Args:
+        source: Async iterator of (call_sid, path)
+        checkpoint: Checkpoint of already committed CallSids
+        workers: Number of worker processes
+        language: Transcription language (None detects it per recording)
+        batch_size: Transcripts per database transaction
+        model_size: Whisper model size (default: settings.stt_model)
+        device: Device (default: settings.stt_device)
+        cpu_threads: Decoder threads per worker; 1 scales best across cores
+        task: Worker function called as task(call_sid, path, language)
+
+    Returns:
+        Counts of transcribed, failed and skipped recordings
+    """
+    loop = asyncio.get_running_loop()
+    stats = {"transcribed": 0, "failed": 0, "skipped": 0}
+    pending_rows: List[Dict] = []
+    in_flight = set()
+
+    def flush():
+        write_transcripts(pending_rows)
+        checkpoint.mark(row["call_sid"] for row in pending_rows)
+        pending_rows.clear()
+
+    def collect(done):
+        for future in done:
+            call_sid, text, duration, error = future.result()
+            if error:
+                stats["failed"] += 1
+                logger.warning(f"Transcription failed for {call_sid}: {error}")
+                continue
+            stats["transcribed"] += 1
+            pending_rows.append({"call_sid": call_sid, "transcript": text, "duration": duration})
+        if len(pending_rows) >= batch_size:
+            flush()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_size, device, cpu_threads)) as pool:
+        async for call_sid, path in source:
+            if call_sid in checkpoint.done:
+                stats["skipped"] += 1
+                continue
+            # Keep every worker busy without reading the whole source up front
+            if len(in_flight) >= workers * 2:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(loop.run_in_executor(pool, task, call_sid, path, language))
+
+        if in_flight:
+            done, _ = await asyncio.wait(in_flight)
+            collect(done)
+    if pending_rows:
+        flush()
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Transcribe recorded calls into the call log")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directory of recordings named by CallSid")
+    source.add_argument("--manifest", help="NDJSON manifest of {call_sid, url} to download")
+    source.add_argument("--recordings", help="Recording directory written by call_recorder")
+    parser.add_argument("--spool", default="tmp/recordings", help="Download directory for --manifest")
+    parser.add_argument("--checkpoint", default="batch_transcribe.checkpoint", help="Progress file for resuming")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="STT worker processes")
+    parser.add_argument("--threads-per-worker", type=int, default=1, help="Decoder threads per worker")
+    parser.add_argument("--downloads", type=int, default=16, help="Concurrent downloads")
+    parser.add_argument("--batch-size", type=int, default=50, help="Transcripts per DB transaction")
+    parser.add_argument("--language", default="en", help='Language code, or "auto" to detect per recording')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    from database import init_db
+    from transcript_search import init_search
+    init_db()
+    init_search()
+    checkpoint = Checkpoint(args.checkpoint)
+
+    task = _transcribe_file
+    if args.dir:
+        recordings = iter_directory(args.dir)
+    elif args.recordings:
+        recordings = iter_recordings(args.recordings)
+        task = _transcribe_recording
+    else:
+        from config import settings
+        auth = (settings.twilio_account_sid, settings.twilio_auth_token)
+        recordings = iter_manifest(args.manifest, args.spool, checkpoint.done, args.downloads, auth)
+
+    stats = asyncio.run(run_pipeline(
+        recordings,
+        checkpoint,
+        workers=args.workers,
+        language=None if args.language == "auto" else args.language,
+        batch_size=args.batch_size,
+        cpu_threads=args.threads_per_worker,
+        task=task
+    ))
+    logger.info(f"Batch transcription finished: {stats}")
+    return 0 if stats["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
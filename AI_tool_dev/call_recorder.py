@@ -0,0 +1,530 @@
+"""
+Recording of live call audio into memory-mapped segment files
+
+Caller audio from Twilio Media Streams (8 kHz μ-law, or PCM from other
+sources) is kept for QA and re-transcription. Appending a frame is two
+memory copies and no system calls. The frame goes into the call's current
+segment, a preallocated file mapped into memory, and into a fixed-size
+in-memory ring that holds the call's last few seconds.
+
+Segment files are allocated ahead of time by a background thread, which
+also seals them when they fill up or the call ends. Sealing flushes the
+segment, trims it to the bytes written, moves it under the call's name
+and appends it to an index. The index is an append-only JSONL file that
+maps each CallSid to its segments and their byte offsets in the call's
+audio. Readers map sealed segments read-only and get memoryviews of
+them, so batch re-transcription never copies a recording.
+
+Layout under RECORDING_DIR:
+    spare/        preallocated segments waiting for a call
+    <xx>/<CallSid>.<n>.ulaw|.pcm   sealed segments (xx: last two CallSid characters)
+    index.jsonl   one {"call_sid", "segment", "offset", "length", "encoding", "rate"} per sealed segment
+
+Usage:
+    python call_recorder.py --list
+    python call_recorder.py --export CA123... --output call.wav
+    python call_recorder.py --benchmark
+"""
+import argparse
+import collections
+import itertools
+import json
+import logging
+import mmap
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from typing import Deque, Dict, List, Optional
+
+import numpy as np
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+RECORDED_BYTES = registry.counter(
+    "voice_ai_recorded_bytes_total",
+    "Call audio bytes sealed into recording segments"
+)
+SEGMENTS = registry.counter(
+    "voice_ai_recording_segments_total",
+    "Recording segment events: preallocated, allocated_inline (no spare was ready), sealed, discarded",
+    ("event",)
+)
+ACTIVE_RECORDINGS = registry.gauge(
+    "voice_ai_recordings_active",
+    "Calls currently being recorded"
+)
+
+# Twilio call SIDs; recordings are stored under them, so nothing else is accepted
+CALL_SID = re.compile(r"^CA[0-9a-f]{32}$")
+
+# Encoding -> (file extension, bytes per sample)
+ENCODINGS = {"mulaw": (".ulaw", 1), "pcm16": (".pcm", 2)}
+INDEX_FILE = "index.jsonl"
+
+
+def _preallocate(fd: int, size: int):
+    """Reserve a file's blocks up front so page faults never have to allocate"""
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass  # e.g. tmpfs or filesystems without fallocate
+    os.ftruncate(fd, size)
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Segment:
+    """A preallocated segment file, mapped for writing"""
+
+    __slots__ = ("path", "size", "map", "used")
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o640)
+        try:
+            _preallocate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.used = 0
+
+    def write(self, data: memoryview) -> int:
+        """Copy as much of data as fits; returns the number of bytes written"""
+        count = min(len(data), self.size - self.used)
+        self.map[self.used:self.used + count] = data[:count]
+        self.used += count
+        return count
+
+    @property
+    def full(self) -> bool:
+        return self.used >= self.size
+
+
+class CallRecording:
+    """
+    The recording of one call in progress
+
+    append() is called from the call's audio handler only; it is not
+    thread-safe and does not need to be.
+    """
+
+    def __init__(self, recorder: "CallRecorder", call_sid: str, encoding: str, sample_rate: int):
+        self.recorder = recorder
+        self.call_sid = call_sid
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.bytes_per_second = sample_rate * ENCODINGS[encoding][1]
+        self.total = 0  # bytes recorded so far
+        self.ring = np.zeros(max(int(recorder.ring_seconds * self.bytes_per_second), 1), dtype=np.uint8)
+        self._segment = recorder._take_segment()
+        self._segment_offset = 0  # call audio offset where the current segment starts
+        self._segment_number = 0
+
+    def append(self, frame: bytes):
+        """Record one frame of audio; frames after the recording was closed are dropped"""
+        if self._segment is None:
+            return
+        view = memoryview(frame)
+        self._ring_write(np.frombuffer(frame, dtype=np.uint8))
+        while view:
+            written = self._segment.write(view)
+            self.total += written
+            view = view[written:]
+            if self._segment.full:
+                self._roll()
+
+    def _ring_write(self, data: np.ndarray):
+        size = len(self.ring)
+        start = self.total % size
+        if len(data) >= size:
+            start = (start + len(data) - size) % size
+            data = data[-size:]
+        first = min(len(data), size - start)
+        self.ring[start:start + first] = data[:first]
+        self.ring[:len(data) - first] = data[first:]
+
+    def recent(self, seconds: Optional[float] = None) -> bytes:
+        """The last `seconds` of audio (default: the whole ring), oldest first"""
+        size = len(self.ring)
+        available = min(self.total, size)
+        if seconds is not None:
+            available = min(available, int(seconds * self.bytes_per_second))
+        end = self.total % size
+        if available <= end:
+            return self.ring[end - available:end].tobytes()
+        return self.ring[size - (available - end):].tobytes() + self.ring[:end].tobytes()
+
+    def _roll(self):
+        """Hand the full segment to the sealer and continue in a fresh one"""
+        self.recorder._seal(self, self._segment, self._segment_offset, self._segment_number)
+        self._segment = self.recorder._take_segment()
+        self._segment_offset = self.total
+        self._segment_number += 1
+
+    def _finish(self):
+        if self._segment.used:
+            self.recorder._seal(self, self._segment, self._segment_offset, self._segment_number)
+        else:
+            self.recorder._jobs.put(("discard", self._segment))
+        self._segment = None
+
+
+class RecordingIndex:
+    """
+    CallSid -> sealed segments, persisted as an append-only JSONL file
+
+    Safe to share between threads. Other processes (batch transcription)
+    open their own index over the same directory.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.path = os.path.join(root, INDEX_FILE)
+        self._entries: Dict[str, List[Dict]] = collections.defaultdict(list)
+        self._maps: Dict[str, mmap.mmap] = {}
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Pick up segments sealed by another process"""
+        entries = collections.defaultdict(list)
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    # A crash can leave a torn last line; every complete line stands alone
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entries[entry["call_sid"]].append(entry)
+        for segments in entries.values():
+            segments.sort(key=lambda entry: entry["offset"])
+        with self._lock:
+            self._entries = entries
+
+    def add(self, entry: Dict):
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._entries[entry["call_sid"]].append(entry)
+
+    def calls(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def segments(self, call_sid: str) -> List[Dict]:
+        with self._lock:
+            return list(self._entries.get(call_sid, ()))
+
+    def info(self, call_sid: str) -> Optional[Dict]:
+        """Encoding, sample rate and total length of a call's sealed audio"""
+        segments = self.segments(call_sid)
+        if not segments:
+            return None
+        last = segments[-1]
+        return {
+            "call_sid": call_sid,
+            "encoding": last["encoding"],
+            "rate": last["rate"],
+            "bytes": last["offset"] + last["length"],
+            "segments": len(segments),
+        }
+
+    def _map(self, segment: str) -> mmap.mmap:
+        with self._lock:
+            mapped = self._maps.get(segment)
+            if mapped is None:
+                with open(os.path.join(self.root, segment), "rb") as f:
+                    mapped = self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return mapped
+
+    def read(self, call_sid: str, start: int = 0, length: Optional[int] = None) -> memoryview:
+        """
+        A byte range of a call's sealed audio
+
+        Ranges within one segment (a whole call, unless it outlasted
+        RECORDING_SEGMENT_SECONDS) are memoryviews of the mapped file and
+        copy nothing; ranges spanning segments are joined into one buffer.
+        """
+        pieces = []
+        end = None if length is None else start + length
+        for entry in self.segments(call_sid):
+            segment_start, segment_end = entry["offset"], entry["offset"] + entry["length"]
+            if segment_end <= start or (end is not None and segment_start >= end):
+                continue
+            low = max(start - segment_start, 0)
+            high = entry["length"] if end is None else min(end - segment_start, entry["length"])
+            pieces.append(memoryview(self._map(entry["segment"]))[low:high])
+        if len(pieces) == 1:
+            return pieces[0]
+        return memoryview(b"".join(pieces))
+
+    def wav(self, call_sid: str) -> Optional[bytes]:
+        """A call's sealed audio as a WAV file, or None if nothing was recorded"""
+        import audio_codec
+        info = self.info(call_sid)
+        if info is None:
+            return None
+        audio = self.read(call_sid)
+        if info["encoding"] == "mulaw":
+            data = audio_codec.encode_mulaw_wav(audio, info["rate"])
+        else:
+            data = audio_codec.encode_wav(
+                audio_codec.pcm16_to_float32(np.frombuffer(audio, dtype=np.int16)), info["rate"])
+        del audio
+        self.release(call_sid)
+        return data
+
+    def release(self, call_sid: str):
+        """Unmap a call's segments; memoryviews returned by read() must be released first"""
+        with self._lock:
+            maps = [self._maps.pop(entry["segment"]) for entry in self._entries.get(call_sid, ())
+                    if entry["segment"] in self._maps]
+        for mapped in maps:
+            mapped.close()
+
+    def close(self):
+        """Unmap all segments; memoryviews returned by read() must be released first"""
+        with self._lock:
+            maps, self._maps = self._maps, {}
+        for mapped in maps.values():
+            mapped.close()
+
+
+class CallRecorder:
+    """Per-call recordings with background segment allocation and sealing"""
+
+    def __init__(self, root: str, segment_seconds: float = 600.0, ring_seconds: float = 30.0, spares: int = 8,
+                 expect_seconds: float = 60.0):
+        """
+        Args:
+            root: Recording directory
+            segment_seconds: Length of one segment file, in seconds of 8 kHz μ-law
+            ring_seconds: Audio kept in memory per call for recent()
+            spares: Segments kept preallocated for new calls and roll-overs; size it to
+                the number of calls expected to start at about the same time
+            expect_seconds: How long a stream announced with expect() may take to start
+        """
+        self.root = root
+        self.segment_bytes = int(segment_seconds * 8000)
+        self.ring_seconds = ring_seconds
+        self.spares = spares
+        self.index = RecordingIndex(root)
+        self.expect_seconds = expect_seconds
+        self._calls: Dict[str, CallRecording] = {}
+        self._calls_lock = threading.Lock()
+        # CallSid -> monotonic deadline of streams the server asked Twilio to start
+        self._expected: "collections.OrderedDict[str, float]" = collections.OrderedDict()
+        self._spare: Deque[Segment] = collections.deque()
+        self._spare_lock = threading.Lock()
+        self._names = itertools.count()
+        self._jobs: "queue.Queue" = queue.Queue()
+        os.makedirs(os.path.join(root, "spare"), exist_ok=True)
+        # Spares of processes that have exited were never assigned to a call
+        for name in os.listdir(os.path.join(root, "spare")):
+            pid = name.split("-")[0]
+            if pid.isdigit() and not _process_alive(int(pid)):
+                os.unlink(os.path.join(root, "spare", name))
+        self._refill()
+        self._thread = threading.Thread(target=self._run, name="call-recorder", daemon=True)
+        self._thread.start()
+
+    # Calls
+
+    def expect(self, call_sid: str):
+        """Note that a media stream was requested for a call, so claim() will accept it once"""
+        now = time.monotonic()
+        with self._calls_lock:
+            self._expected[call_sid] = now + self.expect_seconds
+            self._expected.move_to_end(call_sid)
+            while self._expected and next(iter(self._expected.values())) < now:
+                self._expected.popitem(last=False)
+
+    def claim(self, call_sid: str) -> bool:
+        """True, once, for a call whose stream was announced with expect() and has not expired"""
+        with self._calls_lock:
+            deadline = self._expected.pop(call_sid, None)
+        return deadline is not None and deadline >= time.monotonic()
+
+    def open(self, call_sid: str, encoding: str = "mulaw", sample_rate: int = 8000) -> CallRecording:
+        """
+        Start (or continue) recording a call
+
+        May allocate a segment file if no spare is ready, so call it off the event loop.
+
+        Raises:
+            ValueError: call_sid is not a Twilio call SID
+        """
+        if not CALL_SID.match(call_sid):
+            raise ValueError(f"Invalid CallSid: {call_sid!r}")
+        with self._calls_lock:
+            recording = self._calls.get(call_sid)
+            if recording is None:
+                recording = self._calls[call_sid] = CallRecording(self, call_sid, encoding, sample_rate)
+                ACTIVE_RECORDINGS.set(len(self._calls))
+        return recording
+
+    def get(self, call_sid: str) -> Optional[CallRecording]:
+        return self._calls.get(call_sid)
+
+    def close(self, call_sid: str):
+        """Finish a call's recording; its last segment is sealed in the background"""
+        with self._calls_lock:
+            recording = self._calls.pop(call_sid, None)
+            ACTIVE_RECORDINGS.set(len(self._calls))
+        if recording is not None:
+            recording._finish()
+
+    def shutdown(self):
+        """Seal every open recording and stop the background thread"""
+        for call_sid in list(self._calls):
+            self.close(call_sid)
+        self._jobs.put(None)
+        self._thread.join()
+        with self._spare_lock:
+            spare, self._spare = self._spare, collections.deque()
+        for segment in spare:
+            self._discard(segment)
+
+    # Segments
+
+    def _new_segment(self) -> Segment:
+        path = os.path.join(self.root, "spare", f"{os.getpid()}-{next(self._names)}.seg")
+        return Segment(path, self.segment_bytes)
+
+    def _take_segment(self) -> Segment:
+        with self._spare_lock:
+            segment = self._spare.popleft() if self._spare else None
+        self._jobs.put(("refill", None))
+        if segment is None:
+            SEGMENTS.inc("allocated_inline")
+            segment = self._new_segment()
+        return segment
+
+    def _refill(self):
+        while True:
+            with self._spare_lock:
+                if len(self._spare) >= self.spares:
+                    return
+            segment = self._new_segment()
+            SEGMENTS.inc("preallocated")
+            with self._spare_lock:
+                self._spare.append(segment)
+
+    def _seal(self, recording: CallRecording, segment: Segment, offset: int, number: int):
+        self._jobs.put(("seal", (recording.call_sid, recording.encoding, recording.sample_rate,
+                                 segment, offset, number)))
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            kind, payload = job
+            try:
+                if kind == "refill":
+                    self._refill()
+                elif kind == "seal":
+                    self._seal_segment(*payload)
+                elif kind == "discard":
+                    self._discard(payload)
+            except Exception as e:
+                logger.error(f"Recording {kind} failed: {str(e)}")
+
+    def _seal_segment(self, call_sid: str, encoding: str, sample_rate: int, segment: Segment,
+                      offset: int, number: int):
+        segment.map.flush()
+        segment.map.close()
+        os.truncate(segment.path, segment.used)
+        relative = os.path.join(call_sid[-2:], f"{call_sid}.{number}{ENCODINGS[encoding][0]}")
+        os.makedirs(os.path.join(self.root, call_sid[-2:]), exist_ok=True)
+        os.replace(segment.path, os.path.join(self.root, relative))
+        self.index.add({
+            "call_sid": call_sid,
+            "segment": relative,
+            "offset": offset,
+            "length": segment.used,
+            "encoding": encoding,
+            "rate": sample_rate,
+            "sealed_at": time.time(),
+        })
+        SEGMENTS.inc("sealed")
+        RECORDED_BYTES.inc(amount=segment.used)
+
+    def _discard(self, segment: Segment):
+        segment.map.close()
+        os.unlink(segment.path)
+        SEGMENTS.inc("discarded")
+
+
+def benchmark(frames: int = 50000, frame_bytes: int = 160) -> Dict[str, float]:
+    """Time CallRecording.append for 20 ms μ-law frames"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as root:
+        recorder = CallRecorder(root, segment_seconds=frames * frame_bytes / 8000 / 4)
+        recording = recorder.open("CA" + "0" * 32)
+        frame = bytes(range(frame_bytes))
+        started = time.perf_counter()
+        for _ in range(frames):
+            recording.append(frame)
+        elapsed = time.perf_counter() - started
+        recorder.shutdown()
+        recorder.index.close()
+    return {"frames": frames, "us_per_frame": elapsed / frames * 1e6}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    from config import settings
+    parser = argparse.ArgumentParser(description="Inspect and export recorded call audio")
+    parser.add_argument("--dir", default=settings.recording_dir, help="Recording directory (default: RECORDING_DIR)")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--list", action="store_true", help="List recorded calls")
+    action.add_argument("--export", metavar="CALL_SID", help="Write a call's audio as WAV")
+    action.add_argument("--benchmark", action="store_true", help="Time the append path")
+    parser.add_argument("--output", help="WAV path for --export (default: <CallSid>.wav)")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        result = benchmark()
+        print(f"{result['frames']} frames: {result['us_per_frame']:.2f} µs per 20 ms frame")
+        return 0
+
+    index = RecordingIndex(args.dir)
+    if args.list:
+        for call_sid in index.calls():
+            info = index.info(call_sid)
+            seconds = info["bytes"] / (info["rate"] * ENCODINGS[info["encoding"]][1])
+            print(f"{call_sid}  {seconds:8.1f} s  {info['encoding']}  {info['segments']} segment(s)")
+        return 0
+
+    data = index.wav(args.export)
+    index.close()
+    if data is None:
+        print(f"No recording for {args.export}")
+        return 1
+    with open(args.output or f"{args.export}.wav", "wb") as f:
+        f.write(data)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
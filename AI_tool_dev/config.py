@@ -18,16 +18,103 @@ class Settings(BaseSettings):
     host: str = "0.0.0.0"
     port: int = 8000
     
+    # Locally synthesized prompts, played to callers from /media
+    media_playback: bool = False  # requires Coqui TTS; otherwise Twilio <Say> is used
+    media_dir: str = "./media"
+    media_cache_max_age: int = 31536000  # seconds; files are immutable
+    public_base_url: Optional[str] = None  # e.g. https://example.ngrok.io; relative URLs when unset
+    
+    # Recording of caller audio (Twilio Media Streams; needs PUBLIC_BASE_URL for the wss:// URL)
+    call_recording: bool = False
+    recording_dir: str = "./recordings"
+    recording_segment_seconds: float = 600.0  # length of one preallocated segment file
+    recording_ring_seconds: float = 30.0  # recent audio kept in memory per call
+    recording_spare_segments: int = 8  # segments preallocated ahead of need; about the calls starting at once
+    
+    # Replies for turns outside the scripted flows
+    response_generator: str = "rules"  # "rules" (scripted only) or "onnx"
+    generator_model_dir: str = "./models/generator"  # model.onnx + tokenizer.json
+    generator_threads: int = 4  # ONNX Runtime intra-op threads
+    generator_max_batch: int = 8
+    generator_batch_wait_ms: float = 5.0  # how long to collect concurrent turns into a batch
+    generator_max_new_tokens: int = 40
+    generator_max_context_tokens: int = 384
+    generator_budget_ms: float = 1500.0  # per-turn limit before falling back to the scripted reply
+    generator_max_queue: int = 64
+    generator_max_calls: int = 10000  # dialogue contexts kept in memory
+    
+    # Timezone appointment dates and times are resolved in (IANA name)
+    business_timezone: str = "America/New_York"
+    
+    # Caller language, identified once on the first utterance of each call
+    supported_languages: str = "en,es"  # comma-separated codes; a single code disables detection
+    
+    # Multi-tenant: seconds between checks for tenant configuration changes (0 disables)
+    tenant_reload_interval: float = 30.0
+    
+    # Admission control: concurrent operations per subsystem, and how many more may wait
+    admission_max_webhooks: int = 64
+    admission_webhook_queue: int = 128
+    admission_max_db_writes: int = 8
+    admission_db_queue: int = 64
+    admission_max_generations: int = 16
+    admission_queue_timeout: float = 2.0  # seconds a request may wait before it is shed
+    admission_hold_seconds: int = 2  # pause before a held caller is retried
+    # New calls allowed per caller ID (token bucket); 0 disables the limit
+    caller_rate_per_minute: float = 6.0
+    caller_burst: int = 3
+    
+    # Webhook idempotency: responses replayed to Twilio retries
+    webhook_cache_size: int = 10000
+    webhook_cache_ttl: float = 300.0  # seconds
+    
+    # Prepare replies from Gather partial results while the caller speaks
+    speculative_responses: bool = True
+    speculation_max_candidates: int = 3  # partial transcripts kept per call
+    
+    # Region assumed for phone numbers without a country code
+    default_region: str = "US"
+    
     # Database
     database_url: str = "sqlite:///./voice_ai.db"
+    db_profile: str = "auto"  # auto, sqlite, server or basic
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800  # seconds
+    db_statement_cache_size: int = 1000
+    sqlite_synchronous: str = "NORMAL"  # safe with WAL; FULL for extra durability
+    sqlite_cache_size_kb: int = 65536
+    sqlite_mmap_size: int = 268435456
+    sqlite_busy_timeout_ms: int = 10000
+    
+    # Call log retention
+    retention_days: int = 90  # calls older than this are archived
+    archive_dir: str = "./archive"
+    retention_batch_size: int = 1000
     
     # TTS Configuration
     tts_model: str = "tts_models/en/ljspeech/tacotron2-DDC"
     tts_voice: str = "default"
+    tts_language: str = "en"  # language of tts_model; other languages use Twilio <Say>
+    tts_fragments: bool = True  # assemble templated prompts from cached fragments
+    tts_fragment_cache_size: int = 2000  # fragments kept in memory
+    tts_crossfade_ms: float = 10.0  # overlap at each fragment join
+    tts_sidecar_socket: str = ""  # Unix socket of tts_sidecar.py; empty runs TTS in the API process
+    tts_sidecar_timeout: float = 30.0  # seconds per request, including queueing
+    tts_sidecar_workers: int = 2  # model processes
+    tts_sidecar_threads: int = 0  # intra-op threads per worker; 0 divides the CPU cores
     
     # STT Configuration
     stt_model: str = "base"
     stt_device: str = "cpu"  # or "cuda" for GPU
+    stt_beam_size: int = 5  # open-ended turns
+    stt_constrained_beam_size: int = 1  # turns expecting a date or time (greedy)
+    
+    # Admin / Profiling
+    admin_token: Optional[str] = None  # admin endpoints are disabled when unset
+    profiler_interval_ms: float = 5.0
+    profiler_max_seconds: int = 60
     
     class Config:
         env_file = ".env"
@@ -2,12 +2,37 @@
 Conversation flow logic for multi-turn dialogues
 """
 import logging
-from typing import Dict, List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
 from enum import Enum
 
+from entities import extract, format_date, format_time
+
 logger = logging.getLogger(__name__)
 
 
+class TemplatedText(str):
+    """
+    A reply rendered from a template, remembering the template and its slot values
+
+    Behaves as the plain text everywhere; local TTS uses the extra fields to
+    assemble the audio from cached fragments instead of synthesizing it whole.
+    """
+    
+    def __new__(cls, template: str, **slots):
+        text = super().__new__(cls, template.format(**slots))
+        text.template = template
+        text.slots = slots
+        return text
+    
+    def __reduce__(self):
+        return (_templated_text, (self.template, self.slots))
+
+
+def _templated_text(template: str, slots: Dict) -> "TemplatedText":
+    return TemplatedText(template, **slots)
+
+
 class ConversationState(Enum):
     """States in the conversation flow"""
     GREETING = "greeting"
@@ -19,23 +44,184 @@ class ConversationState(Enum):
     CLOSING = "closing"
 
 
+# Per-language keywords and replies; English is the original script
+LANGUAGE_PACKS: Dict[str, Dict] = {
+    "en": {
+        "appointment_keywords": ["appointment", "book", "schedule", "meeting", "reservation"],
+        "info_keywords": ["hours", "open", "closed", "location", "address", "contact"],
+        "hours_keywords": ["hours", "open", "closed"],
+        "location_keywords": ["location", "address"],
+        "contact_keywords": ["contact", "phone"],
+        "date_keywords": ["tomorrow", "today", "monday", "tuesday", "wednesday",
+                          "thursday", "friday", "saturday", "sunday"],
+        "thanks_keywords": ["thank", "thanks"],
+        "goodbye_keywords": ["goodbye", "bye"],
+        "greeting": "How can I help you today?",
+        "appointment_intro": "I'd be happy to help you book an appointment. What date and time would work for you?",
+        "initial_fallback": "I can help you with booking appointments or answering questions. What would you like to do?",
+        "ask_name": "Great! I have the date and time. May I have your name, please?",
+        "confirm": "Perfect! I've booked an appointment for {name} on {date} at {time}. Is there anything else I can help you with?",
+        "ask_date": "What date would you like to schedule the appointment?",
+        "ask_time": "What time would work best for you?",
+        "still_gathering": "I'm still gathering information. Could you please provide the date and time for your appointment?",
+        "info_fallback": "Is there anything specific you'd like to know about our services?",
+        "welcome": "You're welcome! Have a great day!",
+        "goodbye": "Thank you for calling. Have a wonderful day!",
+        "general_fallback": "I'm here to help. Would you like to book an appointment or get information about our services?",
+        "closing": "Thank you for calling. Goodbye!",
+        "repeat": "I'm sorry, I didn't catch that. Could you please repeat?",
+        "language_offer": "For English, say English.",
+        "hold": "Thank you for calling. All of our lines are busy right now. Please hold.",
+        "busy": "I'm sorry, we're very busy right now. Could you please say that again?",
+        # Decoder prompts: an example of the answer the caller was just asked for
+        "stt_prompts": {
+            "date": "Next Tuesday at 3:30 pm.",
+            "time": "At 10 am, or 2:30 pm.",
+            "name": "My name is Sarah Johnson.",
+            "open": "I'd like to book an appointment. What are your office hours?",
+        },
+        "time_words": ["am", "pm", "o'clock", "noon", "morning", "afternoon", "evening"],
+    },
+    "es": {
+        "appointment_keywords": ["cita", "reservar", "reserva", "agendar", "programar", "turno"],
+        "info_keywords": ["horario", "abierto", "abren", "cerrado", "cierran", "dirección", "direccion",
+                          "ubicación", "ubicacion", "dónde", "donde", "contacto"],
+        "hours_keywords": ["horario", "abierto", "abren", "cerrado", "cierran"],
+        "location_keywords": ["dirección", "direccion", "ubicación", "ubicacion", "dónde", "donde"],
+        "contact_keywords": ["contacto", "teléfono", "telefono"],
+        "date_keywords": ["pasado mañana", "mañana", "hoy", "lunes", "martes", "miércoles", "miercoles",
+                          "jueves", "viernes", "sábado", "sabado", "domingo"],
+        "thanks_keywords": ["gracias"],
+        "goodbye_keywords": ["adiós", "adios", "hasta luego"],
+        "greeting": "Hola, gracias por llamar. ¿En qué puedo ayudarle?",
+        "appointment_intro": "Con gusto le ayudo a programar una cita. ¿Qué fecha y hora le convienen?",
+        "initial_fallback": "Puedo ayudarle a programar citas o responder preguntas. ¿Qué desea hacer?",
+        "ask_name": "¡Muy bien! Ya tengo la fecha y la hora. ¿Me puede dar su nombre, por favor?",
+        "confirm": "¡Perfecto! Hice una cita para {name} el {date} a las {time}. ¿Hay algo más en que pueda ayudarle?",
+        "ask_date": "¿Para qué fecha desea programar la cita?",
+        "ask_time": "¿A qué hora le conviene?",
+        "still_gathering": "Todavía necesito algunos datos. ¿Me puede indicar la fecha y la hora de su cita?",
+        "info_fallback": "¿Hay algo específico que quiera saber sobre nuestros servicios?",
+        "welcome": "¡De nada! Que tenga un buen día.",
+        "goodbye": "Gracias por llamar. ¡Que tenga un excelente día!",
+        "general_fallback": "Estoy aquí para ayudarle. ¿Desea programar una cita o recibir información sobre nuestros servicios?",
+        "closing": "Gracias por llamar. ¡Adiós!",
+        "repeat": "Disculpe, no le entendí. ¿Podría repetirlo?",
+        "language_offer": "Para español, diga español.",
+        "hold": "Gracias por llamar. Todas nuestras líneas están ocupadas en este momento. Por favor, espere.",
+        "busy": "Disculpe, estamos muy ocupados en este momento. ¿Podría repetirlo, por favor?",
+        "stt_prompts": {
+            "date": "El próximo martes a las 3:30 de la tarde.",
+            "time": "A las 10 de la mañana, o a las 2:30 de la tarde.",
+            "name": "Me llamo María González.",
+            "open": "Quisiera hacer una cita. ¿Cuál es su horario?",
+        },
+        "time_words": ["de la mañana", "de la tarde", "de la noche", "mediodía", "en punto"],
+        # Used when the tenant's own texts are in another language
+        "office_hours": "Nuestro horario es de lunes a viernes, de 9 de la mañana a 5 de la tarde. Cerramos los fines de semana.",
+        "location": "Estamos en 123 Main Street, City, State, 12345. ¿Desea indicaciones?",
+        "contact": "Puede comunicarse al 555-1234 en horario de oficina, o escribirnos a info@example.com.",
+    },
+}
+
+
+def decoding_hints(slot: Optional[str], language: str = "en"):
+    """
+    STT decoding hints for a turn
+    
+    Answers to a date or time question come from a small vocabulary, so
+    they are decoded greedily with that vocabulary as hotwords; names and
+    open questions get the full beam.
+    
+    Args:
+        slot: What the caller was asked for ("date", "time", "name"), or None
+        language: Language code of the call
+        
+    Returns:
+        DecodingHints for STTEngine.transcribe
+    """
+    from config import settings
+    from stt_module import DecodingHints
+    pack = LANGUAGE_PACKS.get(language, LANGUAGE_PACKS["en"])
+    prompt = pack["stt_prompts"][slot or "open"]
+    if slot == "date":
+        # The date question also asks for a time
+        return DecodingHints(settings.stt_constrained_beam_size, prompt,
+                             tuple(pack["date_keywords"] + pack["time_words"]))
+    if slot == "time":
+        return DecodingHints(settings.stt_constrained_beam_size, prompt, tuple(pack["time_words"]))
+    return DecodingHints(settings.stt_beam_size, prompt)
+
+
 class ConversationManager:
     """Manages conversation flow and context"""
     
-    def __init__(self):
+    def __init__(self, tenant=None, languages: Sequence[str] = (), call_time: Optional[datetime] = None):
+        """
+        Args:
+            tenant: TenantConfig of the business being called (default: DEFAULT_TENANT)
+            languages: Language codes to detect between on the first turn;
+                with fewer than two, the tenant's language is used throughout
+            call_time: When the call started, timezone-aware (default: now in BUSINESS_TIMEZONE);
+                relative dates like "tomorrow" resolve against it
+        """
+        from tenants import DEFAULT_TENANT
+        from language_id import language_code
+        self.tenant = tenant or DEFAULT_TENANT
+        if call_time is None:
+            from zoneinfo import ZoneInfo
+            from config import settings
+            call_time = datetime.now(ZoneInfo(settings.business_timezone))
+        self.call_time = call_time
+        self.default_language = language_code(self.tenant.language)
+        self.languages = [code for code in languages if code in LANGUAGE_PACKS]
+        # Decided once, on the first utterance, then reused for the whole call
+        self.language: Optional[str] = None if len(self.languages) > 1 else self.default_language
         self.context: Dict = {}
         self.state: ConversationState = ConversationState.GREETING
+        self.turn_count: int = 0
+        # True when the last turn fell through to a generic reply
+        self.unhandled: bool = False
         self.appointment_info: Dict = {
             "date": None,
             "time": None,
             "name": None,
             "phone": None,
-            "reason": None
+            "reason": None,
+            "datetime": None
         }
     
+    @property
+    def pack(self) -> Dict:
+        """Keywords and replies for the call's language"""
+        return LANGUAGE_PACKS.get(self.language or self.default_language, LANGUAGE_PACKS["en"])
+    
+    def prompt(self, key: str) -> str:
+        """A reply in the call's language"""
+        return self.pack[key]
+    
+    def expected_slot(self) -> Optional[str]:
+        """The appointment detail the last reply asked for, if any"""
+        if self.state != ConversationState.APPOINTMENT_BOOKING:
+            return None
+        for slot in ("date", "time", "name"):
+            if not self.appointment_info[slot]:
+                return slot
+        return None
+    
+    def decoding_hints(self):
+        """STT decoding hints for the caller's next utterance"""
+        return decoding_hints(self.expected_slot(), self.language or self.default_language)
+    
+    def tenant_text(self, field: str) -> str:
+        """A tenant-configured reply, or the translated default if the tenant's texts are in another language"""
+        if (self.language or self.default_language) != self.default_language and field in self.pack:
+            return self.pack[field]
+        return getattr(self.tenant, field)
+    
     def get_greeting(self) -> str:
         """Get initial greeting message"""
-        return "Hello! Thank you for calling. I'm your AI receptionist. How can I help you today?"
+        return self.tenant.greeting
     
     def process_user_input(self, text: str) -> str:
         """
@@ -47,8 +233,18 @@ class ConversationManager:
         Returns:
             AI response text
         """
+        self.turn_count += 1
+        self.unhandled = False
         text_lower = text.lower().strip()
         
+        if self.language is None:
+            from language_id import detect_language
+            self.language, selected_only = detect_language(text_lower, self.languages, self.default_language)
+            logger.info(f"Caller language: {self.language}")
+            if selected_only:
+                # The caller only picked a language; greet them in it
+                return self.prompt("greeting")
+        
         # Update state based on input
         if self.state == ConversationState.GREETING:
             return self._handle_initial_request(text_lower)
@@ -65,113 +261,106 @@ class ConversationManager:
     def _handle_initial_request(self, text: str) -> str:
         """Handle user's initial request"""
         # Check for appointment booking keywords
-        appointment_keywords = ["appointment", "book", "schedule", "meeting", "reservation"]
-        if any(keyword in text for keyword in appointment_keywords):
+        pack = self.pack
+        if self.tenant.booking_enabled and any(keyword in text for keyword in pack["appointment_keywords"]):
             self.state = ConversationState.APPOINTMENT_BOOKING
-            return "I'd be happy to help you book an appointment. What date and time would work for you?"
+            return pack["appointment_intro"]
         
         # Check for information requests
-        info_keywords = ["hours", "open", "closed", "location", "address", "contact"]
-        if any(keyword in text for keyword in info_keywords):
+        if any(keyword in text for keyword in pack["info_keywords"]):
             self.state = ConversationState.INFORMATION_GATHERING
             return self._handle_information_query(text)
         
         # Default response
-        return "I can help you with booking appointments or answering questions. What would you like to do?"
+        self.unhandled = True
+        return pack["initial_fallback"]
     
     def _handle_appointment_booking(self, text: str) -> str:
         """Handle appointment booking conversation"""
-        # Extract date information
-        date_keywords = ["tomorrow", "today", "monday", "tuesday", "wednesday", 
-                        "thursday", "friday", "saturday", "sunday"]
-        time_keywords = ["am", "pm", "morning", "afternoon", "evening"]
-        
-        # Check for date
-        if not self.appointment_info["date"]:
-            for keyword in date_keywords:
-                if keyword in text:
-                    self.appointment_info["date"] = keyword
-                    break
+        pack = self.pack
+        info = self.appointment_info
+        language = self.language or self.default_language
         
-        # Check for time
-        if not self.appointment_info["time"]:
-            # Look for time patterns like "4 pm", "2:30", etc.
-            import re
-            time_pattern = r'(\d{1,2})\s*(?::(\d{2}))?\s*(am|pm)?'
-            match = re.search(time_pattern, text)
-            if match:
-                hour = match.group(1)
-                minute = match.group(2) or "00"
-                period = match.group(3) or ""
-                self.appointment_info["time"] = f"{hour}:{minute} {period}".strip()
-        
-        # Check for name
-        if not self.appointment_info["name"]:
-            name_patterns = ["my name is", "i'm", "i am", "call me"]
-            for pattern in name_patterns:
-                if pattern in text:
-                    # Try to extract name (simple extraction)
-                    parts = text.split(pattern)
-                    if len(parts) > 1:
-                        potential_name = parts[1].split()[0] if parts[1].split() else None
-                        if potential_name:
-                            self.appointment_info["name"] = potential_name
+        # Dates and times resolve against the call's local time
+        found = extract(text, self.call_time, language)
+        if found.date and not info["date"]:
+            info["date"] = found.date
+        if found.time and not info["time"]:
+            info["time"] = found.time
+        if found.name and not info["name"]:
+            info["name"] = found.name
         
         # Check if we have enough information
         if self.appointment_info["date"] and self.appointment_info["time"]:
             if not self.appointment_info["name"]:
-                return "Great! I have the date and time. May I have your name, please?"
+                return pack["ask_name"]
             
             # Confirm appointment
             self.state = ConversationState.CLOSING
-            date = self.appointment_info["date"]
-            time = self.appointment_info["time"]
-            name = self.appointment_info["name"]
+            info["datetime"] = datetime.combine(info["date"], info["time"], tzinfo=self.call_time.tzinfo)
+            date = format_date(info["date"], language)
+            time = format_time(info["time"], language)
+            name = info["name"]
             
-            return f"Perfect! I've booked an appointment for {name} on {date} at {time}. Is there anything else I can help you with?"
+            return TemplatedText(pack["confirm"], name=name, date=date, time=time)
         
         # Ask for missing information
         if not self.appointment_info["date"]:
-            return "What date would you like to schedule the appointment?"
+            return pack["ask_date"]
         if not self.appointment_info["time"]:
-            return "What time would work best for you?"
+            return pack["ask_time"]
         
-        return "I'm still gathering information. Could you please provide the date and time for your appointment?"
+        return pack["still_gathering"]
     
     def _handle_information_query(self, text: str) -> str:
         """Handle information queries"""
-        if "hours" in text or "open" in text or "closed" in text:
-            return "Our office hours are Monday through Friday, 9 AM to 5 PM. We're closed on weekends."
+        pack = self.pack
+        if any(keyword in text for keyword in pack["hours_keywords"]):
+            return self.tenant_text("office_hours")
         
-        if "location" in text or "address" in text:
-            return "We're located at 123 Main Street, City, State, 12345. Would you like directions?"
+        if any(keyword in text for keyword in pack["location_keywords"]):
+            return self.tenant_text("location")
         
-        if "contact" in text or "phone" in text:
-            return "You can reach us at 555-1234 during business hours, or email us at info@example.com."
+        if any(keyword in text for keyword in pack["contact_keywords"]):
+            return self.tenant_text("contact")
         
-        return "Is there anything specific you'd like to know about our services?"
+        self.unhandled = True
+        return pack["info_fallback"]
+    
+    def _handle_information_gathering(self, text: str) -> str:
+        """Handle follow-up questions after an information query"""
+        pack = self.pack
+        info_keywords = pack["hours_keywords"] + pack["location_keywords"] + pack["contact_keywords"]
+        if any(keyword in text for keyword in info_keywords):
+            return self._handle_information_query(text)
+        return self._handle_general_query(text)
     
     def _handle_general_query(self, text: str) -> str:
         """Handle general queries"""
-        if "thank" in text or "thanks" in text:
+        pack = self.pack
+        if any(keyword in text for keyword in pack["thanks_keywords"]):
             self.state = ConversationState.CLOSING
-            return "You're welcome! Have a great day!"
+            return pack["welcome"]
         
-        if "goodbye" in text or "bye" in text:
+        if any(keyword in text for keyword in pack["goodbye_keywords"]):
             self.state = ConversationState.CLOSING
-            return "Thank you for calling. Have a wonderful day!"
+            return pack["goodbye"]
         
-        return "I'm here to help. Would you like to book an appointment or get information about our services?"
+        self.unhandled = True
+        return pack["general_fallback"]
     
     def reset(self):
         """Reset conversation state"""
         self.state = ConversationState.GREETING
+        self.turn_count = 0
+        self.language = None if len(self.languages) > 1 else self.default_language
         self.appointment_info = {
             "date": None,
             "time": None,
             "name": None,
             "phone": None,
-            "reason": None
+            "reason": None,
+            "datetime": None
         }
         self.context = {}
     
@@ -179,6 +368,7 @@ class ConversationManager:
         """Get summary of conversation for logging"""
         return {
             "state": self.state.value,
+            "language": self.language,
             "appointment_info": self.appointment_info,
             "context": self.context
         }
@@ -2,9 +2,10 @@
 Database models and setup for call logging
 """
 try:
-    from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Float
+    from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Text, Float, Boolean, UniqueConstraint
     from sqlalchemy.ext.declarative import declarative_base
     from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
     SQLALCHEMY_AVAILABLE = True
 except ImportError:
     SQLALCHEMY_AVAILABLE = False
@@ -13,11 +14,17 @@ except ImportError:
     logger.warning("SQLAlchemy not available. Database logging will be disabled.")
     
 # Export SQLALCHEMY_AVAILABLE
-__all__ = ['SQLALCHEMY_AVAILABLE', 'Base', 'CallLog', 'init_db', 'get_db']
+__all__ = ['SQLALCHEMY_AVAILABLE', 'Base', 'CallLog', 'CallRollup', 'ArchivedCall', 'Tenant', 'TenantConfigVersion',
+           'init_db', 'get_db', 'write_session', 'create_storage_engine', 'STORAGE_PROFILES']
 
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from config import settings
 
+# "basic" is the untuned engine the app used to build; kept for benchmarks
+STORAGE_PROFILES = ("auto", "sqlite", "server", "basic")
+
 if SQLALCHEMY_AVAILABLE:
     Base = declarative_base()
 else:
@@ -39,13 +46,157 @@ class CallLog(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+class CallRollup(Base):
+    """Pre-aggregated call counts and durations per time bucket"""
+    __tablename__ = "call_rollups"
+    __table_args__ = (
+        UniqueConstraint("granularity", "bucket_start", "direction", "status", name="uq_call_rollup_bucket"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String, nullable=False)  # 'hour' or 'day'
+    bucket_start = Column(DateTime, nullable=False, index=True)
+    direction = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    call_count = Column(Integer, nullable=False, default=0)
+    total_duration = Column(Float, nullable=False, default=0.0)  # in seconds
+
+
+class ArchivedCall(Base):
+    """Location of a call moved out of call_logs into a compressed archive"""
+    __tablename__ = "archived_calls"
+    
+    id = Column(Integer, primary_key=True)
+    call_sid = Column(String, unique=True, index=True, nullable=False)
+    partition = Column(String, nullable=False, index=True)  # YYYY-MM-DD of created_at
+    path = Column(String, nullable=False)  # archive file, relative to settings.archive_dir
+    offset = Column(Integer, nullable=False)  # byte offset of the compressed frame
+    length = Column(Integer, nullable=False)  # byte length of the compressed frame
+
+
+class Tenant(Base):
+    """Business configuration for the phone number a caller dialed"""
+    __tablename__ = "tenants"
+    
+    id = Column(Integer, primary_key=True)
+    phone_number = Column(String, unique=True, index=True, nullable=False)  # E.164
+    name = Column(String, nullable=False)
+    greeting = Column(Text)
+    office_hours = Column(Text)
+    location = Column(Text)
+    contact = Column(Text)
+    booking_enabled = Column(Boolean, nullable=False, default=True)
+    voice = Column(String, nullable=False, default="alice")
+    language = Column(String, nullable=False, default="en-US")
+    version = Column(Integer, nullable=False, default=1, index=True)  # config version of its last change
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class TenantConfigVersion(Base):
+    """Single row counting changes to the tenants table; never decreases"""
+    __tablename__ = "tenant_config_version"
+    
+    id = Column(Integer, primary_key=True)  # always 1
+    version = Column(Integer, nullable=False)
+
+
+def resolve_profile(url: str, profile: str = "auto") -> str:
+    """Pick the storage profile for a database URL"""
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown storage profile: {profile}")
+    if profile == "auto":
+        return "sqlite" if url.startswith("sqlite") else "server"
+    return profile
+
+
+def _configure_sqlite(engine):
+    """WAL journaling and tuned pragmas, with explicit BEGIN handling"""
+    
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        # Let the "begin" hook below issue BEGIN instead of pysqlite
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size_kb}")
+        cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+        cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+    
+    @event.listens_for(engine, "begin")
+    def begin(conn):
+        # Writers take the write lock up front (BEGIN IMMEDIATE) so they wait
+        # on busy_timeout instead of failing with "database is locked" when
+        # upgrading a read transaction
+        if conn.get_execution_options().get("isolation_level") == "AUTOCOMMIT":
+            return
+        # Resetting the isolation level on checkin re-enables pysqlite's own BEGIN
+        conn.connection.dbapi_connection.isolation_level = None
+        conn.exec_driver_sql(f"BEGIN {conn.get_execution_options().get('sqlite_begin', 'DEFERRED')}")
+
+
+def create_storage_engine(url: str = None, profile: str = None):
+    """
+    Create a SQLAlchemy engine tuned for the storage backend
+    
+    Args:
+        url: Database URL (default: settings.database_url)
+        profile: "sqlite", "server", "basic" or "auto" (default: settings.db_profile)
+        
+    Returns:
+        SQLAlchemy engine
+    """
+    url = url or settings.database_url
+    profile = resolve_profile(url, profile or settings.db_profile)
+    is_sqlite = url.startswith("sqlite")
+    
+    if profile == "basic":
+        connect_args = {"check_same_thread": False} if is_sqlite else {}
+        return create_engine(url, connect_args=connect_args)
+    
+    if profile == "sqlite":
+        if not is_sqlite:
+            raise ValueError("The sqlite storage profile requires a sqlite:// URL")
+        kwargs = {
+            "connect_args": {"check_same_thread": False, "timeout": settings.sqlite_busy_timeout_ms / 1000.0},
+            "query_cache_size": settings.db_statement_cache_size
+        }
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # An in-memory database only exists on a single connection
+            kwargs["poolclass"] = StaticPool
+        engine = create_engine(url, **kwargs)
+        _configure_sqlite(engine)
+        return engine
+    
+    return create_engine(
+        url,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=True,
+        query_cache_size=settings.db_statement_cache_size
+    )
+
+
 # Database setup
 if SQLALCHEMY_AVAILABLE:
-    engine = create_engine(settings.database_url, connect_args={"check_same_thread": False})
+    engine = create_storage_engine()
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Sessions that write: BEGIN IMMEDIATE on SQLite, ignored elsewhere
+    WriteSessionLocal = sessionmaker(
+        autocommit=False, autoflush=False, bind=engine.execution_options(sqlite_begin="IMMEDIATE")
+    )
 else:
     engine = None
     SessionLocal = None
+    WriteSessionLocal = None
+
+# SQLite allows a single writer; queue this process's writers in-process
+# rather than contending for the file lock
+_sqlite_writer_lock = threading.Lock()
 
 
 def init_db():
@@ -70,3 +221,29 @@ def get_db():
     finally:
         db.close()
 
+
+@contextmanager
+def write_session():
+    """
+    Session for a write transaction
+    
+    On SQLite, writers in this process are serialized through a lock and
+    each transaction starts with BEGIN IMMEDIATE; other databases get a
+    plain pooled session. Rolls back on error; the caller commits.
+    """
+    if not SQLALCHEMY_AVAILABLE:
+        yield None
+        return
+    is_sqlite = engine.dialect.name == "sqlite"
+    if is_sqlite:
+        _sqlite_writer_lock.acquire()
+    db = WriteSessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        if is_sqlite:
+            _sqlite_writer_lock.release()
@@ -0,0 +1,171 @@
+"""
+Database write/read benchmark for the storage engine profiles
+
+Writer processes replay status-callback traffic (create a call, then move
+it through ringing/in-progress/completed with rollup updates) while reader
+processes run /logs-style queries against the same database. Each profile
+runs against a fresh database and reports throughput, latency percentiles
+and "database is locked" errors.
+
+Usage:
+    python db_benchmark.py                                # basic vs sqlite, temp file
+    python db_benchmark.py --writers 8 --readers 4 --seconds 20
+    python db_benchmark.py --url postgresql://... --profiles server
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+STATUS_SEQUENCE = ("ringing", "in-progress", "completed")
+
+
+def _open_database(url: str, profile: str):
+    """Import the database module configured for one profile (child processes only)"""
+    os.environ["DATABASE_URL"] = url
+    os.environ["DB_PROFILE"] = profile
+    import database
+    return database
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def _writer(url: str, profile: str, seconds: float, results):
+    """Replay status callbacks until the deadline"""
+    database = _open_database(url, profile)
+    import rollups
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        call_sid = f"CA{uuid.uuid4().hex}"
+        started = time.perf_counter()
+        try:
+            with database.write_session() as db:
+                call_log = database.CallLog(call_sid=call_sid, phone_number="+15551234567",
+                                            direction="inbound", status="queued")
+                db.add(call_log)
+                rollups.record_call(db, call_log, is_new=True)
+                db.commit()
+            latencies.append(time.perf_counter() - started)
+            for status in STATUS_SEQUENCE:
+                started = time.perf_counter()
+                with database.write_session() as db:
+                    call_log = db.query(database.CallLog).filter(database.CallLog.call_sid == call_sid).first()
+                    old_status, old_duration = call_log.status, call_log.duration
+                    call_log.status = status
+                    call_log.duration = 30.0 if status == "completed" else 0.0
+                    rollups.record_call(db, call_log, old_status, old_duration)
+                    db.commit()
+                latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            if "locked" not in str(e):
+                raise
+            errors += 1
+    results.put(("write", latencies, errors))
+
+
+def _reader(url: str, profile: str, seconds: float, results):
+    """Run /logs and /logs/{call_sid} style queries until the deadline"""
+    database = _open_database(url, profile)
+    CallLog = database.CallLog
+
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        db = database.SessionLocal()
+        try:
+            recent = db.query(CallLog).order_by(CallLog.created_at.desc()).limit(100).all()
+            if recent:
+                db.query(CallLog).filter(CallLog.call_sid == recent[-1].call_sid).first()
+            latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            if "locked" not in str(e):
+                raise
+            errors += 1
+        finally:
+            db.close()
+    results.put(("read", latencies, errors))
+
+
+def _setup(url: str, profile: str):
+    database = _open_database(url, profile)
+    database.init_db()
+
+
+def run_profile(url: str, profile: str, writers: int, readers: int, seconds: float) -> Dict:
+    """
+    Benchmark one storage profile
+
+    Returns:
+        Per-operation throughput, p50/p99 latency (ms) and lock errors
+    """
+    context = multiprocessing.get_context("spawn")
+    setup = context.Process(target=_setup, args=(url, profile))
+    setup.start()
+    setup.join()
+
+    results = context.Queue()
+    processes = [context.Process(target=_writer, args=(url, profile, seconds, results)) for _ in range(writers)]
+    processes += [context.Process(target=_reader, args=(url, profile, seconds, results)) for _ in range(readers)]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    report = {"profile": profile}
+    for kind in ("write", "read"):
+        latencies = [latency for k, values, _ in collected if k == kind for latency in values]
+        report[kind] = {
+            "ops_per_second": len(latencies) / seconds,
+            "p50_ms": _percentile(latencies, 0.50) * 1000,
+            "p99_ms": _percentile(latencies, 0.99) * 1000,
+            "locked_errors": sum(errors for k, _, errors in collected if k == kind)
+        }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark database storage profiles")
+    parser.add_argument("--url", help="Database URL (default: a fresh SQLite file per profile)")
+    parser.add_argument("--profiles", nargs="+", default=["basic", "sqlite"],
+                        help="Profiles to compare: basic, sqlite, server")
+    parser.add_argument("--writers", type=int, default=4, help="Writer processes")
+    parser.add_argument("--readers", type=int, default=2, help="Reader processes")
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration per profile")
+    args = parser.parse_args(argv)
+
+    for profile in args.profiles:
+        workdir = None
+        url = args.url
+        if url is None:
+            workdir = tempfile.mkdtemp(prefix="db_benchmark_")
+            url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        try:
+            report = run_profile(url, profile, args.writers, args.readers, args.seconds)
+        finally:
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+        print(f"Profile: {profile}")
+        for kind in ("write", "read"):
+            r = report[kind]
+            print(f"  {kind:5s} {r['ops_per_second']:9.1f} ops/s  p50 {r['p50_ms']:7.2f} ms  "
+                  f"p99 {r['p99_ms']:8.2f} ms  locked errors {r['locked_errors']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
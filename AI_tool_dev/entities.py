@@ -0,0 +1,464 @@
+"""
+Date, time and name extraction for caller utterances
+
+Each language's grammar is compiled once at import into three regular
+expressions (dates, times, names) plus a day-part pattern. An utterance is
+scanned with these and the matches are resolved against the call's local
+time, so "half past four next Tuesday" becomes a timezone-aware datetime
+and "2 people" is not mistaken for a time. A parse takes a few tens of
+microseconds, cheap enough to run on every partial transcript.
+
+Usage:
+    python entities.py "2 people at half past four next Tuesday"
+    python entities.py --benchmark
+"""
+import argparse
+import datetime
+import re
+import sys
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Entities(NamedTuple):
+    """What an utterance says about an appointment"""
+    date: Optional[datetime.date]
+    time: Optional[datetime.time]
+    name: Optional[str]
+    when: Optional[datetime.datetime]  # date and time combined in the call's timezone
+
+
+NO_ENTITIES = Entities(None, None, None, None)
+
+
+def _words(text: str) -> str:
+    """Alternation of space-separated words, longest first so prefixes never win"""
+    return "|".join(sorted(text.split(), key=len, reverse=True))
+
+
+def _ordinal_words() -> Dict[str, int]:
+    units = ("first second third fourth fifth sixth seventh eighth ninth tenth eleventh twelfth thirteenth "
+             "fourteenth fifteenth sixteenth seventeenth eighteenth nineteenth").split()
+    words = {word: day for day, word in enumerate(units, 1)}
+    words["twentieth"] = 20
+    words["thirtieth"] = 30
+    for day, word in enumerate(units[:9], 1):
+        words[f"twenty {word}"] = 20 + day
+    words["thirty first"] = 31
+    return words
+
+
+class _Grammar:
+    """Compiled patterns and vocabulary for one language"""
+
+    def __init__(self, language: str, numbers: Dict[str, int], minutes: Dict[str, int], months: List[str],
+                 month_aliases: Dict[str, int], weekdays: List[str], weekday_aliases: Dict[str, int],
+                 relative_days: Dict[str, int], units: Dict[str, int], modifiers: Dict[str, str],
+                 directions: Dict[str, int], dayparts: Dict[str, str], ordinals: Dict[str, int],
+                 dates: str, times: str, daypart: str, names: str, name_stopwords: str,
+                 day_first: bool):
+        self.language = language
+        self.numbers = numbers
+        self.minutes = minutes
+        self.months = months
+        self.month_index = dict(month_aliases, **{name: i for i, name in enumerate(months, 1)})
+        self.weekdays = weekdays
+        self.weekday_index = dict(weekday_aliases, **{name: i for i, name in enumerate(weekdays)})
+        self.relative_days = relative_days
+        self.units = units
+        self.modifiers = modifiers
+        self.directions = directions
+        self.dayparts = dayparts
+        self.ordinals = ordinals
+        self.day_first = day_first
+        # Matches can only start at a word boundary; checking that once per
+        # position instead of in every alternative halves the scan time
+        self.dates = re.compile(r"\b(?:" + dates + ")")
+        self.times = re.compile(r"\b(?:" + times + ")")
+        self.daypart = re.compile(daypart)
+        self.names = re.compile(names)
+        self.name_stopwords = frozenset(name_stopwords.split())
+
+
+def _english() -> _Grammar:
+    numbers = {word: n for n, word in enumerate(
+        "zero one two three four five six seven eight nine ten eleven twelve".split())}
+    numbers.update({"a": 1, "an": 1})
+    minutes = {"oh five": 5, "five": 5, "ten": 10, "fifteen": 15, "quarter": 15, "a quarter": 15,
+               "twenty": 20, "twenty five": 25, "thirty": 30, "half": 30, "forty": 40, "forty five": 45,
+               "fifty": 50, "fifty five": 55}
+    months = "january february march april may june july august september october november december".split()
+    aliases = {"jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8, "sep": 9, "sept": 9,
+               "oct": 10, "nov": 11, "dec": 12}
+    weekdays = "monday tuesday wednesday thursday friday saturday sunday".split()
+    ordinals = _ordinal_words()
+
+    hour = r"(?:2[0-3]|1\d|0?\d|" + _words("one two three four five six seven eight nine ten eleven twelve") + ")"
+    minute_word = r"(?:oh five|twenty five|forty five|fifty five|fifteen|twenty|thirty|forty|fifty|ten|five)"
+    ampm = r"[ap]\.? ?m\b\.?"
+    day = r"(?:(?:3[01]|[12]\d|0?[1-9])(?:st|nd|rd|th)?|" + "|".join(sorted(ordinals, key=len, reverse=True)) + ")"
+    ordinal = r"(?:(?:3[01]|[12]\d|0?[1-9])(?:st|nd|rd|th)|" + "|".join(sorted(ordinals, key=len, reverse=True)) + ")"
+    month = "(?:" + _words(" ".join(months) + " " + " ".join(aliases)) + ")"
+
+    times = (
+        r"(?P<past>(?:(?P<p_m>half|(?:a )?quarter|" + minute_word + r")(?: minutes)?|(?P<p_n>[1-5]?\d) minutes) "
+        r"(?P<p_dir>past|after|to|till|of) (?P<p_h>" + hour + r")(?: ?(?P<p_ap>" + ampm + r"))?(?!\w))"
+        r"|(?P<clock>(?P<c_at>at )?(?P<c_h>" + hour + r")(?:(?P<c_sep>:| )(?P<c_m>[0-5]\d|" + minute_word + r"))?"
+        r"(?: ?(?P<c_ap>" + ampm + r")| (?P<c_oc>o'?clock))?(?!\w))"
+        r"|(?P<noon>(?:noon|midday)\b)"
+        r"|(?P<midnight>midnight\b)"
+    )
+    dates = (
+        r"(?P<md>(?P<md_month>" + month + r")\.? (?:the )?(?P<md_day>" + day + r")(?!\w))"
+        r"|(?P<dm>(?:the )?(?P<dm_day>" + day + r") (?:of )?(?P<dm_month>" + month + r")\b)"
+        r"|(?P<num>(?P<n_a>1[0-2]|0?[1-9])/(?P<n_b>3[01]|[12]\d|0?[1-9])\b)"
+        r"|(?P<the>the (?P<t_day>" + ordinal + r")(?!\w))"
+        r"|(?P<wd>(?:(?P<wd_mod>next|this|coming) )?(?P<wd_day>" + _words(" ".join(weekdays)) + r")s?\b)"
+        r"|(?P<in>in (?P<in_n>\d{1,2}|" + _words(" ".join(numbers)) + r") (?P<in_unit>days?|weeks?)\b)"
+        r"|(?P<rel>(?:day after tomorrow|tomorrow|today|tonight)\b)"
+    )
+    return _Grammar(
+        "en", numbers, minutes, months, aliases, weekdays, {},
+        relative_days={"today": 0, "tonight": 0, "tomorrow": 1, "day after tomorrow": 2},
+        units={"day": 1, "days": 1, "week": 7, "weeks": 7},
+        modifiers={"next": "next", "this": "this", "coming": ""},
+        directions={"past": 1, "after": 1, "to": -1, "till": -1, "of": -1},
+        dayparts={"morning": "am", "afternoon": "pm", "evening": "pm", "night": "pm", "tonight": "pm"},
+        ordinals=ordinals,
+        dates=dates,
+        times=times,
+        daypart=r"\b(?P<dp>morning|afternoon|evening|tonight|night)\b",
+        names=(r"(?:\b(?:my name is|my name's|i am|i'm|call me)|^(?:it's|this is)) "
+               r"(?P<name>[a-z][a-z'\-]+(?: [a-z][a-z'\-]+)?)"),
+        name_stopwords=(
+            "a an the and but or so for to at on in with about of just calling looking trying interested "
+            "wondering hoping going gonna here there not sure fine good great okay ok well um uh like available "
+            "free busy sorry new back also still really very please thanks thank yes no hi hello booking "
+            "wanting needing asking me my you your it i we is was be "
+            + " ".join(months) + " " + " ".join(weekdays) + " tomorrow today tonight"
+        ),
+        day_first=False,
+    )
+
+
+def _spanish() -> _Grammar:
+    numbers = {word: n for n, word in enumerate(
+        "cero una dos tres cuatro cinco seis siete ocho nueve diez once doce".split())}
+    numbers.update({"uno": 1, "un": 1})
+    minutes = {"cinco": 5, "diez": 10, "quince": 15, "cuarto": 15, "veinte": 20, "veinticinco": 25,
+               "treinta": 30, "media": 30, "cuarenta": 40, "cuarenta y cinco": 45, "cincuenta": 50}
+    months = ("enero febrero marzo abril mayo junio julio agosto septiembre octubre noviembre "
+              "diciembre").split()
+    weekdays = "lunes martes miércoles jueves viernes sábado domingo".split()
+
+    hour = r"(?:2[0-3]|1\d|0?\d|" + _words("una uno dos tres cuatro cinco seis siete ocho nueve diez once doce") + ")"
+    minute_word = r"(?:cuarenta y cinco|veinticinco|cincuenta|cuarenta|treinta|quince|veinte|cinco|diez)"
+    ampm = r"[ap]\.? ?m\b\.?"
+    at = r"(?:(?:a )?las? )"
+    day = r"(?:3[01]|[12]\d|0?[1-9]|primero)"
+
+    times = (
+        r"(?P<past>" + at + r"?(?P<p_h>" + hour + r") (?P<p_dir>y|menos) "
+        r"(?P<p_m>media|cuarto|[1-5]\d|" + minute_word + r")(?: minutos)?(?: ?(?P<p_ap>" + ampm + r"))?(?!\w))"
+        r"|(?P<clock>(?P<c_at>" + at + r")?(?P<c_h>" + hour + r")(?:(?P<c_sep>:)(?P<c_m>[0-5]\d))?"
+        r"(?: ?(?P<c_ap>" + ampm + r")| (?P<c_oc>en punto))?(?!\w))"
+        r"|(?P<noon>mediod[ií]a\b)"
+        r"|(?P<midnight>medianoche\b)"
+    )
+    dates = (
+        r"(?P<dm>(?:el )?(?P<dm_day>" + day + r") de (?P<dm_month>" + _words(" ".join(months)) + r")\b)"
+        r"|(?P<num>(?P<n_a>3[01]|[12]\d|0?[1-9])/(?P<n_b>1[0-2]|0?[1-9])\b)"
+        r"|(?P<the>el (?P<t_day>" + day + r")(?!\w))"
+        r"|(?P<wd>(?:(?P<wd_mod>pr[óo]ximo|este) )?(?P<wd_day>lunes|martes|mi[ée]rcoles|jueves|viernes|"
+        r"s[áa]bado|domingo)(?P<wd_next> que viene)?\b)"
+        r"|(?P<in>(?:en|dentro de) (?P<in_n>\d{1,2}|" + _words(" ".join(numbers)) + r") "
+        r"(?P<in_unit>d[ií]as?|semanas?)\b)"
+        r"|(?P<rel>(?:pasado mañana|(?<!la )mañana|hoy|esta noche)\b)"
+    )
+    return _Grammar(
+        "es", numbers, minutes, months, {}, weekdays, {"miercoles": 2, "sabado": 5},
+        relative_days={"hoy": 0, "esta noche": 0, "mañana": 1, "pasado mañana": 2},
+        units={"día": 1, "dia": 1, "días": 1, "dias": 1, "semana": 7, "semanas": 7},
+        modifiers={"este": "this", "próximo": "", "proximo": ""},
+        directions={"y": 1, "menos": -1},
+        dayparts={"mañana": "am", "tarde": "pm", "noche": "pm"},
+        ordinals={"primero": 1},
+        dates=dates,
+        times=times,
+        daypart=r"\b(?:de|por|en|esta) (?:la )?(?P<dp>mañana|tarde|noche)\b",
+        names=r"\b(?:me llamo|mi nombre es|soy) (?P<name>[a-záéíóúüñ][a-záéíóúüñ'\-]+(?: [a-záéíóúüñ][a-záéíóúüñ'\-]+)?)",
+        name_stopwords=(
+            "a al el la los las un una y o de del en con para por que no sí si muy bien nuevo nueva cliente "
+            "paciente yo usted de la mañana tarde noche hoy " + " ".join(months) + " " + " ".join(weekdays)
+        ),
+        day_first=True,
+    )
+
+
+GRAMMARS: Dict[str, _Grammar] = {grammar.language: grammar for grammar in (_english(), _spanish())}
+
+
+def _number(grammar: _Grammar, token: str) -> int:
+    return int(token) if token.isdigit() else grammar.numbers[token]
+
+
+def _minute(grammar: _Grammar, token: str) -> int:
+    return int(token) if token.isdigit() else grammar.minutes[token]
+
+
+def _day(grammar: _Grammar, token: str) -> int:
+    digits = token.rstrip("stndrh")
+    return int(digits) if digits.isdigit() else grammar.ordinals[token]
+
+
+def _to_24h(hour: int, period: Optional[str]) -> int:
+    """Apply am/pm; without one, assume business hours (1-7 afternoon, 8-11 morning)"""
+    if hour > 12:
+        return hour
+    if period == "am":
+        return hour % 12
+    if period == "pm" or 1 <= hour <= 7:
+        return hour % 12 + 12
+    return hour
+
+
+def _period(token: Optional[str]) -> Optional[str]:
+    if token:
+        return "am" if token[0] == "a" else "pm"
+    return None
+
+
+def _resolve_time(grammar: _Grammar, match, text: str) -> Optional[datetime.time]:
+    kind = match.lastgroup
+    if kind == "noon":
+        return datetime.time(12, 0)
+    if kind == "midnight":
+        return datetime.time(0, 0)
+
+    if kind == "past":
+        period = _period(match.group("p_ap"))
+        hour = _number(grammar, match.group("p_h"))
+        offset = _minute(grammar, match.group("p_m") or match.group("p_n"))
+        minute = 0
+        offset *= grammar.directions[match.group("p_dir")]
+    else:
+        # A bare number ("2 people") is not a time
+        period = _period(match.group("c_ap"))
+        if not (match.group("c_at") or period or match.group("c_oc") or match.group("c_sep") == ":"):
+            return None
+        hour = _number(grammar, match.group("c_h"))
+        minute = _minute(grammar, match.group("c_m")) if match.group("c_m") else 0
+        offset = 0
+    if hour > 23 or minute > 59:
+        return None
+
+    if period is None:
+        daypart = grammar.daypart.search(text)
+        if daypart:
+            period = grammar.dayparts[daypart.group("dp")]
+    total = _to_24h(hour, period) * 60 + minute + offset
+    return datetime.time((total // 60) % 24, total % 60)
+
+
+def _month_day(today: datetime.date, month: int, day: int) -> Optional[datetime.date]:
+    """The next occurrence of a month and day, this year or next"""
+    for year in (today.year, today.year + 1):
+        try:
+            date = datetime.date(year, month, day)
+        except ValueError:
+            return None
+        if date >= today:
+            return date
+    return None
+
+
+def _resolve_date(grammar: _Grammar, match, today: datetime.date) -> Optional[datetime.date]:
+    kind = match.lastgroup
+    if kind == "rel":
+        return today + datetime.timedelta(days=grammar.relative_days[match.group("rel")])
+
+    if kind == "wd":
+        weekday = grammar.weekday_index[match.group("wd_day")]
+        modifier = grammar.modifiers.get(match.group("wd_mod"), "")
+        ahead = (weekday - today.weekday()) % 7
+        if ahead == 0 and modifier != "this":
+            ahead = 7
+        elif modifier == "next" and weekday > today.weekday():
+            # "next Tuesday" said on a Monday is the Tuesday of next week
+            ahead += 7
+        return today + datetime.timedelta(days=ahead)
+
+    if kind == "in":
+        count = _number(grammar, match.group("in_n"))
+        return today + datetime.timedelta(days=count * grammar.units[match.group("in_unit")])
+
+    if kind == "the":
+        day = _day(grammar, match.group("t_day"))
+        month, year = today.month, today.year
+        if day < today.day:
+            month, year = (1, year + 1) if month == 12 else (month + 1, year)
+        # "The 31st" said in a shorter month is in the next month that has one
+        for _ in range(12):
+            try:
+                return datetime.date(year, month, day)
+            except ValueError:
+                month, year = (1, year + 1) if month == 12 else (month + 1, year)
+        return None
+
+    if kind == "num":
+        a, b = int(match.group("n_a")), int(match.group("n_b"))
+        month, day = (b, a) if grammar.day_first else (a, b)
+        return _month_day(today, month, day)
+
+    month = grammar.month_index[match.group(kind + "_month")]
+    return _month_day(today, month, _day(grammar, match.group(kind + "_day")))
+
+
+# Explicit calendar dates outrank weekdays and relative expressions
+_DATE_PRIORITY = {"md": 3, "dm": 3, "num": 3, "the": 2}
+
+
+def _parse(grammar: _Grammar, text: str, now: datetime.datetime, today: datetime.date) -> Entities:
+    text = " ".join(text.lower().replace("\u2019", "'").split())
+
+    date = None
+    best = -1
+    for match in grammar.dates.finditer(text):
+        priority = _DATE_PRIORITY.get(match.lastgroup, 1)
+        if priority > best:
+            resolved = _resolve_date(grammar, match, today)
+            if resolved is not None:
+                date, best = resolved, priority
+
+    time_of_day = None
+    for match in grammar.times.finditer(text):
+        time_of_day = _resolve_time(grammar, match, text)
+        if time_of_day is not None:
+            break
+
+    name = None
+    match = grammar.names.search(text)
+    if match:
+        words = []
+        for word in match.group("name").split():
+            if word in grammar.name_stopwords or word in grammar.numbers:
+                break
+            words.append(word)
+        if words:
+            name = " ".join(words).title()
+
+    when = None
+    if date is not None and time_of_day is not None:
+        when = datetime.datetime.combine(date, time_of_day, tzinfo=now.tzinfo)
+    return Entities(date, time_of_day, name, when)
+
+
+def extract(text: str, now: datetime.datetime, language: str = "en") -> Entities:
+    """
+    Extract the date, time and name from an utterance
+
+    Args:
+        text: Caller utterance (any case)
+        now: Call time, timezone-aware; relative dates resolve against it
+        language: Language code of the call
+
+    Returns:
+        Entities; fields the utterance does not mention are None
+    """
+    if not text:
+        return NO_ENTITIES
+    grammar = GRAMMARS.get(language, GRAMMARS["en"])
+    return _parse(grammar, text, now, now.date())
+
+
+def extract_batch(texts: Iterable[str], now: datetime.datetime, language: str = "en") -> List[Entities]:
+    """Extract entities from many utterances sharing one call time and language"""
+    grammar = GRAMMARS.get(language, GRAMMARS["en"])
+    today = now.date()
+    return [_parse(grammar, text, now, today) if text else NO_ENTITIES for text in texts]
+
+
+def format_date(date: datetime.date, language: str = "en") -> str:
+    """Spoken form of a date: 'Tuesday, March 17' / 'martes 17 de marzo'"""
+    grammar = GRAMMARS.get(language, GRAMMARS["en"])
+    weekday = grammar.weekdays[date.weekday()]
+    month = grammar.months[date.month - 1]
+    if grammar.day_first:
+        return f"{weekday} {date.day} de {month}"
+    return f"{weekday.title()}, {month.title()} {date.day}"
+
+
+def format_time(value: datetime.time, language: str = "en") -> str:
+    """Spoken form of a time: '4:30 PM' / '4:30 de la tarde'"""
+    hour = value.hour % 12 or 12
+    if language == "es":
+        part = "de la mañana" if value.hour < 12 else "de la tarde" if value.hour < 20 else "de la noche"
+        return f"{hour}:{value.minute:02d} {part}"
+    return f"{hour}:{value.minute:02d} {'AM' if value.hour < 12 else 'PM'}"
+
+
+BENCHMARK_UTTERANCES: Tuple[str, ...] = (
+    "2 people at half past four next Tuesday",
+    "Tomorrow at 4 PM",
+    "Could I come in on March 17th around 10:30 in the morning?",
+    "My name is Sarah Johnson and I'd like a cleaning",
+    "What are your office hours on the weekend?",
+    "The 14th at quarter to three would be great",
+    "I'm calling to book an appointment",
+    "Sometime in 2 weeks, maybe at 9 o'clock",
+)
+
+
+def benchmark(iterations: int = 20000) -> Dict[str, float]:
+    """
+    Measure parse cost on representative utterances
+
+    Returns:
+        Microseconds per parse for extract() and extract_batch(), and parses per second
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rounds = max(iterations // len(BENCHMARK_UTTERANCES), 1)
+    parses = rounds * len(BENCHMARK_UTTERANCES)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in BENCHMARK_UTTERANCES:
+            extract(text, now)
+    single = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        extract_batch(BENCHMARK_UTTERANCES, now)
+    batch = time.perf_counter() - started
+
+    return {
+        "parses": parses,
+        "extract_us": single / parses * 1e6,
+        "batch_us": batch / parses * 1e6,
+        "parses_per_second": parses / batch,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Extract appointment dates, times and names from text")
+    parser.add_argument("text", nargs="*", help="Utterances to parse")
+    parser.add_argument("--language", default="en")
+    parser.add_argument("--benchmark", action="store_true", help="Measure parse throughput")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        report = benchmark(args.iterations)
+        print(f"{report['parses']} parses: extract {report['extract_us']:.1f} µs, "
+              f"batch {report['batch_us']:.1f} µs per parse ({report['parses_per_second']:,.0f}/s)")
+        return 0
+
+    now = datetime.datetime.now().astimezone()
+    for text, found in zip(args.text, extract_batch(args.text, now, args.language)):
+        print(f"{text!r}: date={found.date} time={found.time} name={found.name} when={found.when}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
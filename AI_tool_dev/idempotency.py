@@ -0,0 +1,130 @@
+"""
+Idempotent webhook handling
+
+Twilio retries a webhook when the first attempt times out, sending the
+same form again. Responses are cached by (CallSid, request fingerprint) for
+a bounded time so a retry returns the original TwiML without re-running the
+handler; a retry that arrives while the original is still running waits
+for it instead of running it twice.
+"""
+import asyncio
+import collections
+import hashlib
+import inspect
+import threading
+import time
+from typing import Awaitable, Callable, Optional, Tuple, Union
+
+from metrics import registry
+
+WEBHOOK_REPLAYS = registry.counter(
+    "voice_ai_webhook_replays_total",
+    "Webhook requests answered from the idempotency cache",
+    ("endpoint",)
+)
+
+# Key: (CallSid, fingerprint)
+CacheKey = Tuple[str, str]
+
+
+def request_fingerprint(method: str, path: str, query: str, form_items) -> str:
+    """
+    Fingerprint a webhook request
+
+    Retries carry the same path, query string and form, so they hash to the
+    same value; parameter order does not matter.
+    """
+    digest = hashlib.sha256(f"{method} {path}?{query}".encode("utf-8"))
+    for name, value in sorted((str(k), str(v)) for k, v in form_items):
+        digest.update(b"\0")
+        digest.update(name.encode("utf-8"))
+        digest.update(b"=")
+        digest.update(value.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """Bounded TTL cache of rendered webhook responses"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "collections.OrderedDict[CacheKey, Tuple[float, str]]" = collections.OrderedDict()
+        self._in_flight: dict = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Cached response for a key, or None if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, body = entry
+            if expires < now:
+                del self._entries[key]
+                return None
+            return body
+
+    def put(self, key: CacheKey, body: str):
+        """Store a rendered response, evicting expired and then oldest entries"""
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, body)
+            self._entries.move_to_end(key)
+            # Entries are in insertion order, so expired ones are at the front
+            while self._entries:
+                oldest_key, (expires, _) = next(iter(self._entries.items()))
+                if expires >= now and len(self._entries) <= self.max_entries:
+                    break
+                del self._entries[oldest_key]
+
+    async def get_or_render(self, key: CacheKey, endpoint: str,
+                            render: Callable[[], Union[str, Awaitable[str]]]) -> str:
+        """
+        Return the cached response for key, or render and cache it
+
+        Args:
+            key: (CallSid, fingerprint)
+            endpoint: Endpoint label for the replay counter
+            render: Callable (sync or async) producing the response body
+
+        Returns:
+            Response body
+        """
+        body = self.get(key)
+        if body is not None:
+            WEBHOOK_REPLAYS.inc(endpoint)
+            return body
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            # The original request is still being handled; share its result
+            WEBHOOK_REPLAYS.inc(endpoint)
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            body = render()
+            if inspect.isawaitable(body):
+                body = await body
+            self.put(key, body)
+            future.set_result(body)
+            return body
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; don't log "exception never retrieved"
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            del self._in_flight[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
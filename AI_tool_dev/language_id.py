@@ -0,0 +1,96 @@
+"""
+Caller language identification and per-language voice settings
+
+The caller's first utterance is classified once per call from the words
+Twilio recognized: an explicit choice ("español", "English") wins,
+otherwise the language whose common function words occur most. The
+result is cached on the call's ConversationManager, so later turns never
+run detection again.
+"""
+import re
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
+
+class VoiceSettings(NamedTuple):
+    """How a language is spoken and recognized in TwiML"""
+    voice: str
+    language: str  # <Say> language
+    gather_language: str  # <Gather> speech recognition language
+
+
+# Language code -> defaults used when the tenant's own language differs
+LANGUAGE_VOICES: Dict[str, VoiceSettings] = {
+    "en": VoiceSettings("alice", "en-US", "en-US"),
+    "es": VoiceSettings("alice", "es-MX", "es-US"),
+}
+
+# Words callers say to pick a language outright
+_SELECTION_WORDS: Dict[str, str] = {
+    "español": "es", "espanol": "es", "spanish": "es", "castellano": "es",
+    "english": "en", "inglés": "en", "ingles": "en",
+}
+
+# Frequent function words, disjoint between languages
+_FUNCTION_WORDS: Dict[str, FrozenSet[str]] = {
+    "en": frozenset("""
+        the an and is are was to of for in on at my i i'm you your we our it this that what
+        when where how can could would like want need do does have has please yes no hello hi
+        thanks thank appointment book tomorrow today morning afternoon
+    """.split()),
+    "es": frozenset("""
+        el la los las un una y es son está estoy para por en mi yo usted ustedes nosotros que qué
+        cuando cuándo donde dónde cómo como puedo puede quiero quisiera necesito tengo tiene hola
+        sí gracias buenos buenas días tardes cita mañana hoy favor
+    """.split()),
+}
+
+_WORD = re.compile(r"[a-záéíóúüñ']+")
+# Characters that only occur in Spanish among the supported languages
+_SPANISH_MARKS = re.compile(r"[ñ¿¡áéíóú]")
+
+
+def language_code(locale: Optional[str]) -> str:
+    """'es-MX' -> 'es'"""
+    return (locale or "en").split("-")[0].lower()
+
+
+def detect_language(text: str, supported: Iterable[str], default: str) -> Tuple[str, bool]:
+    """
+    Identify the language of an utterance
+
+    Args:
+        text: Recognized speech
+        supported: Language codes the deployment handles
+        default: Code to use when there is no evidence
+
+    Returns:
+        (language code, whether the utterance was only a language choice)
+    """
+    supported = set(supported)
+    words = _WORD.findall(text.lower())
+    if not words:
+        return default, False
+
+    for word in words:
+        choice = _SELECTION_WORDS.get(word)
+        if choice in supported:
+            # "Español" or "en español, por favor" selects without asking anything
+            return choice, len(words) <= 3
+
+    scores = {
+        code: sum(1 for word in words if word in vocabulary)
+        for code, vocabulary in _FUNCTION_WORDS.items() if code in supported
+    }
+    if "es" in scores and _SPANISH_MARKS.search(text):
+        scores["es"] += 1
+    best = max(scores, key=scores.get, default=default)
+    if not scores or scores[best] == 0 or scores[best] == scores.get(default, 0):
+        return default, False
+    return best, False
+
+
+def voice_for(tenant, code: str) -> VoiceSettings:
+    """Voice settings for a call: the tenant's own voice in its language, defaults otherwise"""
+    if code == language_code(tenant.language):
+        return VoiceSettings(tenant.voice, tenant.language, tenant.language)
+    return LANGUAGE_VOICES.get(code, LANGUAGE_VOICES["en"])
@@ -0,0 +1,117 @@
+"""
+Lazy import helpers for heavy optional backends
+"""
+import importlib
+import importlib.util
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds spent importing each lazily loaded module, keyed by module name
+import_timings: Dict[str, float] = {}
+
+
+def is_available(module_name: str) -> bool:
+    """
+    Check whether a module can be imported without importing it
+
+    Only the top-level package is looked up, so checking "TTS.api" does not
+    execute the TTS package (and pull in torch) just to answer the question.
+
+    Args:
+        module_name: Dotted module name
+
+    Returns:
+        True if the package is installed, False otherwise
+    """
+    top_level = module_name.split('.')[0]
+    try:
+        return importlib.util.find_spec(top_level) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule:
+    """Module proxy that performs the real import on first attribute access"""
+
+    def __init__(self, module_name: str):
+        """
+        Initialize the proxy
+
+        Args:
+            module_name: Dotted module name to import on first use
+        """
+        self._module_name = module_name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """Import the wrapped module once and cache it"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._module_name)
+                    elapsed = time.perf_counter() - start
+                    import_timings[self._module_name] = elapsed
+                    logger.info(f"Lazily imported {self._module_name} in {elapsed * 1000:.1f} ms")
+                    self._module = module
+        return self._module
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the real module has been imported yet"""
+        return self._module is not None
+
+    def __getattr__(self, name: str):
+        return getattr(self._load(), name)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<LazyModule {self._module_name} ({state})>"
+
+
+def lazy_import(module_name: str) -> LazyModule:
+    """
+    Return a proxy for a module that is only imported when first used
+
+    Args:
+        module_name: Dotted module name
+
+    Returns:
+        LazyModule proxy
+    """
+    return LazyModule(module_name)
+
+
+def parse_importtime(output: str, limit: Optional[int] = 25) -> list:
+    """
+    Parse the stderr of ``python -X importtime`` into per-module costs
+
+    Args:
+        output: Raw importtime output
+        limit: Maximum number of rows to return (None for all)
+
+    Returns:
+        List of (module, self_us, cumulative_us) sorted by cumulative cost
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            # Header row
+            continue
+        rows.append((parts[2].strip(), self_us, cumulative_us))
+
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows if limit is None else rows[:limit]
@@ -1,40 +1,160 @@
 """
 FastAPI backend for Voice AI Receptionist System
 """
-from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import Response, PlainTextResponse
-from twilio.twiml.voice_response import VoiceResponse, Gather
-from twilio.rest import Client
+from fastapi import FastAPI, Request, Form, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, PlainTextResponse, JSONResponse, FileResponse
+from twilio.twiml.voice_response import VoiceResponse, Gather, Start
+import asyncio
+import hmac
+import json
 import logging
 import os
+import threading
 import tempfile
 import base64
+import functools
+import time
+import uuid
+from datetime import datetime, timedelta
 from typing import Optional
 
 from config import settings
-from database import get_db, CallLog, init_db, SQLALCHEMY_AVAILABLE
-from stt_module import STTEngine
-from tts_module import TTSEngine
-from conversation_flow import ConversationManager
+from database import get_db, write_session, CallLog, init_db, SQLALCHEMY_AVAILABLE
+from stt_module import STTEngine, DecodingHints
+from tts_module import TTSEngine, synthesis_available
+from conversation_flow import ConversationManager, LANGUAGE_PACKS
+from lazy_imports import lazy_import
+from metrics import registry, REQUEST_LATENCY, CallSidFilter, current_call_sid, call_direction, stage_timer
+from profiler import (ContextExecutor, SamplingProfiler, attribute_loop, capture_lock, current_profile,
+                      request_profiles, render_profile)
+from transcript_search import get_backend as get_search_backend, init_search
+from idempotency import ResponseCache, request_fingerprint
+from speculation import SpeculationCache
+from tenants import TenantConfig, tenant_registry
+from media_store import MediaStore, MEDIA_TYPE, media_id_for, synthesize_prompt
+from tts_fragments import FragmentSynthesizer
+from response_generators import get_generator, init_generator
+from language_id import LANGUAGE_VOICES, VoiceSettings, language_code, voice_for
+from admission import Overloaded, from_settings as admission_from_settings
+from call_recorder import CallRecorder
+import rollups
+import retention
 
-# Configure logging
+# Configure logging; records logged while handling a webhook carry its CallSid
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format='%(asctime)s - %(name)s - %(levelname)s - [%(call_sid)s] %(message)s'
 )
+for handler in logging.getLogger().handlers:
+    handler.addFilter(CallSidFilter())
 logger = logging.getLogger(__name__)
 
+# twilio.rest pulls in every REST resource; only outbound calls need it
+twilio_rest = lazy_import("twilio.rest")
+
 # Initialize FastAPI app
 app = FastAPI(title="Voice AI Receptionist", version="1.0.0")
 
 # Initialize engines (singleton pattern)
 stt_engine: Optional[STTEngine] = None
 tts_engine: Optional[TTSEngine] = None
-twilio_client: Optional[Client] = None
+fragment_synthesizer: Optional[FragmentSynthesizer] = None
+twilio_client = None
+# The TTS threads and fragment prerendering may ask for the engine at once
+tts_engine_lock = threading.Lock()
+
+# Caller audio recordings (CALL_RECORDING), created at startup
+call_recorder: Optional[CallRecorder] = None
 
 # Conversation managers (one per call)
 conversation_managers: dict = {}
 
+# Rendered webhook responses, replayed when Twilio retries a request
+webhook_responses = ResponseCache(
+    max_entries=settings.webhook_cache_size,
+    ttl=settings.webhook_cache_ttl
+)
+
+# Synthesized prompts served to Twilio from /media
+media_store = MediaStore(settings.media_dir)
+# Prompt synthesis never runs on the event loop; a local model serves one request at a time
+tts_executor = ContextExecutor(
+    max_workers=settings.tts_sidecar_workers if settings.tts_sidecar_socket else 1,
+    thread_name_prefix="tts"
+)
+
+# Replies prepared from partial speech results, per call
+speculations = SpeculationCache(max_candidates=settings.speculation_max_candidates)
+
+# Concurrency limits and per-caller rate limits for webhook traffic
+admission_control = admission_from_settings(settings)
+
+# Languages the caller's first utterance is classified between
+SUPPORTED_LANGUAGES = [code.strip() for code in settings.supported_languages.split(",") if code.strip()]
+
+
+async def read_call_form(request: Request):
+    """Parse the Twilio webhook form and bind its CallSid to the current context"""
+    with stage_timer("form_parse"):
+        form_data = await request.form()
+    current_call_sid.set(form_data.get("CallSid"))
+    return form_data
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Record end-to-end latency per endpoint"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint, request.method, str(status))
+
+
+def is_admin(request: Request) -> bool:
+    """Check the X-Admin-Token header against the configured admin token"""
+    token = request.headers.get("X-Admin-Token")
+    if not settings.admin_token or not token:
+        return False
+    return hmac.compare_digest(token, settings.admin_token)
+
+
+def require_admin(request: Request):
+    """Reject requests that do not carry the admin token"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not is_admin(request):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """Profile a single request when an admin sends X-Profile: 1"""
+    if request.headers.get("X-Profile") != "1" or not is_admin(request):
+        return await call_next(request)
+    
+    # Sample only this request's tasks on the loop and the executor work they submit
+    tag = uuid.uuid4().hex
+    profiler = SamplingProfiler(
+        interval=settings.profiler_interval_ms / 1000.0,
+        name=f"{request.method} {request.url.path}",
+        tag=tag
+    )
+    token = current_profile.set(tag)
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profile = profiler.stop()
+        current_profile.reset(token)
+    response.headers["X-Profile-Id"] = request_profiles.put(profile)
+    return response
+
 
 def get_stt_engine() -> STTEngine:
     """Get or create STT engine"""
@@ -47,16 +167,44 @@ def get_stt_engine() -> STTEngine:
 def get_tts_engine() -> TTSEngine:
     """Get or create TTS engine"""
     global tts_engine
-    if tts_engine is None:
-        tts_engine = TTSEngine()
+    with tts_engine_lock:
+        if tts_engine is None:
+            tts_engine = TTSEngine()
     return tts_engine
 
 
-def get_twilio_client() -> Client:
+def get_fragment_synthesizer() -> Optional[FragmentSynthesizer]:
+    """Get or create the fragment synthesizer for templated prompts (None if TTS_FRAGMENTS is off)"""
+    global fragment_synthesizer
+    if fragment_synthesizer is None and settings.tts_fragments:
+        engine = get_tts_engine()
+        with tts_engine_lock:
+            if fragment_synthesizer is None:
+                fragment_synthesizer = FragmentSynthesizer(
+                    engine,
+                    max_entries=settings.tts_fragment_cache_size,
+                    crossfade_ms=settings.tts_crossfade_ms
+                )
+    return fragment_synthesizer
+
+
+def prerender_fragments():
+    """Render template fragments and slot vocabulary before the first confirmation needs them"""
+    fragments = get_fragment_synthesizer()
+    if fragments is None or not fragments.engine.available:
+        return
+    pack = LANGUAGE_PACKS.get(settings.tts_language, LANGUAGE_PACKS["en"])
+    templates = [value for value in pack.values() if isinstance(value, str) and "{" in value]
+    started = time.perf_counter()
+    rendered = fragments.prerender_templates(templates, settings.tts_language)
+    logger.info(f"Prerendered {rendered} prompt fragments in {time.perf_counter() - started:.1f}s")
+
+
+def get_twilio_client():
     """Get or create Twilio client"""
     global twilio_client
     if twilio_client is None:
-        twilio_client = Client(settings.twilio_account_sid, settings.twilio_auth_token)
+        twilio_client = twilio_rest.Client(settings.twilio_account_sid, settings.twilio_auth_token)
     return twilio_client
 
 
@@ -64,14 +212,67 @@ def get_twilio_client() -> Client:
 async def startup_event():
     """Initialize on startup"""
     logger.info("Initializing Voice AI Receptionist...")
+    attribute_loop(asyncio.get_running_loop())
     try:
         init_db()
+        init_search()
+        tenant_registry.refresh()
         logger.info("Database initialized")
     except Exception as e:
         logger.warning(f"Database initialization warning: {str(e)}")
+    init_generator()
+    init_recorder()
+    if settings.media_playback and synthesis_available() and settings.tts_fragments:
+        threading.Thread(target=prerender_fragments, name="tts-fragments", daemon=True).start()
+    if SQLALCHEMY_AVAILABLE and settings.tenant_reload_interval > 0:
+        asyncio.create_task(reload_tenants_periodically())
     logger.info("Voice AI Receptionist ready!")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Drop queued prompt synthesis and seal recordings still in progress"""
+    tts_executor.shutdown(wait=False, cancel_futures=True)
+    if call_recorder is not None:
+        call_recorder.shutdown()
+
+
+def init_recorder():
+    """Create the call recorder if CALL_RECORDING is on"""
+    global call_recorder
+    if not settings.call_recording or call_recorder is not None:
+        return
+    if not settings.public_base_url:
+        logger.warning("CALL_RECORDING needs PUBLIC_BASE_URL for the media stream URL; not recording")
+        return
+    call_recorder = CallRecorder(
+        settings.recording_dir,
+        segment_seconds=settings.recording_segment_seconds,
+        ring_seconds=settings.recording_ring_seconds,
+        spares=settings.recording_spare_segments
+    )
+    logger.info(f"Recording caller audio to {settings.recording_dir}")
+
+
+def media_stream_url() -> str:
+    """wss:// URL Twilio streams caller audio to"""
+    base = settings.public_base_url.rstrip("/")
+    if base.startswith("http"):
+        base = "ws" + base[len("http"):]  # https -> wss
+    return base + "/twilio/media-stream"
+
+
+async def reload_tenants_periodically():
+    """Pick up tenant changes without a restart; a no-op unless the version moved"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(settings.tenant_reload_interval)
+        try:
+            await loop.run_in_executor(None, tenant_registry.refresh)
+        except Exception as e:
+            logger.warning(f"Tenant reload failed: {str(e)}")
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -82,49 +283,229 @@ async def root():
             "incoming_call": "/twilio/incoming",
             "outgoing_call": "/call/outbound",
             "call_status": "/twilio/status",
-            "call_logs": "/logs"
+            "call_logs": "/logs",
+            "stats": "/stats",
+            "metrics": "/metrics"
         }
     }
 
 
+async def replay_or_handle(request: Request, form_data, render, media_type: str = "application/xml") -> Response:
+    """
+    Answer a webhook through the idempotency cache
+    
+    A Twilio retry of a request that was already handled gets the cached
+    response without running render() again.
+    """
+    key = (
+        form_data.get("CallSid") or "",
+        request_fingerprint(request.method, request.url.path, request.url.query, form_data.multi_items())
+    )
+    body = await webhook_responses.get_or_render(key, request.url.path, render)
+    return Response(content=body, media_type=media_type)
+
+
+def tenant_for_call(form_data) -> TenantConfig:
+    """Tenant that owns the call: the dialed number inbound, the caller ID outbound"""
+    direction = form_data.get("Direction") or "inbound"
+    number = form_data.get("From") if direction.startswith("outbound") else form_data.get("To")
+    return tenant_registry.resolve(number)
+
+
+def new_conversation(form_data) -> ConversationManager:
+    """Conversation state for a new call, detecting the caller's language if several are supported"""
+    return ConversationManager(tenant_for_call(form_data), SUPPORTED_LANGUAGES)
+
+
+def call_voice(conv_manager: ConversationManager) -> VoiceSettings:
+    """Voice and recognition language of a call, once its language is known"""
+    return voice_for(conv_manager.tenant, conv_manager.language or conv_manager.default_language)
+
+
+def speech_gather(turn: int, language: str = 'en-US', hints: Optional[DecodingHints] = None) -> Gather:
+    """Gather the caller's next utterance; the turn number makes each turn's request unique"""
+    options = {}
+    if hints is not None and hints.hotwords:
+        # Bias Twilio's recognizer toward the answer the caller was asked for
+        options["hints"] = ", ".join(hints.hotwords)
+    if settings.speculative_responses:
+        # Stream partial transcripts so the reply can be prepared early
+        options["partial_result_callback"] = '/twilio/partial-speech'
+        options["partial_result_callback_method"] = 'POST'
+    return Gather(
+        input='speech',
+        action=f'/twilio/process-speech?turn={turn}',
+        method='POST',
+        speech_timeout='auto',
+        language=language,
+        **options
+    )
+
+
+def render_hold(language: str, kind: str) -> str:
+    """
+    TwiML for a request shed under load
+    
+    A new call hears "please hold" and is retried after a pause; a speech
+    turn asks the caller to repeat once the system has caught up.
+    """
+    voice = LANGUAGE_VOICES.get(language, LANGUAGE_VOICES["en"])
+    pack = LANGUAGE_PACKS[language]
+    response = VoiceResponse()
+    if kind == "incoming":
+        response.say(pack["hold"], voice=voice.voice, language=voice.language)
+        response.pause(length=settings.admission_hold_seconds)
+        response.redirect('/twilio/incoming')
+    else:
+        response.pause(length=settings.admission_hold_seconds)
+        gather = Gather(input='speech', action='/twilio/process-speech', method='POST',
+                        speech_timeout='auto', language=voice.gather_language)
+        gather.say(pack["busy"], voice=voice.voice, language=voice.language)
+        response.append(gather)
+        response.redirect('/twilio/process-speech')
+    return str(response)
+
+
+# Rendered once, so shedding costs no more than a dict lookup
+HOLD_TWIML = {(code, kind): render_hold(code, kind) for code in LANGUAGE_PACKS for kind in ("incoming", "speech")}
+_reject = VoiceResponse()
+_reject.reject(reason="busy")
+REJECT_TWIML = str(_reject)
+
+
+def hold_response(form_data, kind: str) -> Response:
+    """The precomputed hold TwiML in the call's language"""
+    conv_manager = conversation_managers.get(form_data.get("CallSid"))
+    if conv_manager is not None:
+        language = conv_manager.language or conv_manager.default_language
+    else:
+        language = language_code(tenant_for_call(form_data).language)
+    body = HOLD_TWIML.get((language, kind)) or HOLD_TWIML[("en", kind)]
+    return Response(content=body, media_type="application/xml")
+
+
+async def admit_webhook(request: Request, form_data, kind: str, render) -> Response:
+    """Handle a webhook if the webhook tier has room, otherwise answer with hold TwiML"""
+    webhooks = admission_control["webhook"]
+    try:
+        await webhooks.acquire()
+    except Overloaded:
+        logger.warning(f"Shedding {kind} webhook for {form_data.get('CallSid')}")
+        return hold_response(form_data, kind)
+    try:
+        return await replay_or_handle(request, form_data, render)
+    finally:
+        webhooks.release()
+
+
+def media_url(media_id: str) -> str:
+    """URL Twilio fetches a stored prompt from"""
+    path = f"/media/{media_id}"
+    if settings.public_base_url:
+        return settings.public_base_url.rstrip("/") + path
+    return path
+
+
+def speak(response: VoiceResponse, text: str, voice: VoiceSettings):
+    """
+    Add a prompt to a TwiML response
+    
+    With MEDIA_PLAYBACK on, prompts in the local TTS model's language are
+    synthesized locally (once per distinct text) and played from /media.
+    Synthesis runs in the background: until a prompt's audio is ready, or
+    if synthesis fails, Twilio's <Say> reads it. Templated replies are
+    assembled from cached fragments (TTS_FRAGMENTS).
+    """
+    if settings.media_playback and synthesis_available() and language_code(voice.language) == settings.tts_language:
+        media_id = media_id_for(text, settings.tts_model, settings.tts_voice)
+        if media_store.lookup(media_id):
+            response.play(media_url(media_id))
+            return
+        media_store.schedule(media_id, lambda: synthesize_in_background(text), tts_executor)
+    response.say(text, voice=voice.voice, language=voice.language)
+
+
+def synthesize_in_background(text: str):
+    """Synthesize a prompt into the media store (runs in tts_executor)"""
+    engine = get_tts_engine()
+    if engine.available:
+        with stage_timer("tts"):
+            synthesize_prompt(media_store, engine, text, get_fragment_synthesizer())
+
+
+def render_turn_twiml(conv_manager: ConversationManager, ai_response: str) -> str:
+    """Render the TwiML that speaks a reply and continues or ends the call"""
+    voice = call_voice(conv_manager)
+    response = VoiceResponse()
+    speak(response, ai_response, voice)
+    
+    # Check if conversation is closing
+    if conv_manager.state.value == "closing":
+        speak(response, conv_manager.prompt("closing"), voice)
+        response.hangup()
+    else:
+        # Continue conversation
+        response.append(speech_gather(conv_manager.turn_count, voice.gather_language,
+                                      conv_manager.decoding_hints()))
+        response.redirect(f'/twilio/process-speech?turn={conv_manager.turn_count}')
+    return str(response)
+
+
 @app.post("/twilio/incoming")
 async def handle_incoming_call(request: Request):
     """
     Handle incoming phone calls from Twilio
     """
-    form_data = await request.form()
+    form_data = await read_call_form(request)
+    # Only the first webhook of a call counts against the caller's rate; Twilio's retries of it are free
+    if form_data.get("CallStatus") == "ringing" and not admission_control.callers.allow(
+            form_data.get("From"), form_data.get("CallSid")):
+        logger.warning(f"Rejecting call from {form_data.get('From')}: over the per-caller rate")
+        return Response(content=REJECT_TWIML, media_type="application/xml")
+    return await admit_webhook(request, form_data, "incoming", lambda: render_incoming_call(form_data))
+
+
+def render_incoming_call(form_data) -> str:
+    """Start a conversation and render the greeting TwiML"""
     call_sid = form_data.get("CallSid")
     from_number = form_data.get("From")
+    direction = call_direction(form_data.get("Direction"))
     
     logger.info(f"Incoming call from {from_number}, CallSid: {call_sid}")
     
     # Initialize conversation manager for this call
-    conversation_managers[call_sid] = ConversationManager()
-    
-    # Create TwiML response
-    response = VoiceResponse()
-    
-    # Get greeting message
-    greeting = conversation_managers[call_sid].get_greeting()
-    
-    # Use Twilio's built-in TTS (Say verb)
-    # This is more reliable for phone calls than local TTS
-    response.say(greeting, voice='alice', language='en-US')
-    
-    # Gather user input
-    gather = Gather(
-        input='speech',
-        action='/twilio/process-speech',
-        method='POST',
-        speech_timeout='auto',
-        language='en-US'
-    )
-    response.append(gather)
+    conv_manager = conversation_managers[call_sid] = new_conversation(form_data)
     
-    # If no input, redirect
-    response.redirect('/twilio/incoming')
-    
-    return Response(content=str(response), media_type="application/xml")
+    with stage_timer("twiml", direction, "greeting"):
+        # Create TwiML response
+        response = VoiceResponse()
+        
+        # Fork the caller's audio to the recorder once, on the call's first webhook
+        if call_recorder is not None and form_data.get("CallStatus") == "ringing":
+            call_recorder.expect(call_sid)
+            start = Start()
+            start.stream(url=media_stream_url(), track="inbound_track")
+            response.append(start)
+        
+        # Get greeting message
+        greeting = conv_manager.get_greeting()
+        
+        # Use Twilio's built-in TTS (Say verb)
+        # This is more reliable for phone calls than local TTS
+        voice = call_voice(conv_manager)
+        speak(response, greeting, voice)
+        # Offer the other languages, each in its own voice
+        for code in conv_manager.languages:
+            if code != conv_manager.default_language:
+                speak(response, LANGUAGE_PACKS[code]["language_offer"], voice_for(conv_manager.tenant, code))
+        
+        # Gather user input
+        response.append(speech_gather(0, voice.gather_language))
+        
+        # If no input, redirect
+        response.redirect('/twilio/incoming')
+        
+        return str(response)
 
 
 @app.post("/twilio/process-speech")
@@ -132,68 +513,118 @@ async def process_speech(request: Request):
     """
     Process user speech input
     """
-    form_data = await request.form()
+    form_data = await read_call_form(request)
+    return await admit_webhook(request, form_data, "speech", lambda: render_speech_response(form_data))
+
+
+def log_turn(call_sid: str, turn: str):
+    """Append a turn to the call's transcript and search index (runs in a worker thread)"""
+    with write_session() as db:
+        if db:
+            call_log = db.query(CallLog).filter(CallLog.call_sid == call_sid).first()
+            if call_log:
+                call_log.transcript = f"{call_log.transcript}\n{turn}"
+            search_backend = get_search_backend()
+            if search_backend:
+                search_backend.index_turn(db, call_sid, turn)
+            db.commit()
+
+
+async def render_speech_response(form_data) -> str:
+    """Run one conversation turn and render the reply TwiML"""
     call_sid = form_data.get("CallSid")
     speech_result = form_data.get("SpeechResult", "")
     confidence = form_data.get("Confidence", "0")
+    direction = call_direction(form_data.get("Direction"))
     
     logger.info(f"Processing speech for call {call_sid}: {speech_result}")
     
-    response = VoiceResponse()
-    
     if call_sid not in conversation_managers:
-        conversation_managers[call_sid] = ConversationManager()
+        conversation_managers[call_sid] = new_conversation(form_data)
     
     conv_manager = conversation_managers[call_sid]
+    twiml = None
+    
+    generator = get_generator()
     
     # Process user input
     try:
-        ai_response = conv_manager.process_user_input(speech_result)
+        speculation = speculations.take(call_sid, conv_manager, speech_result)
+        if speculation and not (generator and speculation.manager.unhandled
+                                and speculation.manager.language in generator.languages):
+            # Prepared from a matching partial result; adopt it as this turn
+            conv_manager = conversation_managers[call_sid] = speculation.manager
+            ai_response, twiml = speculation.response, speculation.twiml
+        else:
+            with stage_timer("nlu", direction, conv_manager.state.value):
+                ai_response = conv_manager.process_user_input(speech_result)
+        state = conv_manager.state.value
+        
+        if generator and conv_manager.language in generator.languages:
+            generated = None
+            if conv_manager.unhandled:
+                # Outside the scripted flows; try the generator within the turn budget
+                try:
+                    async with admission_control["generate"]:
+                        with stage_timer("generate", direction, state):
+                            generated = await generator.generate(
+                                call_sid, conv_manager.tenant, speech_result, settings.generator_budget_ms / 1000.0
+                            )
+                except Overloaded:
+                    # Saturated; the scripted reply is good enough
+                    pass
+            if generated:
+                ai_response = generated
+            else:
+                generator.record_turn(call_sid, conv_manager.tenant, speech_result, ai_response)
         
-        # Log conversation
+        # Log conversation off the event loop, unless the database is saturated
         if SQLALCHEMY_AVAILABLE:
             try:
-                db = next(get_db())
-                if db:
-                    call_log = db.query(CallLog).filter(CallLog.call_sid == call_sid).first()
-                    if call_log:
-                        call_log.transcript = f"{call_log.transcript}\nUser: {speech_result}\nAI: {ai_response}"
-                        db.commit()
+                async with admission_control["db"]:
+                    with stage_timer("db", direction, state):
+                        await asyncio.get_running_loop().run_in_executor(
+                            None, log_turn, call_sid, f"User: {speech_result}\nAI: {ai_response}"
+                        )
+            except Overloaded:
+                logger.warning(f"Skipped transcript turn for {call_sid}: database saturated")
             except Exception as e:
                 logger.warning(f"Database logging failed: {str(e)}")
         
         # Respond to user
-        response.say(ai_response, voice='alice', language='en-US')
-        
-        # Check if conversation is closing
-        if conv_manager.state.value == "closing":
-            response.say("Thank you for calling. Goodbye!")
-            response.hangup()
-        else:
-            # Continue conversation
-            gather = Gather(
-                input='speech',
-                action='/twilio/process-speech',
-                method='POST',
-                speech_timeout='auto',
-                language='en-US'
-            )
-            response.append(gather)
-            response.redirect('/twilio/process-speech')
+        if twiml is None:
+            with stage_timer("twiml", direction, state):
+                twiml = render_turn_twiml(conv_manager, ai_response)
     
     except Exception as e:
         logger.error(f"Error processing speech: {str(e)}")
-        response.say("I'm sorry, I didn't catch that. Could you please repeat?")
-        gather = Gather(
-            input='speech',
-            action='/twilio/process-speech',
-            method='POST',
-            speech_timeout='auto',
-            language='en-US'
-        )
-        response.append(gather)
+        response = VoiceResponse()
+        voice = call_voice(conv_manager)
+        speak(response, conv_manager.prompt("repeat"), voice)
+        response.append(speech_gather(conv_manager.turn_count, voice.gather_language))
+        twiml = str(response)
     
-    return Response(content=str(response), media_type="application/xml")
+    return twiml
+
+
+@app.post("/twilio/partial-speech")
+async def partial_speech(request: Request):
+    """
+    Prepare the next reply from a Gather partial result
+    """
+    form_data = await read_call_form(request)
+    call_sid = form_data.get("CallSid")
+    partial = form_data.get("UnstableSpeechResult") or form_data.get("StableSpeechResult")
+    conv_manager = conversation_managers.get(call_sid)
+    # Speculation is an optimization; skip it when the webhook tier is busy
+    if conv_manager is not None and partial and not admission_control["webhook"].saturated:
+        direction = call_direction(form_data.get("Direction"))
+        try:
+            with stage_timer("speculation", direction, conv_manager.state.value):
+                speculations.prepare(call_sid, conv_manager, partial, render_turn_twiml)
+        except Exception as e:
+            logger.warning(f"Speculative turn failed for {call_sid}: {str(e)}")
+    return PlainTextResponse("")
 
 
 @app.post("/twilio/status")
@@ -201,43 +632,156 @@ async def call_status(request: Request):
     """
     Handle call status updates from Twilio
     """
-    form_data = await request.form()
+    form_data = await read_call_form(request)
+    return await replay_or_handle(request, form_data, lambda: apply_call_status(form_data), "text/plain")
+
+
+def log_call_status(call_sid: str, call_status: str, duration: str, from_number: str):
+    """Update (or create) a call's log with its latest status (runs in a worker thread)"""
+    with write_session() as db:
+        if db:
+            call_log = db.query(CallLog).filter(CallLog.call_sid == call_sid).first()
+            
+            if call_log:
+                old_status, old_duration = call_log.status, call_log.duration
+                call_log.status = call_status
+                call_log.duration = float(duration) if duration else 0.0
+                rollups.record_call(db, call_log, old_status, old_duration)
+                db.commit()
+            else:
+                # Create new call log
+                call_log = CallLog(
+                    call_sid=call_sid,
+                    phone_number=from_number,
+                    direction="inbound",
+                    status=call_status,
+                    duration=float(duration) if duration else 0.0
+                )
+                db.add(call_log)
+                rollups.record_call(db, call_log, is_new=True)
+                db.commit()
+
+
+async def apply_call_status(form_data) -> str:
+    """Record a call status update"""
     call_sid = form_data.get("CallSid")
     call_status = form_data.get("CallStatus")
+    direction = call_direction(form_data.get("Direction"))
     duration = form_data.get("CallDuration", "0")
     
     logger.info(f"Call status update: {call_sid} - {call_status}")
     
-    # Update call log
+    # Update call log off the event loop, unless the database is saturated
     if SQLALCHEMY_AVAILABLE:
         try:
-            db = next(get_db())
-            if db:
-                call_log = db.query(CallLog).filter(CallLog.call_sid == call_sid).first()
-                
-                if call_log:
-                    call_log.status = call_status
-                    call_log.duration = float(duration) if duration else 0.0
-                    db.commit()
-                else:
-                    # Create new call log
-                    call_log = CallLog(
-                        call_sid=call_sid,
-                        phone_number=form_data.get("From", ""),
-                        direction="inbound",
-                        status=call_status,
-                        duration=float(duration) if duration else 0.0
+            async with admission_control["db"]:
+                with stage_timer("db", direction):
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, log_call_status, call_sid, call_status, duration, form_data.get("From", "")
                     )
-                    db.add(call_log)
-                    db.commit()
+        except Overloaded:
+            logger.warning(f"Skipped status update for {call_sid}: database saturated")
         except Exception as e:
             logger.warning(f"Database update failed: {str(e)}")
     
     # Clean up conversation manager
     if call_sid in conversation_managers:
         del conversation_managers[call_sid]
+    if call_recorder is not None:
+        call_recorder.close(call_sid)
+    speculations.discard(call_sid)
+    if get_generator():
+        get_generator().forget(call_sid)
     
-    return PlainTextResponse("OK")
+    return "OK"
+
+
+@app.websocket("/twilio/media-stream")
+async def media_stream(websocket: WebSocket):
+    """
+    Receive a call's forked inbound audio (Twilio Media Streams) and record it
+    
+    Only streams this server requested in the incoming-call TwiML are
+    recorded; any other connection is closed. Appending a frame only
+    copies it into memory-mapped storage.
+    """
+    await websocket.accept()
+    recording = None
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            event = message.get("event")
+            if event == "media":
+                if recording is not None:
+                    recording.append(base64.b64decode(message["media"]["payload"]))
+            elif event == "start":
+                call_sid = str(message.get("start", {}).get("callSid", ""))
+                if call_recorder is None or not call_recorder.claim(call_sid):
+                    logger.warning(f"Refusing media stream for unexpected call {call_sid[:40]!r}")
+                    await websocket.close(code=1008)
+                    return
+                # Opening may have to allocate a segment file
+                recording = await asyncio.get_running_loop().run_in_executor(None, call_recorder.open, call_sid)
+            elif event == "stop":
+                break
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if recording is not None:
+            call_recorder.close(recording.call_sid)
+
+
+@app.get("/recordings/{call_sid}")
+async def get_recording(request: Request, call_sid: str):
+    """Download a call's recorded caller audio as WAV (admin only)"""
+    require_admin(request)
+    if call_recorder is None:
+        raise HTTPException(status_code=404, detail="Call recording is disabled")
+    data = call_recorder.index.wav(call_sid)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    return Response(content=data, media_type="audio/wav")
+
+
+@app.api_route("/media/{media_id}", methods=["GET", "HEAD"])
+async def get_media(request: Request, media_id: str):
+    """
+    Serve a synthesized prompt
+    
+    Files are immutable and named by content hash, so the hash is a strong
+    ETag and clients may cache them indefinitely. Range requests are
+    supported, and the file is handed to the server with sendfile when
+    the ASGI server supports it.
+    """
+    if media_id.endswith(".wav"):
+        media_id = media_id[:-4]
+    path = media_store.path_for(media_id)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Media not found")
+    
+    etag = f'"{media_id}"'
+    headers = {
+        "etag": etag,
+        "cache-control": f"public, max-age={settings.media_cache_max_age}, immutable"
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=MEDIA_TYPE, headers=headers)
+
+
+def log_outbound_call(call_sid: str, phone_number: str):
+    """Create the log of a call placed through /call/outbound (runs in a worker thread)"""
+    with write_session() as db:
+        call_log = CallLog(
+            call_sid=call_sid,
+            phone_number=phone_number,
+            direction="outbound",
+            status="initiated"
+        )
+        db.add(call_log)
+        rollups.record_call(db, call_log, is_new=True)
+        db.commit()
 
 
 @app.post("/call/outbound")
@@ -261,26 +805,23 @@ async def make_outbound_call(
         
         logger.info(f"Making outbound call to {phone_number}")
         
-        call = twilio.calls.create(
+        # The Twilio client and the database both block; keep them off the event loop
+        loop = asyncio.get_running_loop()
+        call = await loop.run_in_executor(None, functools.partial(
+            twilio.calls.create,
             to=phone_number,
             from_=settings.twilio_phone_number,
             url=twiml_url,
             method='POST'
-        )
+        ))
         
-        # Log the call
+        # Log the call, unless the database is saturated
         if SQLALCHEMY_AVAILABLE:
             try:
-                db = next(get_db())
-                if db:
-                    call_log = CallLog(
-                        call_sid=call.sid,
-                        phone_number=phone_number,
-                        direction="outbound",
-                        status="initiated"
-                    )
-                    db.add(call_log)
-                    db.commit()
+                async with admission_control["db"]:
+                    await loop.run_in_executor(None, log_outbound_call, call.sid, phone_number)
+            except Overloaded:
+                logger.warning(f"Skipped logging outbound call {call.sid}: database saturated")
             except Exception as e:
                 logger.warning(f"Database logging failed: {str(e)}")
         
@@ -301,22 +842,17 @@ async def handle_outbound_call(request: Request):
     """
     Handle outbound call flow
     """
-    form_data = await request.form()
+    form_data = await read_call_form(request)
     call_sid = form_data.get("CallSid")
     
     logger.info(f"Handling outbound call: {call_sid}")
     
+    tenant = tenant_for_call(form_data)
+    voice = voice_for(tenant, language_code(tenant.language))
     response = VoiceResponse()
-    response.say("Hello! This is an automated call. How can I help you today?", voice='alice')
+    speak(response, "Hello! This is an automated call. How can I help you today?", voice)
     
-    gather = Gather(
-        input='speech',
-        action='/twilio/process-speech',
-        method='POST',
-        speech_timeout='auto',
-        language='en-US'
-    )
-    response.append(gather)
+    response.append(speech_gather(0, voice.gather_language))
     
     return Response(content=str(response), media_type="application/xml")
 
@@ -355,6 +891,47 @@ async def get_call_logs(skip: int = 0, limit: int = 100):
         return {"total": 0, "logs": [], "error": str(e)}
 
 
+@app.get("/logs/search")
+async def search_call_logs(q: str, limit: int = 20, offset: int = 0):
+    """
+    Full-text search over call transcripts
+    
+    Args:
+        q: Search terms; use "double quotes" for phrases and a trailing * for prefixes
+        limit: Maximum number of calls to return
+        offset: Number of results to skip
+    """
+    if not SQLALCHEMY_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Database not available")
+    
+    try:
+        db = next(get_db())
+        if not db:
+            raise HTTPException(status_code=503, detail="Database not available")
+        hits, total = get_search_backend().search(db, q, limit=min(limit, 100), offset=offset)
+        calls = {
+            log.call_sid: log
+            for log in db.query(CallLog).filter(CallLog.call_sid.in_([hit["call_sid"] for hit in hits]))
+        }
+        results = []
+        for hit in hits:
+            log = calls.get(hit["call_sid"])
+            results.append({
+                "call_sid": hit["call_sid"],
+                "rank": hit["rank"],
+                "snippet": hit["snippet"],
+                "phone_number": log.phone_number if log else None,
+                "direction": log.direction if log else None,
+                "created_at": log.created_at.isoformat() if log and log.created_at else None
+            })
+        return {"query": q, "total": total, "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching call logs: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/logs/{call_sid}")
 async def get_call_log(call_sid: str):
     """
@@ -369,7 +946,21 @@ async def get_call_log(call_sid: str):
             raise HTTPException(status_code=503, detail="Database not available")
         log = db.query(CallLog).filter(CallLog.call_sid == call_sid).first()
         if not log:
-            raise HTTPException(status_code=404, detail="Call log not found")
+            # Older calls live in the compressed archive
+            archived = retention.get_archived_call(db, call_sid)
+            if archived is None:
+                raise HTTPException(status_code=404, detail="Call log not found")
+            return {
+                "id": None,
+                **{field: archived.get(field) for field in ("call_sid", "phone_number", "direction",
+                                                            "status", "duration", "transcript", "created_at")},
+                "archived": True
+            }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting call log: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
     
     return {
         "id": log.id,
@@ -383,6 +974,114 @@ async def get_call_log(call_sid: str):
     }
 
 
+@app.post("/admin/profile")
+async def capture_profile(request: Request, seconds: float = 10.0, format: str = "collapsed"):
+    """
+    Sample every thread in this worker for the given number of seconds
+    
+    Args:
+        seconds: Capture length, capped by settings.profiler_max_seconds
+        format: "collapsed" or "speedscope"
+    """
+    require_admin(request)
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'speedscope'")
+    if not capture_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profile capture is already running")
+    
+    interval = settings.profiler_interval_ms / 1000.0
+    try:
+        profiler = SamplingProfiler(interval=interval, name="worker")
+        profiler.start()
+        try:
+            await asyncio.sleep(max(0.0, min(seconds, settings.profiler_max_seconds)))
+        finally:
+            profile = profiler.stop()
+    finally:
+        capture_lock.release()
+    
+    logger.info(f"Captured profile: {profile.samples} samples over {profile.duration:.1f}s")
+    output = render_profile(profile, format, interval)
+    if format == "speedscope":
+        return JSONResponse(output)
+    return PlainTextResponse(output)
+
+
+@app.get("/admin/profile/{profile_id}")
+async def get_request_profile(request: Request, profile_id: str, format: str = "collapsed"):
+    """
+    Fetch a per-request profile captured via the X-Profile header
+    """
+    require_admin(request)
+    profile = request_profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    try:
+        output = render_profile(profile, format, settings.profiler_interval_ms / 1000.0)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "speedscope":
+        return JSONResponse(output)
+    return PlainTextResponse(output)
+
+
+@app.post("/admin/tenants/reload")
+async def reload_tenants(request: Request):
+    """
+    Reload tenant configuration now instead of waiting for the next poll
+    """
+    require_admin(request)
+    if not SQLALCHEMY_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Database not available")
+    changed = await asyncio.get_running_loop().run_in_executor(None, tenant_registry.refresh)
+    return {"changed": changed, "tenants": len(tenant_registry), "version": tenant_registry.version}
+
+
+@app.get("/stats")
+async def get_call_stats(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    granularity: str = "hour",
+    direction: Optional[str] = None,
+    status: Optional[str] = None
+):
+    """
+    Call volume, duration and completion statistics from rollups
+    
+    Args:
+        start: Range start (default: 24 hours before end)
+        end: Range end (default: now)
+        granularity: "hour" or "day"
+        direction: Optional direction filter ("inbound" or "outbound")
+        status: Optional status filter
+    """
+    if not SQLALCHEMY_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Database not available")
+    if granularity not in rollups.GRANULARITIES:
+        raise HTTPException(status_code=400, detail="granularity must be 'hour' or 'day'")
+    
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=1)
+    try:
+        db = next(get_db())
+        if not db:
+            raise HTTPException(status_code=503, detail="Database not available")
+        return rollups.query_stats(db, start, end, granularity, direction, status)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting call stats: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus metrics for request and pipeline stage latency
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host=settings.host, port=settings.port)
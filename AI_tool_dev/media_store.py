@@ -0,0 +1,183 @@
+"""
+Content-addressed store of synthesized call audio
+
+Prompts are synthesized once, encoded once as 8 kHz μ-law WAV (what
+Twilio plays without transcoding) and written under a name derived from
+a hash of everything that determines the audio: TTS model, speaker and
+text. Identical prompts therefore map to the same immutable file, which
+/media/{media_id} serves with a strong ETag and a long-lived
+Cache-Control header.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import Executor
+from typing import Callable, Dict, Optional, Set
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+MEDIA_REQUESTS = registry.counter(
+    "voice_ai_media_store_total",
+    "Synthesized prompt lookups by result",
+    ("result",)
+)
+
+MEDIA_EXTENSION = ".wav"
+MEDIA_TYPE = "audio/wav"
+
+_MEDIA_ID = re.compile(r"^[0-9a-f]{64}$")
+
+
+def media_id_for(text: str, model: str, speaker: str) -> str:
+    """Content address of a prompt: hash of model, speaker and text"""
+    digest = hashlib.sha256()
+    for part in (model, speaker, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class MediaStore:
+    """Immutable audio files on disk, keyed by content address"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._scheduled: Set[str] = set()
+
+    def path_for(self, media_id: str) -> Optional[str]:
+        """
+        File path of a media id, or None if the id is malformed
+
+        Files are fanned out over 256 directories by the first two hex
+        digits so no directory grows too large.
+        """
+        if not _MEDIA_ID.match(media_id):
+            return None
+        return os.path.join(self.root, media_id[:2], media_id + MEDIA_EXTENSION)
+
+    def exists(self, media_id: str) -> bool:
+        path = self.path_for(media_id)
+        return path is not None and os.path.exists(path)
+
+    def put(self, media_id: str, data: bytes):
+        """Write a file atomically so readers never see a partial file"""
+        path = self.path_for(media_id)
+        if path is None:
+            raise ValueError(f"Invalid media id: {media_id}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def lookup(self, media_id: str) -> bool:
+        """True if a media file is ready; counted as a hit"""
+        if self.exists(media_id):
+            MEDIA_REQUESTS.inc("hit")
+            return True
+        return False
+
+    def schedule(self, media_id: str, create: Callable[[], object], executor: Executor) -> bool:
+        """
+        Create a missing media file in the background
+
+        A prompt asked for again while its job is queued or running is not
+        queued a second time.
+
+        Args:
+            media_id: Content address
+            create: Writes the file, e.g. through synthesize_prompt()
+            executor: Runs create()
+
+        Returns:
+            True if a job was queued
+        """
+        with self._locks_guard:
+            if media_id in self._scheduled:
+                return False
+            self._scheduled.add(media_id)
+
+        def run():
+            try:
+                create()
+            except Exception as e:
+                logger.warning(f"Background synthesis of {media_id} failed: {str(e)}")
+            finally:
+                with self._locks_guard:
+                    self._scheduled.discard(media_id)
+
+        try:
+            executor.submit(run)
+        except RuntimeError:
+            # Executor shut down
+            with self._locks_guard:
+                self._scheduled.discard(media_id)
+            return False
+        return True
+
+    def get_or_create(self, media_id: str, render: Callable[[], bytes]) -> str:
+        """
+        Ensure a media file exists, rendering it at most once
+
+        Concurrent requests for the same prompt wait for the first one
+        instead of synthesizing it again.
+
+        Args:
+            media_id: Content address
+            render: Produces the encoded file bytes on a miss
+
+        Returns:
+            The media id
+        """
+        if self.exists(media_id):
+            MEDIA_REQUESTS.inc("hit")
+            return media_id
+        with self._locks_guard:
+            lock = self._locks.setdefault(media_id, threading.Lock())
+        try:
+            with lock:
+                if self.exists(media_id):
+                    MEDIA_REQUESTS.inc("hit")
+                    return media_id
+                MEDIA_REQUESTS.inc("miss")
+                self.put(media_id, render())
+                return media_id
+        finally:
+            with self._locks_guard:
+                self._locks.pop(media_id, None)
+
+
+def synthesize_prompt(store: MediaStore, tts_engine, text: str, fragments=None) -> str:
+    """
+    Synthesize a prompt into the store (or find it there)
+
+    Args:
+        store: Media store
+        tts_engine: TTSEngine used on a miss
+        text: Prompt text
+        fragments: FragmentSynthesizer that assembles templated prompts
+            (conversation_flow.TemplatedText) on a miss instead of
+            synthesizing them whole
+
+    Returns:
+        Media id of the prompt's audio
+    """
+    from audio_codec import encode_mulaw_wav
+    media_id = media_id_for(text, tts_engine.model_name, tts_engine.voice)
+    if fragments is not None and getattr(text, "template", None):
+        return store.get_or_create(
+            media_id, lambda: encode_mulaw_wav(fragments.render_mulaw(text.template, text.slots))
+        )
+    return store.get_or_create(media_id, lambda: encode_mulaw_wav(tts_engine.synthesize_to_mulaw(text)))
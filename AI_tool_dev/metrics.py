@@ -0,0 +1,252 @@
+"""
+Lightweight latency metrics with Prometheus text exposition
+"""
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond stages up to slow STT calls
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# CallSid of the call being handled, visible to everything below the handler
+current_call_sid: ContextVar[Optional[str]] = ContextVar("current_call_sid", default=None)
+
+
+class CallSidFilter(logging.Filter):
+    """Stamps log records with the current call's CallSid, for %(call_sid)s in log formats"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.call_sid = current_call_sid.get() or "-"
+        return True
+
+
+def _escape(value: str) -> str:
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_float(value: float) -> str:
+    """Format a float the way Prometheus expects"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        """Increment the counter for the given label values"""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        """Current value for the given label values"""
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> List[str]:
+        """Render the counter in Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, label_values))
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}{suffix} {_format_float(value)}")
+        return lines
+
+
+class Gauge:
+    """Current value keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values: str):
+        """Set the gauge for the given label values"""
+        with self._lock:
+            self._values[label_values] = float(value)
+
+    def value(self, *label_values: str) -> float:
+        """Current value for the given label values"""
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> List[str]:
+        """Render the gauge in Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, label_values))
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}{suffix} {_format_float(value)}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram keyed by label values"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        """
+        Record one observation
+
+        Args:
+            value: Observed value (seconds for latency histograms)
+            label_values: Values for each label name, in order
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [0.0] * (len(self.buckets) + 2)
+                self._series[label_values] = series
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *label_values: str) -> int:
+        """Number of observations for the given label values"""
+        series = self._series.get(label_values)
+        return int(sum(series[:-1])) if series else 0
+
+    def render(self) -> List[str]:
+        """Render the histogram in Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+
+        for label_values, series in items:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, label_values))
+            prefix = f"{base}," if base else ""
+            cumulative = 0.0
+            for upper, bucket_count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{_format_float(upper)}"}} {int(cumulative)}')
+            suffix = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {_format_float(series[-1])}")
+            lines.append(f"{self.name}_count{suffix} {int(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, *args, **kwargs)
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Counter:
+        """Get or create a counter"""
+        return self._get_or_create(Counter, name, help_text, label_names)
+
+    def gauge(self, name: str, help_text: str, label_names: Sequence[str] = ()) -> Gauge:
+        """Get or create a gauge"""
+        return self._get_or_create(Gauge, name, help_text, label_names)
+
+    def histogram(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram"""
+        return self._get_or_create(Histogram, name, help_text, label_names, buckets)
+
+    def render(self) -> str:
+        """Render every registered metric in Prometheus text format"""
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.histogram(
+    "voice_ai_request_duration_seconds",
+    "End-to-end HTTP request latency by endpoint",
+    ("endpoint", "method", "status")
+)
+STAGE_LATENCY = registry.histogram(
+    "voice_ai_stage_duration_seconds",
+    "Latency of individual call pipeline stages",
+    ("stage", "direction", "state")
+)
+
+
+def call_direction(raw: Optional[str]) -> str:
+    """Collapse Twilio's Direction values (inbound, outbound-api, outbound-dial) to inbound/outbound"""
+    if raw and raw.startswith("outbound"):
+        return "outbound"
+    return "inbound"
+
+
+class StageTimer:
+    """
+    Context manager timing one pipeline stage
+
+    Labels can be updated inside the block (e.g. once the conversation state
+    is known) and are read when the block exits.
+    """
+
+    __slots__ = ("stage", "direction", "state", "_start")
+
+    def __init__(self, stage: str, direction: str = "inbound", state: str = "none"):
+        self.stage = stage
+        self.direction = direction
+        self.state = state
+        self._start = 0.0
+
+    def __enter__(self) -> "StageTimer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        STAGE_LATENCY.observe(time.perf_counter() - self._start, self.stage, self.direction, self.state)
+        return False
+
+
+def stage_timer(stage: str, direction: str = "inbound", state: str = "none") -> StageTimer:
+    """
+    Time a pipeline stage
+
+    Args:
+        stage: Stage name (form_parse, nlu, db, twiml, ...)
+        direction: Call direction label
+        state: Conversation state label
+
+    Returns:
+        StageTimer context manager
+    """
+    return StageTimer(stage, direction, state)
@@ -0,0 +1,190 @@
+"""
+Phone number normalization to E.164, single and batch
+"""
+import logging
+from enum import IntEnum
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PhoneError(IntEnum):
+    """Per-number normalization result codes"""
+    OK = 0
+    EMPTY = 1
+    INVALID_CHARACTERS = 2
+    UNKNOWN_COUNTRY_CODE = 3
+    TOO_SHORT = 4
+    TOO_LONG = 5
+    UNKNOWN_REGION = 6
+
+
+# Region -> (country calling code, trunk prefix, min national length, max national length)
+COUNTRY_RULES: Dict[str, Tuple[str, str, int, int]] = {
+    "US": ("1", "1", 10, 10), "CA": ("1", "1", 10, 10),
+    "GB": ("44", "0", 9, 10), "IE": ("353", "0", 7, 9),
+    "FR": ("33", "0", 9, 9), "DE": ("49", "0", 6, 13),
+    "ES": ("34", "", 9, 9), "PT": ("351", "", 9, 9),
+    "IT": ("39", "", 6, 11), "NL": ("31", "0", 9, 9),
+    "BE": ("32", "0", 8, 9), "CH": ("41", "0", 9, 9),
+    "AT": ("43", "0", 4, 13), "SE": ("46", "0", 7, 9),
+    "NO": ("47", "", 8, 8), "DK": ("45", "", 8, 8),
+    "FI": ("358", "0", 5, 12), "PL": ("48", "", 9, 9),
+    "GR": ("30", "", 10, 10), "RU": ("7", "8", 10, 10),
+    "UA": ("380", "0", 9, 9), "TR": ("90", "0", 10, 10),
+    "IL": ("972", "0", 8, 9), "AE": ("971", "0", 8, 9),
+    "SA": ("966", "0", 9, 9), "EG": ("20", "0", 9, 10),
+    "ZA": ("27", "0", 9, 9), "NG": ("234", "0", 8, 10),
+    "KE": ("254", "0", 9, 9), "IN": ("91", "0", 10, 10),
+    "PK": ("92", "0", 9, 10), "BD": ("880", "0", 8, 10),
+    "CN": ("86", "0", 9, 11), "HK": ("852", "", 8, 8),
+    "JP": ("81", "0", 9, 10), "KR": ("82", "0", 8, 10),
+    "SG": ("65", "", 8, 8), "MY": ("60", "0", 8, 10),
+    "TH": ("66", "0", 8, 9), "VN": ("84", "0", 9, 10),
+    "PH": ("63", "0", 8, 10), "ID": ("62", "0", 8, 12),
+    "AU": ("61", "0", 9, 9), "NZ": ("64", "0", 8, 10),
+    "MX": ("52", "", 10, 10), "BR": ("55", "0", 10, 11),
+    "AR": ("54", "0", 10, 11), "CO": ("57", "", 10, 10),
+    "CL": ("56", "", 9, 9), "PE": ("51", "", 8, 9),
+}
+
+# Formatting characters removed before parsing
+_STRIP_TABLE = str.maketrans("", "", " -().\t/")
+# The optional trunk prefix some countries write in international numbers: +44 (0)20 ...
+_TRUNK_HINT = "(0)"
+
+_TERMINAL = ""
+
+
+def _build_trie() -> Dict:
+    """Build a digit trie over calling codes; leaves hold (cc, min, max, trunk)"""
+    trie: Dict = {}
+    for code, trunk, min_length, max_length in COUNTRY_RULES.values():
+        node = trie
+        for digit in code:
+            node = node.setdefault(digit, {})
+        # Regions sharing a code (US/CA) share one rule
+        node[_TERMINAL] = (code, min_length, max_length, trunk)
+    return trie
+
+
+_CALLING_CODE_TRIE = _build_trie()
+
+
+def match_calling_code(digits: str):
+    """
+    Find the country calling code at the start of an international number
+
+    Calling codes are prefix-free, so the first terminal node is the match.
+
+    Args:
+        digits: Digits after the "+"
+
+    Returns:
+        (code, min length, max length, trunk prefix) or None
+    """
+    node = _CALLING_CODE_TRIE
+    for digit in digits[:3]:
+        node = node.get(digit)
+        if node is None:
+            return None
+        rule = node.get(_TERMINAL)
+        if rule is not None:
+            return rule
+    return None
+
+
+def _check_length(code: str, national: str, min_length: int, max_length: int):
+    if len(national) < min_length:
+        return None, PhoneError.TOO_SHORT
+    if len(national) > max_length:
+        return None, PhoneError.TOO_LONG
+    return f"+{code}{national}", PhoneError.OK
+
+
+@lru_cache(maxsize=65536)
+def normalize(phone: Optional[str], default_region: Optional[str] = None) -> Tuple[Optional[str], PhoneError]:
+    """
+    Normalize a phone number to E.164
+
+    Args:
+        phone: Phone number in any common format
+        default_region: Region for numbers without a country code
+            (default: settings.default_region)
+
+    Returns:
+        (E.164 string or None, PhoneError)
+    """
+    if not phone:
+        return None, PhoneError.EMPTY
+    text = phone.strip().replace(_TRUNK_HINT, "").translate(_STRIP_TABLE)
+    if not text:
+        return None, PhoneError.EMPTY
+
+    region = (default_region or settings.default_region).upper()
+    home = COUNTRY_RULES.get(region)
+
+    international = text.startswith("+")
+    if international:
+        text = text[1:]
+    if not (text.isascii() and text.isdigit()):
+        return None, PhoneError.INVALID_CHARACTERS
+
+    # International dialling prefixes: 011 inside NANP, 00 almost everywhere else
+    if not international and home is not None:
+        if home[0] == "1" and text.startswith("011"):
+            text, international = text[3:], True
+        elif home[0] != "1" and text.startswith("00"):
+            text, international = text[2:], True
+
+    if international:
+        rule = match_calling_code(text)
+        if rule is None:
+            return None, PhoneError.UNKNOWN_COUNTRY_CODE
+        code, min_length, max_length, _ = rule
+        return _check_length(code, text[len(code):], min_length, max_length)
+
+    if home is None:
+        return None, PhoneError.UNKNOWN_REGION
+    code, trunk, min_length, max_length = home
+    if len(text) > max_length and text.startswith(code):
+        # Country code dialled without "+", e.g. 15551234567 in the US
+        text = text[len(code):]
+    elif trunk and text.startswith(trunk) and len(text) > min_length:
+        text = text[len(trunk):]
+    return _check_length(code, text, min_length, max_length)
+
+
+def normalize_batch(phones: Sequence[Optional[str]], default_region: Optional[str] = None):
+    """
+    Normalize many phone numbers at once
+
+    Repeated inputs (very common in contact imports) are parsed once:
+    values are de-duplicated with NumPy, each unique value goes through the
+    cached single-number path, and results are scattered back by index.
+
+    Args:
+        phones: List or NumPy array of phone number strings
+        default_region: Region for numbers without a country code
+
+    Returns:
+        (object array of E.164 strings or None, uint8 array of PhoneError codes)
+    """
+    import numpy as np
+
+    values = np.asarray(phones, dtype=object)
+    if values.size == 0:
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.uint8)
+    values = np.where(values == None, "", values).astype(str)  # noqa: E711
+    unique, inverse = np.unique(values, return_inverse=True)
+
+    unique_e164 = np.empty(len(unique), dtype=object)
+    unique_errors = np.empty(len(unique), dtype=np.uint8)
+    for i, value in enumerate(unique.tolist()):
+        unique_e164[i], unique_errors[i] = normalize(value, default_region)
+
+    inverse = inverse.reshape(-1)
+    return unique_e164[inverse], unique_errors[inverse]
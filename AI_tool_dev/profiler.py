@@ -0,0 +1,272 @@
+"""
+On-demand sampling profiler with collapsed-stack and speedscope output
+"""
+import asyncio
+import collections
+import contextvars
+import logging
+import sys
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (function name, file name, first line) for one frame
+FrameKey = Tuple[str, str, int]
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# Tag of the profiled request the current work belongs to
+current_profile: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_profile", default=None)
+# Executor thread id -> tag of the task it is running, while the task runs
+_thread_profiles: Dict[int, str] = {}
+# Event loop thread id -> loop, for loops whose tasks are attributed
+_loops: Dict[int, asyncio.AbstractEventLoop] = {}
+# Task -> tag it was created under
+_task_profiles: "weakref.WeakKeyDictionary[asyncio.Task, str]" = weakref.WeakKeyDictionary()
+
+
+class Profile:
+    """Aggregated stack samples from one profiling session"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stacks: collections.Counter = collections.Counter()
+        self.samples = 0
+        self.duration = 0.0
+
+    def add(self, stack: Tuple[FrameKey, ...]):
+        """Record one sampled stack (root first)"""
+        self.stacks[stack] += 1
+        self.samples += 1
+
+    def to_collapsed(self) -> str:
+        """
+        Render in Brendan Gregg's collapsed-stack format
+
+        Returns:
+            One "frame;frame;frame count" line per unique stack
+        """
+        lines = []
+        for stack, count in self.stacks.most_common():
+            frames = ";".join(f"{name} ({filename}:{line})" for name, filename, line in stack)
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def to_speedscope(self, interval: float) -> Dict:
+        """
+        Render as a speedscope "sampled" profile
+
+        Args:
+            interval: Sampling interval in seconds, used as the sample weight
+
+        Returns:
+            Speedscope JSON document
+        """
+        frame_index: Dict[FrameKey, int] = {}
+        frames: List[Dict] = []
+        samples: List[List[int]] = []
+        weights: List[float] = []
+
+        for stack, count in self.stacks.most_common():
+            indices = []
+            for key in stack:
+                index = frame_index.get(key)
+                if index is None:
+                    index = len(frames)
+                    frame_index[key] = index
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                indices.append(index)
+            samples.append(indices)
+            weights.append(count * interval)
+
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": self.name,
+            "exporter": "voice-ai-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+
+
+def _run_tagged(fn, *args, **kwargs):
+    tag = current_profile.get()
+    if tag is None:
+        return fn(*args, **kwargs)
+    thread_id = threading.get_ident()
+    _thread_profiles[thread_id] = tag
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        del _thread_profiles[thread_id]
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    """
+    Thread pool that runs each task in the context it was submitted from
+
+    Context variables such as the CallSid follow work off the event loop,
+    and a worker thread is attributed to the profiled request, if any,
+    whose task it is running.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, _run_tagged, fn, *args, **kwargs)
+
+
+def _task_factory(loop, coro, **kwargs):
+    task = asyncio.Task(coro, loop=loop, **kwargs)
+    context = kwargs.get("context")
+    tag = context.get(current_profile) if context is not None else current_profile.get()
+    if tag is not None:
+        _task_profiles[task] = tag
+    return task
+
+
+def attribute_loop(loop: asyncio.AbstractEventLoop, max_workers: Optional[int] = None):
+    """
+    Attribute work on an event loop to the profiled request that started it
+
+    Tasks remember the profile they were created under, and the loop's
+    default executor becomes a ContextExecutor. Call from the loop's thread.
+    """
+    loop.set_task_factory(_task_factory)
+    loop.set_default_executor(ContextExecutor(max_workers=max_workers))
+    _loops[threading.get_ident()] = loop
+
+
+def profile_of(thread_id: int) -> Optional[str]:
+    """Tag of the profiled request a thread is working for right now, if any"""
+    loop = _loops.get(thread_id)
+    if loop is None:
+        return _thread_profiles.get(thread_id)
+    task = asyncio.current_task(loop)
+    return _task_profiles.get(task) if task is not None else None
+
+
+class SamplingProfiler:
+    """
+    Samples Python stacks from a background thread
+
+    Nothing runs until start() is called: there is no tracing hook, so the
+    profiler costs nothing while inactive.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_ids: Optional[Iterable[int]] = None,
+                 name: str = "profile", tag: Optional[str] = None):
+        """
+        Initialize the profiler
+
+        Args:
+            interval: Seconds between samples
+            thread_ids: Only sample these threads (default: every thread)
+            name: Name stored on the resulting profile
+            tag: Only sample threads working for this profiled request (see attribute_loop)
+        """
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.tag = tag
+        self.profile = Profile(name)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+
+    def _sample(self):
+        """Take one sample of every watched thread"""
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if self.thread_ids is not None and thread_id not in self.thread_ids:
+                continue
+            if self.tag is not None and profile_of(thread_id) != self.tag:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            self.profile.add(tuple(stack))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        """Start sampling in a daemon thread"""
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Profile:
+        """
+        Stop sampling
+
+        Returns:
+            The collected profile
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.profile.duration = time.perf_counter() - self._started_at
+        return self.profile
+
+
+def render_profile(profile: Profile, fmt: str, interval: float):
+    """
+    Render a profile in the requested output format
+
+    Args:
+        profile: Collected profile
+        fmt: "collapsed" or "speedscope"
+        interval: Sampling interval in seconds
+
+    Returns:
+        Collapsed-stack text or speedscope JSON document
+    """
+    if fmt == "speedscope":
+        return profile.to_speedscope(interval)
+    if fmt == "collapsed":
+        return profile.to_collapsed()
+    raise ValueError(f"Unknown profile format: {fmt}")
+
+
+class ProfileStore:
+    """Bounded store of recent per-request profiles"""
+
+    def __init__(self, max_profiles: int = 20):
+        self._profiles: "collections.OrderedDict[str, Profile]" = collections.OrderedDict()
+        self._max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def put(self, profile: Profile) -> str:
+        """Store a profile and return its id"""
+        profile_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._profiles[profile_id] = profile
+            while len(self._profiles) > self._max_profiles:
+                self._profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        """Look up a stored profile"""
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+# Only one whole-process capture may run at a time
+capture_lock = threading.Lock()
+request_profiles = ProfileStore()
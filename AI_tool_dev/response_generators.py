@@ -0,0 +1,345 @@
+"""
+Pluggable response generation for turns the rule-based flow cannot answer
+
+ConversationManager handles the structured flows (booking, office
+information) itself. When a turn falls through to its generic reply, the
+configured ResponseGenerator may produce a better one within a strict
+latency budget; if it cannot, the rule-based reply is used.
+
+The first backend runs a small causal language model exported to ONNX on
+the CPU. Requests from concurrent calls are batched dynamically, each
+call's tokenized dialogue is cached between turns, and decoding stops at
+the turn's deadline.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Type
+
+import numpy as np
+
+from config import settings
+from lazy_imports import is_available, lazy_import
+
+logger = logging.getLogger(__name__)
+
+onnxruntime = lazy_import("onnxruntime")
+tokenizers = lazy_import("tokenizers")
+
+ONNX_AVAILABLE = is_available("onnxruntime") and is_available("tokenizers")
+
+
+class ResponseGenerator:
+    """Interface for response generation backends"""
+
+    name = "base"
+    # Caller languages the backend can answer in; other calls keep the scripted replies
+    languages: Tuple[str, ...] = ("en",)
+
+    def start(self):
+        """Load models and start workers (called once at startup)"""
+
+    async def generate(self, call_sid: str, tenant, text: str, budget: float) -> Optional[str]:
+        """
+        Generate a reply to the caller's utterance
+
+        Args:
+            call_sid: Call the turn belongs to (keys the dialogue cache)
+            tenant: TenantConfig of the call
+            text: The caller's utterance
+            budget: Seconds available for this turn
+
+        Returns:
+            Reply text, or None to keep the rule-based reply
+        """
+        return None
+
+    def record_turn(self, call_sid: str, tenant, text: str, reply: str):
+        """Add a turn answered elsewhere (e.g. by the rules) to the call's context"""
+
+    def forget(self, call_sid: str):
+        """Drop a finished call's context"""
+
+
+class _Request:
+    __slots__ = ("call_sid", "prompt", "deadline", "future")
+
+    def __init__(self, call_sid: str, prompt: List[int], deadline: float):
+        self.call_sid = call_sid
+        self.prompt = prompt
+        self.deadline = deadline
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+
+
+class OnnxResponseGenerator(ResponseGenerator):
+    """
+    Small causal LM on ONNX Runtime with dynamic batching
+
+    The model directory holds model.onnx (a text-generation export, with or
+    without past_key_values inputs) and tokenizer.json. Only token ids are
+    kept between turns: each turn prefills its whole prompt from an empty
+    key/value cache, since batched calls neither share a prefix nor keep
+    one once the window slides.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir: Optional[str] = None):
+        self.model_dir = model_dir or settings.generator_model_dir
+        self.max_batch = settings.generator_max_batch
+        self.batch_wait = settings.generator_batch_wait_ms / 1000.0
+        self.max_new_tokens = settings.generator_max_new_tokens
+        self.max_context = settings.generator_max_context_tokens
+        self.session = None
+        self.tokenizer = None
+        self.ready = threading.Event()
+        self._queue: "queue.Queue[_Request]" = queue.Queue(maxsize=settings.generator_max_queue)
+        # call_sid -> (preamble token ids, token ids of the turns so far)
+        self._contexts: "collections.OrderedDict[str, Tuple[List[int], List[int]]]" = collections.OrderedDict()
+        self._contexts_lock = threading.Lock()
+        self._max_contexts = settings.generator_max_calls
+
+    def start(self):
+        threading.Thread(target=self._run, name="response-generator", daemon=True).start()
+
+    def _load(self):
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = settings.generator_threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(self.model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.tokenizer = tokenizers.Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+
+        inputs = {i.name: i for i in self.session.get_inputs()}
+        self._input_names = set(inputs)
+        self._past_inputs = [name for name in inputs if name.startswith("past_key_values")]
+        # past_key_values.N.key is fed from the previous step's present.N.key
+        output_names = [o.name for o in self.session.get_outputs()]
+        self._present_index = {
+            name: output_names.index(name.replace("past_key_values", "present")) for name in self._past_inputs
+        }
+        self._past_shapes = {
+            name: (inputs[name].shape[1], inputs[name].shape[3]) for name in self._past_inputs
+        }
+        self._eos_id = self.tokenizer.token_to_id("<|endoftext|>")
+        self._pad_id = self._eos_id if self._eos_id is not None else 0
+        self._newline_ids = set(self.tokenizer.encode("\n", add_special_tokens=False).ids)
+        logger.info(f"Response generator loaded from {self.model_dir} "
+                    f"({'with' if self._past_inputs else 'without'} KV cache)")
+
+    # Dialogue context
+
+    def _preamble(self, tenant) -> str:
+        return (
+            f"The following is a phone call with the friendly receptionist of {tenant.name}. "
+            f"{tenant.office_hours} {tenant.location} {tenant.contact}\n"
+        )
+
+    def _encode(self, text: str) -> List[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False).ids
+
+    def _context(self, call_sid: str, tenant) -> Tuple[List[int], List[int]]:
+        """Cached (preamble, history) token ids for a call; only new turns are ever tokenized"""
+        with self._contexts_lock:
+            context = self._contexts.get(call_sid)
+            if context is not None:
+                self._contexts.move_to_end(call_sid)
+                return context
+        context = (self._encode(self._preamble(tenant)), [])
+        with self._contexts_lock:
+            context = self._contexts.setdefault(call_sid, context)
+            while len(self._contexts) > self._max_contexts:
+                self._contexts.popitem(last=False)
+        return context
+
+    def _room(self, preamble: List[int]) -> int:
+        """Tokens of dialogue that fit in the window after the preamble"""
+        return max(self.max_context - self.max_new_tokens - len(preamble), 0)
+
+    def _prompt(self, context: Tuple[List[int], List[int]], turn: List[int]) -> List[int]:
+        """Preamble plus as many of the latest turns as fit in the window"""
+        preamble, history = context
+        room = max(self._room(preamble), len(turn))
+        return preamble + (history + turn)[-room:]
+
+    def _extend(self, context: Tuple[List[int], List[int]], ids: List[int]):
+        """Append to a call's history, dropping what can no longer reach the window"""
+        preamble, history = context
+        history.extend(ids)
+        excess = len(history) - self._room(preamble)
+        if excess > 0:
+            del history[:excess]
+
+    def record_turn(self, call_sid: str, tenant, text: str, reply: str):
+        if not self.ready.is_set():
+            return
+        self._extend(self._context(call_sid, tenant), self._encode(f"Caller: {text}\nReceptionist: {reply}\n"))
+
+    def forget(self, call_sid: str):
+        with self._contexts_lock:
+            self._contexts.pop(call_sid, None)
+
+    # Serving
+
+    async def generate(self, call_sid: str, tenant, text: str, budget: float) -> Optional[str]:
+        if not self.ready.is_set():
+            return None
+        started = time.monotonic()
+        context = self._context(call_sid, tenant)
+        turn = self._encode(f"Caller: {text}\nReceptionist:")
+        request = _Request(call_sid, self._prompt(context, turn), started + budget)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            return None
+        try:
+            reply_ids = await asyncio.wait_for(asyncio.wrap_future(request.future), budget)
+        except (asyncio.TimeoutError, concurrent.futures.CancelledError):
+            return None
+        if not reply_ids:
+            return None
+        reply = self.tokenizer.decode(reply_ids).strip()
+        if not reply:
+            return None
+        self._extend(context, turn + self._encode(f" {reply}\n"))
+        return reply
+
+    def _run(self):
+        try:
+            self._load()
+        except Exception as e:
+            logger.error(f"Response generator unavailable: {str(e)}")
+            return
+        self.ready.set()
+        while True:
+            batch = [self._queue.get()]
+            # Collect concurrent turns for a short window, up to max_batch
+            window_end = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                remaining = window_end - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            now = time.monotonic()
+            live = [r for r in batch if r.deadline > now and not r.future.cancelled()]
+            for request in batch:
+                if request not in live:
+                    request.future.cancel()
+            if not live:
+                continue
+            try:
+                results = self._decode([r.prompt for r in live], min(r.deadline for r in live))
+                for request, ids in zip(live, results):
+                    self._resolve(request, ids)
+            except Exception as e:
+                logger.warning(f"Response generation failed: {str(e)}")
+                for request in live:
+                    self._resolve(request, None)
+
+    @staticmethod
+    def _resolve(request: _Request, ids: Optional[List[int]]):
+        # The caller may have given up (budget exceeded) in the meantime
+        try:
+            request.future.set_result(ids)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def _decode(self, prompts: List[List[int]], deadline: float) -> List[Optional[List[int]]]:
+        """
+        Greedy decoding of a left-padded batch
+
+        Returns one list of generated token ids per prompt, or None for
+        prompts whose reply was not finished before the deadline.
+        """
+        batch = len(prompts)
+        length = max(len(p) for p in prompts)
+        input_ids = np.full((batch, length), self._pad_id, dtype=np.int64)
+        attention = np.zeros((batch, length), dtype=np.int64)
+        for row, prompt in enumerate(prompts):
+            input_ids[row, length - len(prompt):] = prompt
+            attention[row, length - len(prompt):] = 1
+
+        past = {
+            name: np.zeros((batch, heads, 0, head_dim), dtype=np.float32)
+            for name, (heads, head_dim) in self._past_shapes.items()
+        }
+        step_ids = input_ids
+        generated: List[List[int]] = [[] for _ in range(batch)]
+        finished = np.zeros(batch, dtype=bool)
+
+        for _ in range(self.max_new_tokens):
+            feeds = {"input_ids": step_ids, "attention_mask": attention}
+            if "position_ids" in self._input_names:
+                positions = np.clip(np.cumsum(attention, axis=1) - 1, 0, None)
+                feeds["position_ids"] = positions[:, -step_ids.shape[1]:]
+            feeds.update(past)
+            outputs = self.session.run(None, feeds)
+            next_ids = outputs[0][:, -1, :].argmax(axis=-1)
+
+            for row in range(batch):
+                if finished[row]:
+                    continue
+                token = int(next_ids[row])
+                if token == self._eos_id or token in self._newline_ids:
+                    finished[row] = True
+                else:
+                    generated[row].append(token)
+            if finished.all() or time.monotonic() >= deadline:
+                break
+
+            next_ids = np.where(finished, self._pad_id, next_ids).astype(np.int64)[:, None]
+            attention = np.concatenate([attention, np.ones((batch, 1), dtype=np.int64)], axis=1)
+            if self._past_inputs:
+                past = {name: outputs[index] for name, index in self._present_index.items()}
+                step_ids = next_ids
+            else:
+                input_ids = np.concatenate([input_ids, next_ids], axis=1)
+                step_ids = input_ids
+
+        return [ids if finished[row] else None for row, ids in enumerate(generated)]
+
+
+# Setting value -> backend class; "rules" disables generation
+_GENERATORS: Dict[str, Type[ResponseGenerator]] = {"onnx": OnnxResponseGenerator}
+
+_generator: Optional[ResponseGenerator] = None
+
+
+def register_generator(name: str, generator_cls: Type[ResponseGenerator]):
+    """Register a response generator backend under a RESPONSE_GENERATOR value"""
+    _GENERATORS[name] = generator_cls
+
+
+def get_generator() -> Optional[ResponseGenerator]:
+    """The configured generator, or None when replies are rule-based only"""
+    return _generator
+
+
+def init_generator() -> Optional[ResponseGenerator]:
+    """Create and start the configured generator"""
+    global _generator
+    name = settings.response_generator
+    if name == "rules" or _generator is not None:
+        return _generator
+    generator_cls = _GENERATORS.get(name)
+    if generator_cls is None:
+        logger.warning(f"Unknown response generator {name}; using rule-based replies")
+        return None
+    if generator_cls is OnnxResponseGenerator and not ONNX_AVAILABLE:
+        logger.warning("onnxruntime/tokenizers not installed; using rule-based replies")
+        return None
+    _generator = generator_cls()
+    _generator.start()
+    logger.info(f"Response generator: {_generator.name}")
+    return _generator
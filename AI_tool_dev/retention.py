@@ -0,0 +1,240 @@
+"""
+Call log retention: move old calls into compressed, date-partitioned archives
+
+Calls older than settings.retention_days are written to
+<archive_dir>/YYYY/MM/DD/calls.ndjson.zst (gzip when zstandard is not
+installed) and deleted from call_logs in batches. Each batch for a day
+is one independently compressed frame, and archived_calls records the
+frame's location, so reading an archived call decompresses only its
+frame.
+
+Usage:
+    python retention.py                  # archive calls older than RETENTION_DAYS
+    python retention.py --days 30 --vacuum
+"""
+import argparse
+import collections
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from database import CallLog, ArchivedCall, SQLALCHEMY_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# zstd is optional; gzip is always available
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+ARCHIVE_FIELDS = ("call_sid", "phone_number", "direction", "status", "transcript", "duration",
+                  "created_at", "updated_at")
+
+
+def _compress(data: bytes) -> Tuple[bytes, str]:
+    """Compress one frame; returns (frame, file extension)"""
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=10).compress(data), ".ndjson.zst"
+    return gzip.compress(data, compresslevel=6), ".ndjson.gz"
+
+
+def _decompress(frame: bytes, path: str) -> bytes:
+    """Decompress one frame, choosing the codec from the file extension"""
+    if path.endswith(".zst"):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("zstandard is required to read .zst archives")
+        return zstandard.ZstdDecompressor().decompress(frame)
+    return gzip.decompress(frame)
+
+
+def serialize_call(call_log) -> Dict:
+    """Convert a CallLog row to a JSON-safe dict"""
+    record = {}
+    for field in ARCHIVE_FIELDS:
+        value = getattr(call_log, field)
+        record[field] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+
+def _append_frame(partition_day: datetime, records: List[Dict]) -> Tuple[str, int, int]:
+    """
+    Append one compressed frame of records to a day's archive file
+
+    Returns:
+        (path relative to archive_dir, offset, length)
+    """
+    payload = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+    frame, extension = _compress(payload.encode("utf-8"))
+
+    relative = os.path.join(partition_day.strftime("%Y/%m/%d"), f"calls{extension}")
+    path = os.path.join(settings.archive_dir, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab") as f:
+        offset = f.tell()
+        f.write(frame)
+        f.flush()
+        # The frame must be durable before its rows are deleted
+        os.fsync(f.fileno())
+    return relative, offset, len(frame)
+
+
+def archive_batch(db, cutoff: datetime, batch_size: int) -> int:
+    """
+    Archive and delete up to batch_size calls created before cutoff
+
+    Returns:
+        Number of calls archived
+    """
+    calls = db.query(CallLog).filter(CallLog.created_at < cutoff).order_by(CallLog.id).limit(batch_size).all()
+    if not calls:
+        return 0
+
+    by_day: Dict[datetime, List] = collections.defaultdict(list)
+    for call_log in calls:
+        by_day[call_log.created_at.replace(hour=0, minute=0, second=0, microsecond=0)].append(call_log)
+
+    from transcript_search import get_backend
+    search_backend = get_backend()
+
+    # Calls re-archived after a crash already have an index entry
+    existing = {
+        entry.call_sid: entry
+        for entry in db.query(ArchivedCall).filter(ArchivedCall.call_sid.in_([c.call_sid for c in calls]))
+    }
+
+    for day, day_calls in by_day.items():
+        relative, offset, length = _append_frame(day, [serialize_call(c) for c in day_calls])
+        for call_log in day_calls:
+            entry = existing.get(call_log.call_sid)
+            if entry is None:
+                entry = ArchivedCall(call_sid=call_log.call_sid)
+                db.add(entry)
+            entry.partition = day.strftime("%Y-%m-%d")
+            entry.path = relative
+            entry.offset = offset
+            entry.length = length
+            if search_backend:
+                search_backend.remove_call(db, call_log.call_sid)
+            db.delete(call_log)
+    db.commit()
+    return len(calls)
+
+
+def run_retention(db, older_than_days: Optional[int] = None, batch_size: Optional[int] = None) -> int:
+    """
+    Archive every call older than the retention window, one batch at a time
+
+    Args:
+        db: Database session
+        older_than_days: Retention window (default: settings.retention_days)
+        batch_size: Calls per batch (default: settings.retention_batch_size)
+
+    Returns:
+        Total number of calls archived
+    """
+    days = settings.retention_days if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.retention_batch_size
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    total = 0
+    while True:
+        archived = archive_batch(db, cutoff, batch_size)
+        if not archived:
+            break
+        total += archived
+        logger.info(f"Archived {total} calls older than {cutoff.isoformat()}")
+    return total
+
+
+class FrameCache:
+    """Small LRU of decompressed archive frames"""
+
+    def __init__(self, max_frames: int = 64):
+        self._frames: "collections.OrderedDict[Tuple[str, int], Dict[str, Dict]]" = collections.OrderedDict()
+        self._max_frames = max_frames
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, int]) -> Optional[Dict[str, Dict]]:
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+            return frame
+
+    def put(self, key: Tuple[str, int], frame: Dict[str, Dict]):
+        with self._lock:
+            self._frames[key] = frame
+            while len(self._frames) > self._max_frames:
+                self._frames.popitem(last=False)
+
+
+frame_cache = FrameCache()
+
+
+def get_archived_call(db, call_sid: str) -> Optional[Dict]:
+    """
+    Read an archived call through the partition index
+
+    Args:
+        db: Database session
+        call_sid: CallSid to look up
+
+    Returns:
+        Archived call record, or None if the call was never archived
+    """
+    entry = db.query(ArchivedCall).filter(ArchivedCall.call_sid == call_sid).first()
+    if entry is None:
+        return None
+
+    key = (entry.path, entry.offset)
+    records = frame_cache.get(key)
+    if records is None:
+        with open(os.path.join(settings.archive_dir, entry.path), "rb") as f:
+            f.seek(entry.offset)
+            frame = f.read(entry.length)
+        records = {}
+        for line in _decompress(frame, entry.path).decode("utf-8").splitlines():
+            record = json.loads(line)
+            records[record["call_sid"]] = record
+        frame_cache.put(key, records)
+    return records.get(call_sid)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Archive old call logs")
+    parser.add_argument("--days", type=int, help="Archive calls older than N days (default: RETENTION_DAYS)")
+    parser.add_argument("--batch-size", type=int, help="Calls per batch (default: RETENTION_BATCH_SIZE)")
+    parser.add_argument("--vacuum", action="store_true", help="Reclaim space in a SQLite database afterwards")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not SQLALCHEMY_AVAILABLE:
+        logger.error("SQLAlchemy not available")
+        return 1
+
+    from database import write_session, engine, init_db
+    from transcript_search import init_search
+    init_db()
+    init_search()
+    with write_session() as db:
+        total = run_retention(db, args.days, args.batch_size)
+    logger.info(f"Retention finished: {total} calls archived")
+
+    if args.vacuum and total and engine.dialect.name == "sqlite":
+        from sqlalchemy import text
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
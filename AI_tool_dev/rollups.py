@@ -0,0 +1,283 @@
+"""
+Incrementally maintained call analytics rollups
+
+Each call is counted once, in the hour and day bucket of its created_at,
+under its current direction and status. When a status callback moves a
+call from one status to another, the old bucket is decremented and the
+new one incremented, so rollups always equal a GROUP BY over call_logs
+without ever scanning it. compact() recomputes a time range from
+call_logs to repair drift (e.g. after bulk imports). Days with archived
+calls (retention.py) are left alone, since their calls are no longer in
+call_logs.
+
+Usage:
+    python rollups.py --rebuild                # recompute everything
+    python rollups.py --rebuild --days 2       # recompute the last two days
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from database import engine, ArchivedCall, CallLog, CallRollup, SQLALCHEMY_AVAILABLE
+
+if SQLALCHEMY_AVAILABLE:
+    from sqlalchemy import and_, delete, func, true
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ("hour", "day")
+
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its hour or day bucket"""
+    if granularity == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Unknown granularity: {granularity}")
+
+
+def _upsert_insert():
+    """Dialect-specific INSERT supporting ON CONFLICT, or None"""
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    return None
+
+
+def _apply_delta(db, granularity: str, start: datetime, direction: str, status: str,
+                 count_delta: int, duration_delta: float):
+    """Add deltas to one rollup bucket, creating it if needed"""
+    insert = _upsert_insert()
+    if insert is not None:
+        statement = insert(CallRollup).values(
+            granularity=granularity,
+            bucket_start=start,
+            direction=direction,
+            status=status,
+            call_count=count_delta,
+            total_duration=duration_delta
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["granularity", "bucket_start", "direction", "status"],
+            set_={
+                "call_count": CallRollup.call_count + count_delta,
+                "total_duration": CallRollup.total_duration + duration_delta
+            }
+        )
+        db.execute(statement)
+        return
+
+    rollup = db.query(CallRollup).filter(
+        CallRollup.granularity == granularity,
+        CallRollup.bucket_start == start,
+        CallRollup.direction == direction,
+        CallRollup.status == status
+    ).with_for_update().first()
+    if rollup is None:
+        db.add(CallRollup(
+            granularity=granularity,
+            bucket_start=start,
+            direction=direction,
+            status=status,
+            call_count=count_delta,
+            total_duration=duration_delta
+        ))
+    else:
+        rollup.call_count += count_delta
+        rollup.total_duration += duration_delta
+
+
+def record_call(db, call_log, old_status: Optional[str] = None, old_duration: Optional[float] = None,
+                is_new: bool = False):
+    """
+    Update rollups for a new or changed call, inside the caller's transaction
+
+    Args:
+        db: Database session (the caller commits)
+        call_log: CallLog after the change
+        old_status: Status before the change (ignored for new calls)
+        old_duration: Duration before the change (ignored for new calls)
+        is_new: Whether the call has not been counted yet
+    """
+    if call_log.created_at is None:
+        call_log.created_at = datetime.utcnow()
+    direction = call_log.direction or "unknown"
+    new_status = call_log.status or "unknown"
+    new_duration = call_log.duration or 0.0
+    old_status = old_status or "unknown"
+    old_duration = old_duration or 0.0
+
+    for granularity in GRANULARITIES:
+        start = bucket_start(call_log.created_at, granularity)
+        if is_new:
+            _apply_delta(db, granularity, start, direction, new_status, 1, new_duration)
+        elif old_status == new_status:
+            if new_duration != old_duration:
+                _apply_delta(db, granularity, start, direction, new_status, 0, new_duration - old_duration)
+        else:
+            _apply_delta(db, granularity, start, direction, old_status, -1, -old_duration)
+            _apply_delta(db, granularity, start, direction, new_status, 1, new_duration)
+
+
+def compact(db, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """
+    Recompute rollups for whole days in [start, end) from call_logs
+
+    The range starts no earlier than the day after the newest archive
+    partition: rollups are all that is left of archived calls.
+
+    Args:
+        db: Database session
+        start: First day to rebuild (default: the beginning of history)
+        end: End of the range (default: now)
+    """
+    if start is not None:
+        start = bucket_start(start, "day")
+    if end is not None:
+        end = bucket_start(end, "day") + timedelta(days=1)
+
+    archived_through = db.query(func.max(ArchivedCall.partition)).scalar()
+    if archived_through:
+        first_live_day = datetime.strptime(archived_through, "%Y-%m-%d") + timedelta(days=1)
+        if start is None or start < first_live_day:
+            logger.info(f"Keeping rollups of archived days through {archived_through}")
+            start = first_live_day
+        if end is not None and end <= start:
+            return
+
+    def in_range(column):
+        conditions = []
+        if start is not None:
+            conditions.append(column >= start)
+        if end is not None:
+            conditions.append(column < end)
+        return and_(*conditions) if conditions else true()
+
+    db.execute(delete(CallRollup).where(in_range(CallRollup.bucket_start)))
+
+    rows = db.query(
+        CallLog.created_at, CallLog.direction, CallLog.status, CallLog.duration
+    ).filter(in_range(CallLog.created_at)).yield_per(10000)
+
+    totals: Dict[tuple, List] = {}
+    for created_at, direction, status, duration in rows:
+        if created_at is None:
+            continue
+        for granularity in GRANULARITIES:
+            key = (granularity, bucket_start(created_at, granularity), direction or "unknown", status or "unknown")
+            bucket = totals.setdefault(key, [0, 0.0])
+            bucket[0] += 1
+            bucket[1] += duration or 0.0
+
+    db.bulk_insert_mappings(CallRollup, [
+        {
+            "granularity": granularity,
+            "bucket_start": bucket,
+            "direction": direction,
+            "status": status,
+            "call_count": count,
+            "total_duration": duration
+        }
+        for (granularity, bucket, direction, status), (count, duration) in totals.items()
+    ])
+    db.commit()
+    logger.info(f"Rebuilt {len(totals)} rollup buckets")
+
+
+def query_stats(db, start: datetime, end: datetime, granularity: str = "hour",
+                direction: Optional[str] = None, status: Optional[str] = None) -> Dict:
+    """
+    Read rollups for a time range
+
+    Args:
+        db: Database session
+        start: Range start (inclusive, truncated to the bucket)
+        end: Range end (exclusive)
+        granularity: 'hour' or 'day'
+        direction: Optional direction filter
+        status: Optional status filter
+
+    Returns:
+        Per-bucket series plus totals by direction and status
+    """
+    q = db.query(CallRollup).filter(
+        CallRollup.granularity == granularity,
+        CallRollup.bucket_start >= bucket_start(start, granularity),
+        CallRollup.bucket_start < end,
+        CallRollup.call_count != 0
+    )
+    if direction:
+        q = q.filter(CallRollup.direction == direction)
+    if status:
+        q = q.filter(CallRollup.status == status)
+
+    series: Dict[datetime, Dict] = {}
+    by_direction: Dict[str, int] = {}
+    by_status: Dict[str, int] = {}
+    total_calls = 0
+    total_duration = 0.0
+    for rollup in q.order_by(CallRollup.bucket_start):
+        point = series.setdefault(rollup.bucket_start, {"calls": 0, "total_duration": 0.0, "completed": 0})
+        point["calls"] += rollup.call_count
+        point["total_duration"] += rollup.total_duration
+        if rollup.status == "completed":
+            point["completed"] += rollup.call_count
+        by_direction[rollup.direction] = by_direction.get(rollup.direction, 0) + rollup.call_count
+        by_status[rollup.status] = by_status.get(rollup.status, 0) + rollup.call_count
+        total_calls += rollup.call_count
+        total_duration += rollup.total_duration
+
+    def summarize(calls: int, duration: float, completed: int) -> Dict:
+        return {
+            "calls": calls,
+            "average_duration": duration / calls if calls else 0.0,
+            "completion_rate": completed / calls if calls else 0.0
+        }
+
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "totals": {
+            **summarize(total_calls, total_duration, by_status.get("completed", 0)),
+            "by_direction": by_direction,
+            "by_status": by_status
+        },
+        "series": [
+            {"bucket_start": bucket.isoformat(), **summarize(p["calls"], p["total_duration"], p["completed"])}
+            for bucket, p in series.items()
+        ]
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point for the compactor"""
+    parser = argparse.ArgumentParser(description="Maintain call analytics rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute rollups from call_logs")
+    parser.add_argument("--days", type=int, help="Only rebuild the last N days")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not args.rebuild:
+        parser.print_help()
+        return 1
+
+    from database import SessionLocal, init_db
+    init_db()
+    start = datetime.utcnow() - timedelta(days=args.days) if args.days else None
+    db = SessionLocal()
+    try:
+        compact(db, start=start)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Speculative turn preparation from Gather partial results
+
+While the caller is still speaking, Twilio posts partial transcripts to the
+Gather's partialResultCallback. Each partial is run through the dialog
+logic on a copy of the call's ConversationManager and the resulting reply
+and TwiML are kept per CallSid. When the final SpeechResult matches a
+prepared partial and the conversation has not moved on since, the final
+webhook adopts the prepared turn instead of computing it again.
+"""
+import collections
+import copy
+import re
+import threading
+from typing import Callable, Deque, Dict, NamedTuple, Optional
+
+from metrics import registry
+
+SPECULATION_RESULTS = registry.counter(
+    "voice_ai_speculation_total",
+    "Final speech results answered from a speculative turn, by outcome",
+    ("outcome",)
+)
+
+_NON_WORD = re.compile(r"[^\w\s']+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_utterance(text: Optional[str]) -> str:
+    """Lowercase and strip punctuation so partial and final results compare equal"""
+    if not text:
+        return ""
+    return _SPACES.sub(" ", _NON_WORD.sub(" ", text.lower())).strip()
+
+
+class Speculation(NamedTuple):
+    """A turn prepared from a partial result"""
+    turn: int  # turn_count of the manager the turn was computed from
+    utterance: str  # normalized partial transcript
+    manager: object  # ConversationManager after the turn
+    response: str
+    twiml: str
+
+
+class SpeculationCache:
+    """The most recent speculative turns for each call"""
+
+    def __init__(self, max_candidates: int = 3):
+        self.max_candidates = max_candidates
+        self._calls: Dict[str, Deque[Speculation]] = {}
+        self._lock = threading.Lock()
+
+    def prepare(self, call_sid: str, manager, partial: str,
+                render: Callable[[object, str], str]) -> Optional[Speculation]:
+        """
+        Compute a speculative turn for a partial transcript
+
+        Args:
+            call_sid: Call the partial belongs to
+            manager: The call's live ConversationManager (not modified)
+            partial: Partial transcript from Twilio
+            render: Callable (manager, reply) -> TwiML for the turn
+
+        Returns:
+            The prepared Speculation, or None if there was nothing to do
+        """
+        utterance = normalize_utterance(partial)
+        if not utterance:
+            return None
+        with self._lock:
+            candidates = self._calls.get(call_sid)
+            if candidates:
+                if candidates[-1].turn != manager.turn_count:
+                    # Leftovers from a turn that has already been answered
+                    candidates.clear()
+                elif any(c.utterance == utterance for c in candidates):
+                    return None
+
+        speculative = copy.deepcopy(manager)
+        response = speculative.process_user_input(partial)
+        speculation = Speculation(manager.turn_count, utterance, speculative, response,
+                                  render(speculative, response))
+        with self._lock:
+            candidates = self._calls.setdefault(call_sid, collections.deque(maxlen=self.max_candidates))
+            candidates.append(speculation)
+        return speculation
+
+    def take(self, call_sid: str, manager, final: str) -> Optional[Speculation]:
+        """
+        Claim the speculative turn matching a final transcript
+
+        A speculation is valid only if it was computed from the manager's
+        current turn and its transcript equals the final one. All of the
+        call's speculations are dropped either way.
+        """
+        with self._lock:
+            candidates = self._calls.pop(call_sid, None)
+        if not candidates:
+            return None
+        utterance = normalize_utterance(final)
+        for speculation in reversed(candidates):
+            if speculation.turn == manager.turn_count and speculation.utterance == utterance:
+                SPECULATION_RESULTS.inc("hit")
+                return speculation
+        SPECULATION_RESULTS.inc("miss")
+        return None
+
+    def discard(self, call_sid: str):
+        """Forget a call's speculations (e.g. when the call ends)"""
+        with self._lock:
+            self._calls.pop(call_sid, None)
@@ -5,6 +5,19 @@ import os
 import sys
 import subprocess
 
+from lazy_imports import is_available, parse_importtime
+
+# Packages the server needs, mapped to the name shown when missing
+REQUIRED_PACKAGES = {
+    "fastapi": "fastapi",
+    "faster_whisper": "faster-whisper",
+    "twilio": "twilio",
+}
+OPTIONAL_PACKAGES = {
+    "TTS": "TTS (Coqui, optional)",
+    "onnxruntime": "onnxruntime (local response generation, optional)",
+}
+
 def check_env_file():
     """Check if .env file exists"""
     if not os.path.exists('.env'):
@@ -18,22 +31,49 @@ def check_env_file():
         print("✓ .env file found")
 
 def check_dependencies():
-    """Check if required packages are installed"""
+    """Check if required packages are installed (without importing them)"""
     print("Checking dependencies...")
-    try:
-        import fastapi
-        import faster_whisper
-        from TTS.api import TTS
-        from twilio.rest import Client
-        print("✓ All dependencies installed")
-        return True
-    except ImportError as e:
-        print(f"✗ Missing dependency: {e}")
+    missing = [name for module, name in REQUIRED_PACKAGES.items() if not is_available(module)]
+    for module, name in OPTIONAL_PACKAGES.items():
+        if not is_available(module):
+            print(f"⚠️  Optional dependency not installed: {name}")
+    
+    if missing:
+        print(f"✗ Missing dependency: {', '.join(missing)}")
         print("Please run: pip install -r requirements.txt")
         return False
+    
+    print("✓ All dependencies installed")
+    return True
+
+def profile_startup(limit: int = 25):
+    """Report per-module import cost of the application"""
+    print("Profiling application import time...")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        # importtime output and the traceback share stderr
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        print("✗ Importing the application failed:")
+        print("\n".join(errors[-10:]))
+        return 1
+    
+    rows = parse_importtime(result.stderr, limit=None)
+    total_us = max((cumulative for _, _, cumulative in rows), default=0)
+    print(f"\nTotal import time: {total_us / 1000:.1f} ms\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for module, self_us, cumulative_us in rows[:limit]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {module}")
+    return 0
 
 def main():
     """Start the server"""
+    if "--profile-startup" in sys.argv:
+        sys.exit(profile_startup())
+    
     print("=" * 50)
     print("Voice AI Receptionist - Server Startup")
     print("=" * 50)
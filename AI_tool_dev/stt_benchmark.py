@@ -0,0 +1,178 @@
+"""
+STT speed/accuracy benchmark for per-turn decoding hints
+
+Each corpus entry is one caller utterance with its reference text, its
+language and the slot the receptionist had just asked for (date, time,
+name, or null for an open question). Every utterance is decoded twice:
+  fixed     beam 5, no prompt (the previous behaviour)
+  adaptive  the DecodingHints the live conversation would use
+and the report compares real-time factor, latency percentiles and word
+error rate, overall and per slot.
+
+Audio is read from <audio-dir>/<id>.wav (telephone recordings, any PCM
+WAV). --synthesize renders missing entries with the local TTS model and
+passes them through the 8 kHz μ-law phone codec first.
+
+Usage:
+    python stt_benchmark.py --synthesize
+    python stt_benchmark.py --corpus stt_corpus.jsonl --audio-dir recordings/corpus --model small
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stt_corpus.jsonl")
+MODES = ("fixed", "adaptive")
+
+
+def load_corpus(path: str) -> List[Dict]:
+    """Read corpus entries from a JSONL file"""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def word_errors(reference: str, hypothesis: str) -> int:
+    """Word-level edit distance after normalizing case and punctuation"""
+    from speculation import normalize_utterance
+    ref = normalize_utterance(reference).split()
+    hyp = normalize_utterance(hypothesis).split()
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def synthesize_missing(entries: List[Dict], audio_dir: str) -> int:
+    """
+    Render corpus entries without audio using the local TTS model
+
+    Only entries in the TTS model's language are rendered; the others need
+    recorded audio.
+
+    Returns:
+        Number of files written
+    """
+    import audio_codec
+    from config import settings
+    from tts_module import TTSEngine
+
+    os.makedirs(audio_dir, exist_ok=True)
+    engine = None
+    written = 0
+    for entry in entries:
+        path = os.path.join(audio_dir, entry["id"] + ".wav")
+        if os.path.exists(path) or entry.get("language", "en") != settings.tts_language:
+            continue
+        if engine is None:
+            engine = TTSEngine()
+        # Through the phone codec, so the benchmark hears what Twilio delivers
+        narrowband = audio_codec.ulaw_decode(engine.synthesize_to_mulaw(entry["text"]))
+        with open(path, "wb") as f:
+            f.write(audio_codec.encode_wav(audio_codec.pcm16_to_float32(narrowband),
+                                           audio_codec.TWILIO_SAMPLE_RATE))
+        written += 1
+    return written
+
+
+def load_audio(entries: List[Dict], audio_dir: str) -> List[Dict]:
+    """Decode each entry's WAV to 16 kHz samples up front, so file I/O is not timed"""
+    import audio_codec
+    loaded = []
+    for entry in entries:
+        path = os.path.join(audio_dir, entry["id"] + ".wav")
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            samples, rate = audio_codec.decode_wav(f.read())
+        samples = audio_codec.resample(samples, rate, audio_codec.WHISPER_SAMPLE_RATE)
+        loaded.append(dict(entry, samples=samples, seconds=len(samples) / audio_codec.WHISPER_SAMPLE_RATE))
+    return loaded
+
+
+def run_mode(engine, entries: List[Dict], mode: str) -> Dict:
+    """
+    Decode every entry with one decoding mode
+
+    Returns:
+        Real-time factor, p50/p95 latency (ms) and word error rate, overall and by slot
+    """
+    from conversation_flow import decoding_hints
+
+    latencies, audio_seconds = [], 0.0
+    errors: Dict[str, int] = {}
+    words: Dict[str, int] = {}
+    for entry in entries:
+        language = entry.get("language", "en")
+        hints = decoding_hints(entry.get("slot"), language) if mode == "adaptive" else None
+        started = time.perf_counter()
+        text = engine.transcribe(entry["samples"], language, hints)
+        latencies.append(time.perf_counter() - started)
+        audio_seconds += entry["seconds"]
+
+        slot = entry.get("slot") or "open"
+        reference_words = len(entry["text"].split())
+        for key in (slot, "all"):
+            errors[key] = errors.get(key, 0) + word_errors(entry["text"], text)
+            words[key] = words.get(key, 0) + reference_words
+
+    return {
+        "mode": mode,
+        "utterances": len(entries),
+        "rtf": sum(latencies) / audio_seconds if audio_seconds else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "wer": {key: errors[key] / max(words[key], 1) for key in errors},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark STT decoding hints on the utterance corpus")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="JSONL corpus of {id, language, slot, text}")
+    parser.add_argument("--audio-dir", default="tmp/stt_corpus", help="Directory of <id>.wav files")
+    parser.add_argument("--synthesize", action="store_true", help="Render missing audio with the local TTS model")
+    parser.add_argument("--model", help="Whisper model size (default: STT_MODEL)")
+    parser.add_argument("--threads", type=int, default=0, help="Decoder CPU threads")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    args = parser.parse_args(argv)
+
+    entries = load_corpus(args.corpus)
+    if args.synthesize:
+        print(f"Synthesized {synthesize_missing(entries, args.audio_dir)} utterances")
+    entries = load_audio(entries, args.audio_dir)
+    if not entries:
+        print(f"No corpus audio found in {args.audio_dir} (use --synthesize or add <id>.wav files)")
+        return 1
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    from stt_module import STTEngine
+    engine = STTEngine(model_size=args.model, cpu_threads=args.threads)
+    # Warm up so model initialization is not measured
+    engine.transcribe(entries[0]["samples"], entries[0].get("language", "en"))
+
+    print(f"{len(entries)} utterances, {sum(e['seconds'] for e in entries):.1f} s of audio")
+    for mode in args.modes:
+        report = run_mode(engine, entries, mode)
+        slots = "  ".join(f"{slot} {wer:.1%}" for slot, wer in sorted(report["wer"].items()) if slot != "all")
+        print(f"  {mode:8s} RTF {report['rtf']:.3f}  p50 {report['p50_ms']:7.1f} ms  "
+              f"p95 {report['p95_ms']:7.1f} ms  WER {report['wer']['all']:.1%}  ({slots})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,53 +2,102 @@
 Speech-to-Text module using Faster-Whisper
 """
 import os
-from faster_whisper import WhisperModel
+from typing import NamedTuple, Optional, Tuple
 from config import settings
+from lazy_imports import lazy_import
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Deferred until the first STTEngine is created
+faster_whisper = lazy_import("faster_whisper")
+# NumPy codecs, only needed once audio is actually transcribed
+audio_codec = lazy_import("audio_codec")
+
+
+class DecodingHints(NamedTuple):
+    """Per-turn decoding settings, derived from what the caller was just asked"""
+    beam_size: int
+    initial_prompt: Optional[str] = None  # example of the expected answer, conditions the decoder
+    hotwords: Tuple[str, ...] = ()  # words the answer is likely to contain
+
 
 class STTEngine:
     """Speech-to-Text engine using Faster-Whisper"""
     
-    def __init__(self, model_size: str = None, device: str = None):
+    def __init__(self, model_size: str = None, device: str = None, cpu_threads: int = 0):
         """
         Initialize the STT engine
         
         Args:
             model_size: Whisper model size (tiny, base, small, medium, large)
             device: Device to use (cpu or cuda)
+            cpu_threads: CPU threads for decoding (0 lets CTranslate2 decide)
         """
         self.model_size = model_size or settings.stt_model
         self.device = device or settings.stt_device
         
         logger.info(f"Loading Whisper model: {self.model_size} on {self.device}")
-        self.model = WhisperModel(self.model_size, device=self.device)
+        self.model = faster_whisper.WhisperModel(self.model_size, device=self.device, cpu_threads=cpu_threads)
         logger.info("Whisper model loaded successfully")
     
-    def transcribe(self, audio_path: str, language: str = "en") -> str:
+    def detect_language(self, audio_path) -> tuple:
+        """
+        Identify the spoken language from the first 30 seconds of audio
+        
+        Args:
+            audio_path: Path to audio file, or 16 kHz mono float32 samples
+            
+        Returns:
+            (language code, probability)
+        """
+        if hasattr(self.model, "detect_language"):
+            # WhisperModel.detect_language() takes samples only, not a path
+            audio = audio_path
+            if isinstance(audio, str):
+                audio = faster_whisper.decode_audio(audio, sampling_rate=audio_codec.WHISPER_SAMPLE_RATE)
+            audio = audio[:30 * audio_codec.WHISPER_SAMPLE_RATE]
+            language, probability, _ = self.model.detect_language(audio)
+            return language, probability
+        # Older faster-whisper: detection only runs as part of transcribe()
+        _, info = self.model.transcribe(audio_path, language=None, beam_size=1, vad_filter=True)
+        return info.language, info.language_probability
+    
+    def transcribe(self, audio_path, language: str = "en", hints: Optional[DecodingHints] = None) -> str:
         """
         Transcribe audio file to text
         
         Args:
-            audio_path: Path to audio file
-            language: Language code (default: "en")
+            audio_path: Path to audio file, or 16 kHz mono float32 samples
+            language: Language code (default: "en"); None detects it
+            hints: Decoding hints for the turn (default: STT_BEAM_SIZE, no prompt)
             
         Returns:
             Transcribed text
         """
         try:
-            logger.info(f"Transcribing audio: {audio_path}")
+            if isinstance(audio_path, str):
+                logger.info(f"Transcribing audio: {audio_path}")
+            else:
+                logger.info(f"Transcribing {len(audio_path)} in-memory samples")
+            options = {}
+            if hints is not None:
+                if hints.initial_prompt:
+                    options["initial_prompt"] = hints.initial_prompt
+                if hints.hotwords:
+                    options["hotwords"] = " ".join(hints.hotwords)
             segments, info = self.model.transcribe(
                 audio_path,
                 language=language,
-                beam_size=5,
-                vad_filter=True
+                beam_size=hints.beam_size if hints is not None else settings.stt_beam_size,
+                vad_filter=True,
+                **options
             )
             
             # Combine all segments into full text
             text = " ".join([segment.text for segment in segments])
+            if language is None:
+                logger.info(f"Detected language: {info.language} ({info.language_probability:.2f})")
             logger.info(f"Transcription completed: {text[:50]}...")
             return text.strip()
         
@@ -56,18 +105,42 @@ class STTEngine:
             logger.error(f"Error transcribing audio: {str(e)}")
             raise
     
-    def transcribe_stream(self, audio_data: bytes, language: str = "en") -> str:
+    def transcribe_mulaw(self, audio_data: bytes, language: str = "en",
+                         hints: Optional[DecodingHints] = None) -> str:
+        """
+        Transcribe raw 8 kHz μ-law audio (Twilio media) without touching disk
+        
+        Args:
+            audio_data: μ-law encoded bytes
+            language: Language code (default: "en")
+            hints: Decoding hints for the turn
+            
+        Returns:
+            Transcribed text
+        """
+        return self.transcribe(audio_codec.twilio_to_whisper(audio_data), language, hints)
+    
+    def transcribe_stream(self, audio_data: bytes, language: str = "en",
+                          hints: Optional[DecodingHints] = None) -> str:
         """
         Transcribe audio data from stream
         
         Args:
             audio_data: Audio bytes
             language: Language code (default: "en")
+            hints: Decoding hints for the turn
             
         Returns:
             Transcribed text
         """
         try:
+            # PCM WAV is decoded and resampled in-process
+            if audio_data[:4] == b"RIFF":
+                samples, rate = audio_codec.decode_wav(audio_data)
+                samples = audio_codec.resample(samples, rate, audio_codec.WHISPER_SAMPLE_RATE)
+                return self.transcribe(samples, language, hints)
+            
+            # Other containers still go through a temp file for ffmpeg
             # Save temporary audio file
             import tempfile
             with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp_file:
@@ -75,7 +148,7 @@ class STTEngine:
                 tmp_path = tmp_file.name
             
             try:
-                text = self.transcribe(tmp_path, language)
+                text = self.transcribe(tmp_path, language, hints)
             finally:
                 # Clean up temp file
                 if os.path.exists(tmp_path):
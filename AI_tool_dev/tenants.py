@@ -0,0 +1,244 @@
+"""
+Per-number business configuration for multi-tenant deployments
+
+Each business (tenant) is identified by the Twilio number callers dial.
+All tenants are loaded from the tenants table into an in-memory map keyed
+by E.164 number, so resolving a call's tenant is a dictionary lookup with
+no database access. Every create, update and delete bumps the single-row
+tenant_config_version counter in the same transaction; refresh() compares
+it with the loaded snapshot's and swaps in a new map only when it moved.
+
+Usage:
+    python tenants.py --list
+    python tenants.py --set +15551234567 --name "Main Street Dental" --hours "Mon-Fri 8 to 4"
+    python tenants.py --delete +15551234567
+"""
+import argparse
+import logging
+import sys
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+from database import Tenant, TenantConfigVersion, SQLALCHEMY_AVAILABLE
+from phone_numbers import normalize
+
+if SQLALCHEMY_AVAILABLE:
+    from sqlalchemy import func
+
+logger = logging.getLogger(__name__)
+
+
+class TenantConfig(NamedTuple):
+    """Immutable snapshot of one tenant's configuration"""
+    phone_number: Optional[str]
+    name: str
+    greeting: str
+    office_hours: str
+    location: str
+    contact: str
+    booking_enabled: bool = True
+    voice: str = "alice"
+    language: str = "en-US"
+
+    def __deepcopy__(self, memo):
+        # Snapshots are shared, never mutated
+        return self
+
+
+# The single-business defaults, used for numbers with no tenant row
+DEFAULT_TENANT = TenantConfig(
+    phone_number=None,
+    name="our office",
+    greeting="Hello! Thank you for calling. I'm your AI receptionist. How can I help you today?",
+    office_hours="Our office hours are Monday through Friday, 9 AM to 5 PM. We're closed on weekends.",
+    location="We're located at 123 Main Street, City, State, 12345. Would you like directions?",
+    contact="You can reach us at 555-1234 during business hours, or email us at info@example.com."
+)
+
+
+def _to_config(row) -> TenantConfig:
+    """Build a snapshot from a Tenant row, filling gaps from the defaults"""
+    return TenantConfig(
+        phone_number=row.phone_number,
+        name=row.name,
+        greeting=row.greeting or f"Hello! Thank you for calling {row.name}. How can I help you today?",
+        office_hours=row.office_hours or DEFAULT_TENANT.office_hours,
+        location=row.location or DEFAULT_TENANT.location,
+        contact=row.contact or DEFAULT_TENANT.contact,
+        booking_enabled=True if row.booking_enabled is None else row.booking_enabled,
+        voice=row.voice or DEFAULT_TENANT.voice,
+        language=row.language or DEFAULT_TENANT.language
+    )
+
+
+class TenantRegistry:
+    """In-memory tenant map with versioned reload"""
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+        self._by_number: Dict[str, TenantConfig] = {}
+        self.version: Optional[int] = None  # None until the first load
+        self._reload_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_number)
+
+    def resolve(self, dialed_number: Optional[str]) -> TenantConfig:
+        """
+        Tenant for a dialed number
+
+        Args:
+            dialed_number: The Twilio number of the call, in any format
+
+        Returns:
+            The tenant's configuration, or DEFAULT_TENANT
+        """
+        if not dialed_number:
+            return DEFAULT_TENANT
+        tenant = self._by_number.get(dialed_number)
+        if tenant is None:
+            e164, _ = normalize(dialed_number)
+            tenant = self._by_number.get(e164, DEFAULT_TENANT)
+        return tenant
+
+    def load(self, db) -> bool:
+        """
+        Reload tenants from the database if the table changed
+
+        Returns:
+            True if a new snapshot was swapped in
+        """
+        with self._reload_lock:
+            version = db.query(TenantConfigVersion.version).filter(TenantConfigVersion.id == 1).scalar() or 0
+            if version == self.version:
+                return False
+            # Build the new map aside, then swap it in with one assignment
+            self._by_number = {row.phone_number: _to_config(row) for row in db.query(Tenant)}
+            self.version = version
+            logger.info(f"Loaded {len(self._by_number)} tenants (version {version})")
+            return True
+
+    def refresh(self) -> bool:
+        """Reload from a fresh session (safe to call from a worker thread)"""
+        if not SQLALCHEMY_AVAILABLE:
+            return False
+        if self._session_factory is None:
+            from database import SessionLocal
+            self._session_factory = SessionLocal
+        db = self._session_factory()
+        try:
+            return self.load(db)
+        finally:
+            db.close()
+
+
+tenant_registry = TenantRegistry()
+
+
+def bump_version(db) -> int:
+    """Advance the tenant config version in the caller's transaction; returns the new version"""
+    updated = db.query(TenantConfigVersion).filter(TenantConfigVersion.id == 1).update(
+        {TenantConfigVersion.version: TenantConfigVersion.version + 1}, synchronize_session=False
+    )
+    if not updated:
+        # First change since the counter was added; start above any existing row version
+        db.add(TenantConfigVersion(id=1, version=(db.query(func.max(Tenant.version)).scalar() or 0) + 1))
+        db.flush()
+    return db.query(TenantConfigVersion.version).filter(TenantConfigVersion.id == 1).scalar()
+
+
+def save_tenant(db, phone_number: str, **fields) -> Tenant:
+    """
+    Create or update a tenant and bump the config version; the caller commits
+
+    Args:
+        db: Database session
+        phone_number: Dialed number in any format
+        **fields: Tenant columns to set
+
+    Returns:
+        The Tenant row
+    """
+    e164, error = normalize(phone_number)
+    if e164 is None:
+        raise ValueError(f"Invalid tenant number {phone_number}: {error.name}")
+    tenant = db.query(Tenant).filter(Tenant.phone_number == e164).first()
+    if tenant is None:
+        tenant = Tenant(phone_number=e164, name=fields.pop("name", e164))
+        db.add(tenant)
+    for key, value in fields.items():
+        setattr(tenant, key, value)
+    tenant.version = bump_version(db)
+    return tenant
+
+
+def delete_tenant(db, phone_number: str) -> bool:
+    """
+    Delete a tenant and bump the config version; the caller commits
+
+    Returns:
+        False if the number has no tenant
+    """
+    e164, _ = normalize(phone_number)
+    deleted = db.query(Tenant).filter(Tenant.phone_number == e164).delete()
+    if deleted:
+        bump_version(db)
+    return bool(deleted)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Manage per-number tenant configuration")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--list", action="store_true", help="List tenants")
+    action.add_argument("--set", metavar="NUMBER", help="Create or update the tenant for a number")
+    action.add_argument("--delete", metavar="NUMBER", help="Delete the tenant for a number")
+    parser.add_argument("--name")
+    parser.add_argument("--greeting")
+    parser.add_argument("--hours", dest="office_hours")
+    parser.add_argument("--location")
+    parser.add_argument("--contact")
+    parser.add_argument("--voice")
+    parser.add_argument("--language")
+    parser.add_argument("--no-booking", dest="booking_enabled", action="store_false", default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if not SQLALCHEMY_AVAILABLE:
+        logger.error("SQLAlchemy not available")
+        return 1
+
+    from database import SessionLocal, init_db, write_session
+    init_db()
+
+    if args.list:
+        db = SessionLocal()
+        try:
+            for tenant in db.query(Tenant).order_by(Tenant.phone_number):
+                print(f"{tenant.phone_number}  {tenant.name}  (version {tenant.version})")
+        finally:
+            db.close()
+        return 0
+
+    with write_session() as db:
+        if args.delete:
+            deleted = delete_tenant(db, args.delete)
+            db.commit()
+            if not deleted:
+                logger.error(f"No tenant for {args.delete}")
+                return 1
+            return 0
+        fields = {
+            key: getattr(args, key)
+            for key in ("name", "greeting", "office_hours", "location", "contact", "voice", "language",
+                        "booking_enabled")
+            if getattr(args, key) is not None
+        }
+        tenant = save_tenant(db, args.set, **fields)
+        db.commit()
+        logger.info(f"Saved tenant {tenant.phone_number} (version {tenant.version})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
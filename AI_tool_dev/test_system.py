@@ -88,6 +88,1088 @@ def test_conversation():
         return False
 
 
+def test_lazy_imports():
+    """Test deferred imports of heavy optional backends"""
+    print("\nTesting lazy imports...")
+    try:
+        import sys
+        from lazy_imports import LazyModule, import_timings, is_available, parse_importtime
+        
+        assert is_available("json.decoder") and not is_available("no_such_package.api")
+        sys.modules.pop("colorsys", None)
+        module = LazyModule("colorsys")
+        assert not module.is_loaded and "colorsys" not in sys.modules, "nothing is imported before first use"
+        assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+        assert module.is_loaded and "colorsys" in import_timings
+        
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   zipimport\n"
+            "import time:      5000 |      90000 | torch\n"
+            "import time:       300 |       4000 |   numpy.core\n"
+            "unrelated line\n"
+        )
+        assert parse_importtime(output) == [("torch", 5000, 90000), ("numpy.core", 300, 4000), ("zipimport", 120, 120)]
+        assert parse_importtime(output, limit=1) == [("torch", 5000, 90000)]
+        print("[OK] Modules imported on first use; importtime output ranked")
+        return True
+    except Exception as e:
+        print(f"[X] Lazy import test failed: {str(e)}")
+        return False
+
+
+def test_metrics():
+    """Test latency metrics"""
+    print("\nTesting metrics...")
+    try:
+        from metrics import MetricsRegistry
+        registry = MetricsRegistry()
+        histogram = registry.histogram("test_seconds", "Test histogram", ("stage",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "nlu")
+        histogram.observe(0.5, "nlu")
+        histogram.observe(5.0, "nlu")
+        
+        text = registry.render()
+        assert 'test_seconds_bucket{stage="nlu",le="0.1"} 1' in text
+        assert 'test_seconds_bucket{stage="nlu",le="+Inf"} 3' in text
+        assert 'test_seconds_count{stage="nlu"} 3' in text
+        
+        import logging
+        from metrics import CallSidFilter, current_call_sid
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "message", None, None)
+        token = current_call_sid.set("CA0001")
+        try:
+            assert CallSidFilter().filter(record) and record.call_sid == "CA0001"
+        finally:
+            current_call_sid.reset(token)
+        CallSidFilter().filter(record)
+        assert record.call_sid == "-"
+        print("[OK] Histogram rendered in Prometheus format")
+        return True
+    except Exception as e:
+        print(f"[X] Metrics test failed: {str(e)}")
+        return False
+
+
+def test_profiler():
+    """Test the sampling profiler and its output formats"""
+    print("\nTesting sampling profiler...")
+    try:
+        import threading
+        import time
+        from profiler import Profile, ProfileStore, SamplingProfiler, render_profile
+        
+        profile = Profile("unit")
+        root, leaf = ("handler", "main.py", 10), ("synthesize", "tts.py", 5)
+        for _ in range(3):
+            profile.add((root, leaf))
+        profile.add((root,))
+        assert render_profile(profile, "collapsed", 0.01) == \
+            "handler (main.py:10);synthesize (tts.py:5) 3\nhandler (main.py:10) 1\n"
+        document = render_profile(profile, "speedscope", 0.01)
+        assert document["shared"]["frames"] == [
+            {"name": "handler", "file": "main.py", "line": 10}, {"name": "synthesize", "file": "tts.py", "line": 5}
+        ]
+        sampled = document["profiles"][0]
+        assert sampled["samples"] == [[0, 1], [0]] and abs(sampled["endValue"] - 0.04) < 1e-9
+        try:
+            render_profile(profile, "pprof", 0.01)
+            raise AssertionError("unknown formats must be refused")
+        except ValueError:
+            pass
+        
+        # Sample only a busy thread
+        stop = threading.Event()
+        
+        def spin():
+            while not stop.is_set():
+                sum(range(1000))
+        
+        worker = threading.Thread(target=spin)
+        worker.start()
+        sampler = SamplingProfiler(interval=0.001, thread_ids=[worker.ident], name="spin")
+        sampler.start()
+        time.sleep(0.05)
+        captured = sampler.stop()
+        stop.set()
+        worker.join()
+        assert captured.samples > 0 and all(
+            any(frame[0] == "spin" for frame in stack) for stack in captured.stacks)
+        
+        # Sample one request's task and the executor work it submits, not its neighbours on the loop
+        import asyncio
+        from profiler import attribute_loop, current_profile
+        
+        def crunch():
+            end = time.monotonic() + 0.1
+            while time.monotonic() < end:
+                sum(range(1000))
+        
+        async def neighbour():
+            crunch()
+        
+        async def request():
+            await asyncio.get_running_loop().run_in_executor(None, crunch)
+            crunch()
+        
+        async def scenario():
+            attribute_loop(asyncio.get_running_loop())
+            other = asyncio.ensure_future(neighbour())
+            token = current_profile.set("request")
+            task = asyncio.ensure_future(request())
+            current_profile.reset(token)
+            sampler = SamplingProfiler(interval=0.001, name="request", tag="request")
+            sampler.start()
+            await asyncio.gather(task, other)
+            return sampler.stop()
+        
+        captured = asyncio.run(scenario())
+        names = {frame[0] for stack in captured.stacks for frame in stack}
+        assert {"_run_tagged", "request"} <= names, "the request's task and its executor work must be sampled"
+        assert "neighbour" not in names, "other tasks on the loop must not be sampled"
+        
+        store = ProfileStore(max_profiles=1)
+        first = store.put(profile)
+        second = store.put(captured)
+        assert store.get(first) is None and store.get(second) is captured
+        print("[OK] Stacks sampled and rendered as collapsed and speedscope")
+        return True
+    except Exception as e:
+        print(f"[X] Profiler test failed: {str(e)}")
+        return False
+
+
+def test_audio_codec():
+    """Test in-process audio codecs and resampling"""
+    print("\nTesting audio codec...")
+    try:
+        import numpy as np
+        import audio_codec
+        
+        # One second of a 440 Hz tone at Twilio's rate
+        t = np.arange(8000) / 8000.0
+        tone = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+        pcm = audio_codec.float32_to_pcm16(tone)
+        
+        decoded = audio_codec.ulaw_decode(audio_codec.ulaw_encode(pcm).tobytes())
+        assert np.max(np.abs(decoded.astype(np.int32) - pcm)) < 1100
+        decoded = audio_codec.alaw_decode(audio_codec.alaw_encode(pcm).tobytes())
+        assert np.max(np.abs(decoded.astype(np.int32) - pcm)) < 1100
+        print("[OK] μ-law and A-law round trip")
+        
+        upsampled = audio_codec.twilio_to_whisper(audio_codec.ulaw_encode(pcm).tobytes())
+        assert len(upsampled) == 16000 and upsampled.dtype == np.float32
+        narrowband = audio_codec.to_twilio(np.zeros(22050, dtype=np.float32))
+        assert len(narrowband) == 8000
+        print("[OK] Resampled 8k -> 16k and 22.05k -> 8k")
+        return True
+    except Exception as e:
+        print(f"[X] Audio codec test failed: {str(e)}")
+        return False
+
+
+def test_audio_probe():
+    """Test header-only audio probing"""
+    print("\nTesting audio probe...")
+    try:
+        import tempfile
+        import wave
+        from audio_probe import probe_many
+        from utils import get_audio_duration
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "call.wav")
+            with wave.open(path, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(8000)
+                wav.writeframes(b"\x00\x00" * 8000 * 2)
+            
+            assert get_audio_duration(path) == 2.0
+            info = probe_many([path])[path]
+            assert (info.sample_rate, info.channels, info.format) == (8000, 1, "wav")
+            
+            # A header miss without decoding must not hide the decoded result
+            import audio_probe
+            raw = os.path.join(tmp_dir, "call.ulaw")
+            with open(raw, "wb") as f:
+                f.write(b"\xff" * 8000)
+            decode = audio_probe._probe_decoded
+            audio_probe._probe_decoded = lambda p: audio_probe.AudioInfo(1.0, 8000, 1, "decoded")
+            try:
+                assert audio_probe.probe(raw, allow_decode=False) is None
+                assert audio_probe.probe(raw).format == "decoded"
+            finally:
+                audio_probe._probe_decoded = decode
+        print("[OK] WAV duration read from header")
+        return True
+    except Exception as e:
+        print(f"[X] Audio probe test failed: {str(e)}")
+        return False
+
+
+def test_phone_numbers():
+    """Test phone number normalization"""
+    print("\nTesting phone number normalization...")
+    try:
+        from phone_numbers import normalize_batch, PhoneError
+        
+        e164, errors = normalize_batch(
+            ["(555) 123-4567", "+44 20 7946 0958", "555-1234", "(555) 123-4567", None],
+            default_region="US"
+        )
+        assert list(e164[:2]) == ["+15551234567", "+442079460958"]
+        assert e164[3] == e164[0]
+        assert list(errors) == [PhoneError.OK, PhoneError.OK, PhoneError.TOO_SHORT,
+                                PhoneError.OK, PhoneError.EMPTY]
+        
+        from utils import validate_phone_number
+        assert validate_phone_number("+44 (0)20 7946 0958"), "the (0) trunk prefix is optional"
+        assert validate_phone_number("+354 555 1234 567"), "countries without a rule are checked by length"
+        assert not validate_phone_number("+354 555")
+        assert not validate_phone_number("555-1234")
+        print("[OK] Batch normalized to E.164 with per-row errors")
+        return True
+    except Exception as e:
+        print(f"[X] Phone number test failed: {str(e)}")
+        return False
+
+
+def test_webhook_replay():
+    """Test idempotent webhook responses"""
+    print("\nTesting webhook replay cache...")
+    try:
+        import asyncio
+        from idempotency import ResponseCache, request_fingerprint
+        
+        cache = ResponseCache(max_entries=2, ttl=60)
+        calls = []
+        
+        def render():
+            calls.append(1)
+            return f"<Response>{len(calls)}</Response>"
+        
+        first = request_fingerprint("POST", "/twilio/process-speech", "turn=1", [("CallSid", "CA1"), ("SpeechResult", "yes")])
+        retry = request_fingerprint("POST", "/twilio/process-speech", "turn=1", [("SpeechResult", "yes"), ("CallSid", "CA1")])
+        assert first == retry
+        assert first != request_fingerprint("POST", "/twilio/process-speech", "turn=2", [("CallSid", "CA1"), ("SpeechResult", "yes")])
+        
+        async def run():
+            a = await cache.get_or_render(("CA1", first), "test", render)
+            b = await cache.get_or_render(("CA1", retry), "test", render)
+            return a, b
+        
+        a, b = asyncio.run(run())
+        assert a == b and len(calls) == 1
+        print("[OK] Retried request replayed without re-rendering")
+        return True
+    except Exception as e:
+        print(f"[X] Webhook replay test failed: {str(e)}")
+        return False
+
+
+def test_speculation():
+    """Test speculative turns from partial speech results"""
+    print("\nTesting speculative turns...")
+    try:
+        from conversation_flow import ConversationManager
+        from speculation import SpeculationCache
+        
+        cache = SpeculationCache()
+        manager = ConversationManager()
+        render = lambda m, reply: f"<Response>{reply}</Response>"
+        cache.prepare("CA1", manager, "I want to book an appointment", render)
+        assert manager.turn_count == 0, "live manager must not change"
+        
+        speculation = cache.take("CA1", manager, "I want to book an appointment.")
+        assert speculation is not None
+        assert speculation.manager.state.value == "appointment_booking"
+        assert cache.take("CA1", manager, "I want to book an appointment") is None
+        print("[OK] Matching final result reuses the prepared turn")
+        return True
+    except Exception as e:
+        print(f"[X] Speculation test failed: {str(e)}")
+        return False
+
+
+def test_storage_engine():
+    """Test the tuned SQLite engine and write sessions"""
+    print("\nTesting storage engine...")
+    import database
+    engine_before, sessions_before = database.engine, database.WriteSessionLocal
+    try:
+        import sqlite3
+        import tempfile
+        from sqlalchemy import text
+        from sqlalchemy.orm import sessionmaker
+        from config import settings
+        from database import Base, CallLog, create_storage_engine, resolve_profile, write_session
+        
+        assert resolve_profile("sqlite:///x.db") == "sqlite" and resolve_profile("postgresql://h/db") == "server"
+        path = os.path.join(tempfile.mkdtemp(), "calls.db")
+        engine = create_storage_engine(f"sqlite:///{path}", "sqlite")
+        Base.metadata.create_all(bind=engine)
+        with engine.connect() as conn:
+            pragma = lambda name: conn.execute(text(f"PRAGMA {name}")).scalar()
+            assert pragma("journal_mode") == "wal"
+            assert pragma("synchronous") == 1, "NORMAL"
+            assert pragma("busy_timeout") == settings.sqlite_busy_timeout_ms
+            assert pragma("cache_size") == -settings.sqlite_cache_size_kb
+        
+        database.engine = engine
+        database.WriteSessionLocal = sessionmaker(bind=engine.execution_options(sqlite_begin="IMMEDIATE"))
+        with write_session() as db:
+            db.execute(text("SELECT count(*) FROM call_logs"))
+            # The write lock is taken at BEGIN, before the first write
+            other = sqlite3.connect(path, timeout=0)
+            try:
+                other.execute("BEGIN IMMEDIATE")
+                raise AssertionError("a second writer must wait for the write lock")
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                other.close()
+            db.add(CallLog(call_sid="CA1", status="completed"))
+            db.commit()
+        try:
+            with write_session() as db:
+                db.add(CallLog(call_sid="CA2"))
+                db.flush()
+                raise RuntimeError("handler failed")
+        except RuntimeError:
+            pass
+        assert not database._sqlite_writer_lock.locked(), "the writer lock must be released on error"
+        with engine.connect() as conn:
+            assert [row[0] for row in conn.execute(text("SELECT call_sid FROM call_logs"))] == ["CA1"]
+        print("[OK] WAL pragmas applied; writers serialized and rolled back on error")
+        return True
+    except Exception as e:
+        print(f"[X] Storage engine test failed: {str(e)}")
+        return False
+    finally:
+        database.engine, database.WriteSessionLocal = engine_before, sessions_before
+
+
+def test_tenants():
+    """Test per-number tenant configuration"""
+    print("\nTesting tenant configuration...")
+    try:
+        from sqlalchemy.orm import sessionmaker
+        from database import Base, create_storage_engine
+        from tenants import DEFAULT_TENANT, TenantRegistry, delete_tenant, save_tenant
+        from conversation_flow import ConversationManager
+        
+        engine = create_storage_engine("sqlite://", "sqlite")
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(bind=engine)
+        db = Session()
+        save_tenant(db, "+1 (555) 222-3333", name="Main Street Dental", office_hours="Open 8 to 4.")
+        db.commit()
+        db.close()
+        
+        registry = TenantRegistry(Session)
+        assert registry.refresh() is True
+        assert registry.refresh() is False, "unchanged table must not reload"
+        tenant = registry.resolve("555-222-3333")
+        assert tenant.name == "Main Street Dental"
+        assert registry.resolve("+15559999999") is DEFAULT_TENANT
+        
+        # Replacing the newest tenant leaves the row count and max row version as they were
+        db = Session()
+        assert delete_tenant(db, "+15552223333")
+        save_tenant(db, "+15554445555", name="Oak Dental")
+        db.commit()
+        db.close()
+        assert registry.refresh() is True, "delete + add must be seen as a change"
+        assert registry.resolve("+15552223333") is DEFAULT_TENANT and registry.resolve("+15554445555").name == "Oak Dental"
+        db = Session()
+        save_tenant(db, "+15554445555", name="Main Street Dental", office_hours="Open 8 to 4.")
+        db.commit()
+        db.close()
+        assert registry.refresh() is True
+        tenant = registry.resolve("+15554445555")
+        
+        manager = ConversationManager(tenant)
+        assert manager.process_user_input("What are your hours?") == "Open 8 to 4."
+        print("[OK] Dialed number resolved to its tenant's replies")
+        return True
+    except Exception as e:
+        print(f"[X] Tenant test failed: {str(e)}")
+        return False
+
+
+def test_transcript_search():
+    """Test full-text transcript search"""
+    print("\nTesting transcript search...")
+    try:
+        from sqlalchemy import text
+        from sqlalchemy.orm import sessionmaker
+        from database import Base, CallLog, create_storage_engine
+        from transcript_search import SQLiteFTSBackend, build_fts_query
+        
+        assert build_fts_query('"root canal" clean* OR NEAR(') == '"root canal" "clean"* OR "NEAR("'
+        engine = create_storage_engine("sqlite://", "sqlite")
+        Base.metadata.create_all(bind=engine)
+        backend = SQLiteFTSBackend()
+        backend.setup(bind=engine)
+        db = sessionmaker(bind=engine)()
+        # Five calls, each with several matching turns
+        for number in range(5):
+            call_sid = f"CA{number}"
+            db.add(CallLog(call_sid=call_sid, transcript=""))
+            for turn in range(number + 1):
+                backend.index_turn(db, call_sid, f"User: I need a cleaning, visit {turn}")
+        db.commit()
+        
+        page = backend.search(db, "cleaning", limit=2)
+        assert page.total == 5 and len(page.hits) == 2, "total counts calls, not the page"
+        assert "<mark>cleaning</mark>" in page.hits[0]["snippet"]
+        paged = [hit["call_sid"] for offset in range(0, 6, 2) for hit in backend.search(db, "cleaning", 2, offset).hits]
+        assert sorted(paged) == [f"CA{number}" for number in range(5)], "every call appears on exactly one page"
+        assert backend.search(db, "cleaning", 2, 10) == ([], 5)
+        
+        backend.index_transcript(db, "CA4", "User: cancel my appointment")
+        backend.remove_call(db, "CA3")
+        db.commit()
+        assert backend.search(db, "cleaning").total == 3
+        assert [hit["call_sid"] for hit in backend.search(db, "cancel").hits] == ["CA4"]
+        assert db.execute(text(f"SELECT count(*) FROM {backend.rows} WHERE call_sid = 'CA3'")).scalar() == 0
+        db.close()
+        print("[OK] Calls found, ranked and paged by call")
+        return True
+    except Exception as e:
+        print(f"[X] Transcript search test failed: {str(e)}")
+        return False
+
+
+def test_rollups():
+    """Test incrementally maintained call rollups"""
+    print("\nTesting call rollups...")
+    try:
+        from datetime import datetime
+        from sqlalchemy.orm import sessionmaker
+        from database import ArchivedCall, Base, CallLog, create_storage_engine
+        import rollups
+        
+        engine = create_storage_engine("sqlite://", "sqlite")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        day = datetime(2026, 3, 2, 9, 30)
+        for number, created_at in enumerate((datetime(2026, 3, 1, 10), day, day)):
+            call_log = CallLog(call_sid=f"CA{number}", direction="inbound", status="in-progress", created_at=created_at)
+            db.add(call_log)
+            rollups.record_call(db, call_log, is_new=True)
+        db.commit()
+        
+        call_log = db.query(CallLog).filter(CallLog.call_sid == "CA1").first()
+        call_log.status, call_log.duration = "completed", 60.0
+        rollups.record_call(db, call_log, "in-progress", None)
+        db.commit()
+        stats = rollups.query_stats(db, datetime(2026, 3, 1), datetime(2026, 3, 3), "day")
+        assert stats["totals"]["calls"] == 3 and stats["totals"]["by_status"] == {"in-progress": 2, "completed": 1}
+        assert [point["calls"] for point in stats["series"]] == [1, 2]
+        assert stats["series"][1]["average_duration"] == 30.0 and stats["series"][1]["completion_rate"] == 0.5
+        
+        # Archive the first day's call; compacting must keep its buckets
+        db.delete(db.query(CallLog).filter(CallLog.call_sid == "CA0").first())
+        db.add(ArchivedCall(call_sid="CA0", partition="2026-03-01", path="x", offset=0, length=0))
+        db.commit()
+        rollups.compact(db)
+        stats = rollups.query_stats(db, datetime(2026, 3, 1), datetime(2026, 3, 3), "day")
+        assert [point["calls"] for point in stats["series"]] == [1, 2], "compaction must not drop archived days"
+        assert stats["totals"]["by_status"] == {"in-progress": 2, "completed": 1}
+        db.close()
+        print("[OK] Rollups follow status changes and survive compaction")
+        return True
+    except Exception as e:
+        print(f"[X] Rollup test failed: {str(e)}")
+        return False
+
+
+def test_retention():
+    """Test archiving old calls into compressed partitions"""
+    print("\nTesting call log retention...")
+    from config import settings
+    archive_dir = settings.archive_dir
+    try:
+        import tempfile
+        from datetime import datetime
+        from sqlalchemy.orm import sessionmaker
+        from database import Base, CallLog, create_storage_engine
+        from transcript_search import get_backend
+        from retention import archive_batch, get_archived_call
+        
+        settings.archive_dir = tempfile.mkdtemp()
+        engine = create_storage_engine("sqlite://", "sqlite")
+        Base.metadata.create_all(bind=engine)
+        search_backend = get_backend()
+        search_backend.setup(bind=engine)
+        db = sessionmaker(bind=engine)()
+        for number, created_at in enumerate((datetime(2026, 3, 1, 8), datetime(2026, 3, 1, 9), datetime(2026, 6, 1))):
+            call_sid = f"CA{number}"
+            db.add(CallLog(call_sid=call_sid, phone_number="+15551234567", direction="inbound", status="completed",
+                           transcript=f"User: reschedule visit {number}", duration=30.0, created_at=created_at))
+            search_backend.index_turn(db, call_sid, f"User: reschedule visit {number}")
+        db.commit()
+        
+        # One call per batch, so the day's file holds two frames
+        cutoff = datetime(2026, 5, 1)
+        assert archive_batch(db, cutoff, 1) == 1 and archive_batch(db, cutoff, 1) == 1
+        assert archive_batch(db, cutoff, 1) == 0
+        assert [log.call_sid for log in db.query(CallLog)] == ["CA2"]
+        assert [hit["call_sid"] for hit in search_backend.search(db, "reschedule").hits] == ["CA2"]
+        
+        record = get_archived_call(db, "CA1")
+        assert record["transcript"] == "User: reschedule visit 1" and record["created_at"] == "2026-03-01T09:00:00"
+        assert get_archived_call(db, "CA0")["duration"] == 30.0
+        assert get_archived_call(db, "CA2") is None
+        files = [name for _, _, names in os.walk(settings.archive_dir) for name in names]
+        assert len(files) == 1 and files[0].startswith("calls.ndjson"), "one file per day"
+        db.close()
+        print("[OK] Old calls archived in batches and read back from their frames")
+        return True
+    except Exception as e:
+        print(f"[X] Retention test failed: {str(e)}")
+        return False
+    finally:
+        settings.archive_dir = archive_dir
+
+
+def test_media_store():
+    """Test the synthesized prompt store"""
+    print("\nTesting media store...")
+    try:
+        import tempfile
+        from media_store import MediaStore, media_id_for
+        
+        store = MediaStore(tempfile.mkdtemp())
+        renders = []
+        media_id = media_id_for("Hello", "model", "speaker")
+        assert media_id != media_id_for("Hello", "model", "other")
+        for _ in range(2):
+            store.get_or_create(media_id, lambda: renders.append(1) or b"RIFF")
+        assert len(renders) == 1, "repeat prompts must not be re-rendered"
+        assert store.path_for("../etc/passwd") is None
+        assert store.lookup(media_id)
+        
+        # Misses are synthesized in the background, and queued once however often they are asked for
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        other = media_id_for("Goodbye", "model", "speaker")
+        release = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        create = lambda: release.wait(5) and store.get_or_create(other, lambda: b"RIFF")
+        assert not store.lookup(other)
+        assert store.schedule(other, create, executor)
+        assert not store.schedule(other, create, executor), "a queued prompt must not be queued again"
+        release.set()
+        executor.shutdown(wait=True)
+        assert store.lookup(other)
+        print("[OK] Prompt rendered once and addressed by hash")
+        return True
+    except Exception as e:
+        print(f"[X] Media store test failed: {str(e)}")
+        return False
+
+
+def test_tts_fragments():
+    """Test templated prompts assembled from cached fragments"""
+    print("\nTesting TTS fragment stitching...")
+    try:
+        import numpy as np
+        from conversation_flow import TemplatedText
+        from tts_fragments import FragmentSynthesizer, crossfade_concat, speech_units
+        
+        class ToneEngine:
+            """Renders a fixed-length tone per fragment, counting calls"""
+            model_name, voice = "tone", "default"
+            
+            def __init__(self):
+                self.calls = []
+            
+            def synthesize_samples(self, text, background=False):
+                self.calls.append(text)
+                return np.full(1000, 0.5, dtype=np.float32), 8000
+        
+        template = "Booked for {name} on {date} at {time}. Anything else?"
+        assert speech_units(template, {"name": "Ana", "date": "Tuesday, March 17", "time": "4:30 PM"}) == [
+            "Booked for", "Ana", "on", "Tuesday", "March", "17", "at", "4:30 PM", "Anything else?"
+        ]
+        joined = crossfade_concat([np.ones(100, np.float32), np.zeros(100, np.float32)], 10)
+        assert len(joined) == 190 and joined[89] == 1.0 and 0.0 < joined[95] < 1.0 and joined[100] == 0.0
+        
+        engine = ToneEngine()
+        fragments = FragmentSynthesizer(engine, crossfade_ms=1.0)
+        text = TemplatedText(template, name="Ana", date="Tuesday, March 17", time="4:30 PM")
+        assert text == "Booked for Ana on Tuesday, March 17 at 4:30 PM. Anything else?"
+        samples, rate = fragments.render(text.template, text.slots)
+        assert rate == 8000 and len(samples) == 9 * 1000 - 8 * 8
+        
+        engine.calls.clear()
+        fragments.render(template, {"name": "Bob", "date": "Monday, March 16", "time": "4:30 PM"})
+        assert engine.calls == ["Bob", "Monday", "16"], "only unseen words are synthesized"
+        try:
+            FragmentSynthesizer(ToneEngine()).render("{name}.", {"name": " "})
+            raise AssertionError("an empty prompt must be refused")
+        except ValueError:
+            pass
+        print("[OK] Templated prompt stitched; only new slot words synthesized")
+        return True
+    except Exception as e:
+        print(f"[X] TTS fragment test failed: {str(e)}")
+        return False
+
+
+def _sidecar_tone_engine(model_name, voice):
+    """Engine factory for the sidecar test; must be importable by spawned workers"""
+    import time
+    import numpy as np
+    
+    class ToneEngine:
+        def synthesize_samples(self, text):
+            if text == "slow":
+                time.sleep(1.0)
+            return np.linspace(-1.0, 1.0, 100 * len(text), dtype=np.float32), 16000
+    
+    return ToneEngine()
+
+
+def test_tts_sidecar():
+    """Test synthesis through the out-of-process TTS sidecar"""
+    print("\nTesting TTS sidecar...")
+    server = None
+    try:
+        import tempfile
+        import threading
+        import numpy as np
+        from tts_module import TTSEngine
+        from tts_sidecar import SidecarClient, SidecarServer
+        
+        socket_path = os.path.join(tempfile.mkdtemp(), "tts.sock")
+        server = SidecarServer(socket_path, workers=1, threads=1, model_name="tone", voice="default",
+                               buffer_seconds=0.01, engine_factory=_sidecar_tone_engine)
+        server.start()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        
+        engine = TTSEngine("tone", "default", sidecar_socket=socket_path)
+        assert engine.available and engine.tts is None, "client mode must not load a model"
+        for text in ("Hello", "A prompt longer than the worker's initial shared-memory buffer"):
+            samples, rate = engine.synthesize_samples(text)
+            assert rate == 16000 and np.array_equal(samples, np.linspace(-1.0, 1.0, 100 * len(text), dtype=np.float32))
+        assert len(engine.sidecar._idle) == 1, "connection should be reused"
+        
+        # A slow reply on a pooled connection times out once instead of being sent again
+        import socket
+        import time
+        client = SidecarClient(socket_path, timeout=0.3)
+        client.synthesize("Hello", "tone", "default")
+        started = time.monotonic()
+        try:
+            client.synthesize("slow", "tone", "default")
+            raise AssertionError("a slow reply must time out")
+        except socket.timeout:
+            pass
+        assert time.monotonic() - started < 0.5 and not client._idle, "timed-out connection must be dropped"
+        time.sleep(1.0)
+        assert client.synthesize("Hello", "tone", "default")[1] == 16000
+        client.close()
+        
+        try:
+            TTSEngine("other", "default", sidecar_socket=socket_path).synthesize_samples("Hello")
+            raise AssertionError("sidecar must refuse another model")
+        except RuntimeError:
+            pass
+        print("[OK] Audio returned from the sidecar through shared memory")
+        return True
+    except Exception as e:
+        print(f"[X] TTS sidecar test failed: {str(e)}")
+        return False
+    finally:
+        if server is not None:
+            server.close()
+
+
+def test_call_recording():
+    """Test memory-mapped recording of caller audio"""
+    print("\nTesting call recording...")
+    try:
+        import mmap
+        import tempfile
+        from call_recorder import CallRecorder, RecordingIndex
+        
+        root = tempfile.mkdtemp()
+        # 800-byte segments and a 400-byte ring, so a short call rolls over
+        recorder = CallRecorder(root, segment_seconds=0.1, ring_seconds=0.05)
+        audio = bytes(i % 251 for i in range(2000))
+        call_sid = "CA" + "0" * 31 + "1"
+        for bad in ("CA0001", "../../etc/passwd", "CA" + "0" * 31 + "/"):
+            try:
+                recorder.open(bad)
+                raise AssertionError(f"{bad!r} must be rejected")
+            except ValueError:
+                pass
+        assert not recorder.claim(call_sid), "only streams the server requested are accepted"
+        recorder.expect(call_sid)
+        assert recorder.claim(call_sid) and not recorder.claim(call_sid), "a requested stream is claimed once"
+        recording = recorder.open(call_sid)
+        for start in range(0, len(audio), 160):
+            recording.append(audio[start:start + 160])
+        assert recording.recent() == audio[-400:] and recording.recent(0.01) == audio[-80:]
+        recorder.close(call_sid)
+        recording.append(b"\xff" * 160)  # a frame arriving after the status callback closed the call
+        recorder.shutdown()
+        
+        index = RecordingIndex(root)
+        assert index.info(call_sid)["segments"] == 3
+        assert bytes(index.read(call_sid)) == audio
+        view = index.read(call_sid, 100, 200)
+        assert isinstance(view.obj, mmap.mmap) and bytes(view) == audio[100:300], "reads within a segment are zero-copy"
+        del view
+        assert index.wav(call_sid)[:4] == b"RIFF"
+        index.close()
+        assert not os.listdir(os.path.join(root, "spare")), "spare segments must be cleaned up"
+        print("[OK] Call audio recorded, sealed, indexed and read back")
+        return True
+    except Exception as e:
+        print(f"[X] Call recording test failed: {str(e)}")
+        return False
+
+
+def _init_stub_worker(*args):
+    """Batch transcription pool initializer that loads no model"""
+
+
+def _transcribe_stub(call_sid, path, language):
+    """Batch transcription task whose transcript is the file's text; empty files fail"""
+    with open(path) as f:
+        text = f.read()
+    return call_sid, text or None, 1.0, None if text else "empty recording"
+
+
+def test_batch_transcribe():
+    """Test batch transcription sources, checkpointing and manifest handling"""
+    print("\nTesting batch transcription...")
+    import batch_transcribe
+    init_worker, write_transcripts = batch_transcribe._init_worker, batch_transcribe.write_transcripts
+    server = None
+    try:
+        import asyncio
+        import json
+        import tempfile
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from batch_transcribe import Checkpoint, iter_directory, iter_manifest, run_pipeline, twilio_auth
+        
+        written = []
+        batch_transcribe._init_worker = _init_stub_worker
+        batch_transcribe.write_transcripts = lambda rows: written.extend(row["call_sid"] for row in rows)
+        sids = [f"CA{number:032x}" for number in range(3)]
+        
+        # A partial run: the empty recording fails and is not checkpointed
+        root = tempfile.mkdtemp()
+        for number, call_sid in enumerate(sids):
+            with open(os.path.join(root, f"{call_sid}.wav"), "w") as f:
+                f.write("" if number == 2 else f"call {number}")
+        with open(os.path.join(root, "notes.txt"), "w") as f:
+            f.write("not a recording")
+        checkpoint_path = os.path.join(root, "progress.checkpoint")
+        
+        def transcribe_all():
+            return asyncio.run(run_pipeline(iter_directory(root), Checkpoint(checkpoint_path),
+                                            workers=1, task=_transcribe_stub))
+        
+        assert transcribe_all() == {"transcribed": 2, "failed": 1, "skipped": 0}
+        assert sorted(written) == sids[:2]
+        with open(os.path.join(root, f"{sids[2]}.wav"), "w") as f:
+            f.write("call 2")
+        assert transcribe_all() == {"transcribed": 1, "failed": 0, "skipped": 2}, "a resumed run redoes only the failure"
+        assert sorted(written) == sids
+        
+        served, headers = {f"/{call_sid}.wav": b"RIFF" for call_sid in sids}, []
+        
+        class Recordings(BaseHTTPRequestHandler):
+            def do_GET(self):
+                headers.append(self.headers.get("Authorization"))
+                body = served.get(self.path)
+                self.send_response(200 if body else 404)
+                self.end_headers()
+                self.wfile.write(body or b"")
+            
+            def log_message(self, *args):
+                pass
+        
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Recordings)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        manifest = os.path.join(root, "recordings.jsonl")
+        with open(manifest, "w") as f:
+            f.write("\n".join([
+                json.dumps({"call_sid": sids[0], "url": f"{base}/{sids[0]}.wav"}),
+                '{"call_sid": "CA' + "0" * 32,
+                json.dumps({"call_sid": sids[1]}),
+                json.dumps(["not", "an", "object"]),
+                json.dumps({"call_sid": "../etc/passwd", "url": f"{base}/{sids[1]}.wav"}),
+                json.dumps({"call_sid": sids[1], "url": f"{base}/missing.wav"}),
+                json.dumps({"call_sid": sids[2], "url": f"{base}/{sids[2]}.wav"}),
+                json.dumps({"call_sid": sids[2], "url": f"{base}/{sids[2]}.wav"}),
+            ]) + "\n")
+        
+        async def download(path, skip=()):
+            spool = tempfile.mkdtemp()
+            return [item async for item in iter_manifest(path, spool, set(skip), 2, ("AC1", "secret"))], spool
+        
+        items, spool = asyncio.run(asyncio.wait_for(download(manifest), 10))
+        assert sorted(sid for sid, _ in items) == [sids[0], sids[2]], "malformed and repeated lines are skipped"
+        assert all(os.path.dirname(path) == spool for _, path in items)
+        assert headers and not any(headers), "credentials go to Twilio only"
+        items, _ = asyncio.run(asyncio.wait_for(download(manifest, [sids[0]]), 10))
+        assert [sid for sid, _ in items] == [sids[2]]
+        try:
+            asyncio.run(asyncio.wait_for(download(os.path.join(root, "missing.jsonl")), 10))
+            raise AssertionError("an unreadable manifest must fail the run")
+        except FileNotFoundError:
+            pass
+        
+        assert twilio_auth("https://api.twilio.com/2010-04-01/Recordings/RE1.wav", ("AC1", "x")) == ("AC1", "x")
+        assert twilio_auth("https://api.dublin.ie1.twilio.com/Recordings/RE1", ("AC1", "x")) == ("AC1", "x")
+        assert twilio_auth("https://api.twilio.com.example.net/RE1.wav", ("AC1", "x")) is None
+        assert twilio_auth("http://api.twilio.com/RE1.wav", ("AC1", "x")) is None
+        print("[OK] Directory and manifest sources transcribed, resumed and validated")
+        return True
+    except Exception as e:
+        print(f"[X] Batch transcription test failed: {str(e)}")
+        return False
+    finally:
+        batch_transcribe._init_worker, batch_transcribe.write_transcripts = init_worker, write_transcripts
+        if server:
+            server.shutdown()
+            server.server_close()
+
+
+def test_language():
+    """Test per-call caller language identification"""
+    print("\nTesting language identification...")
+    try:
+        from language_id import detect_language
+        from conversation_flow import ConversationManager
+        
+        assert detect_language("Quisiera una cita para mañana", ["en", "es"], "en") == ("es", False)
+        assert detect_language("I'd like to book an appointment", ["en", "es"], "en") == ("en", False)
+        assert detect_language("Español", ["en", "es"], "en") == ("es", True)
+        assert detect_language("Quisiera una cita", ["en"], "en") == ("en", False)
+        
+        manager = ConversationManager(languages=["en", "es"])
+        assert manager.process_user_input("Español") == manager.prompt("greeting")
+        assert manager.language == "es"
+        manager.process_user_input("Quiero una cita")
+        reply = manager.process_user_input("Mañana a las 3 de la tarde")
+        import datetime
+        tomorrow = manager.call_time.date() + datetime.timedelta(days=1)
+        assert (manager.appointment_info["date"], manager.appointment_info["time"]) == (tomorrow, datetime.time(15)), reply
+        # Detected once; later English words do not switch the call back
+        manager.process_user_input("my name is Ana")
+        assert manager.language == "es"
+        print("[OK] Caller language detected once and used for replies")
+        return True
+    except Exception as e:
+        print(f"[X] Language test failed: {str(e)}")
+        return False
+
+
+def test_decoding_hints():
+    """Test per-turn STT decoding hints"""
+    print("\nTesting STT decoding hints...")
+    try:
+        from config import settings
+        from conversation_flow import ConversationManager
+        from stt_benchmark import word_errors
+        
+        manager = ConversationManager()
+        assert manager.decoding_hints().beam_size == settings.stt_beam_size
+        manager.process_user_input("I'd like to book an appointment")
+        hints = manager.decoding_hints()
+        assert manager.expected_slot() == "date"
+        assert hints.beam_size == settings.stt_constrained_beam_size and "tomorrow" in hints.hotwords
+        manager.process_user_input("Tomorrow at 3 pm")
+        assert manager.expected_slot() == "name"
+        assert manager.decoding_hints().beam_size == settings.stt_beam_size
+        assert word_errors("Next Friday, please.", "next friday") == 1
+        print("[OK] Greedy decoding for date/time turns, full beam otherwise")
+        return True
+    except Exception as e:
+        print(f"[X] Decoding hints test failed: {str(e)}")
+        return False
+
+
+def test_entities():
+    """Test date/time/name extraction"""
+    print("\nTesting entity extraction...")
+    try:
+        import datetime
+        from zoneinfo import ZoneInfo
+        from entities import extract, extract_batch
+        
+        now = datetime.datetime(2026, 10, 19, 9, 0, tzinfo=ZoneInfo("America/New_York"))  # a Monday
+        found = extract("2 people at half past four next Tuesday", now)
+        assert found.when == datetime.datetime(2026, 10, 27, 16, 30, tzinfo=now.tzinfo), found
+        assert found.when.utcoffset() == datetime.timedelta(hours=-4)  # still EDT
+        november = extract("Tuesday at 9", now.replace(day=29))
+        assert november.when.utcoffset() == datetime.timedelta(hours=-5), "EST after Nov 1"
+        assert extract("table for 4", now).time is None, "bare numbers are not times"
+        assert extract("My name is sarah johnson and I'd like a cleaning", now).name == "Sarah Johnson"
+        
+        tomorrow, the_14th, spanish = extract_batch(
+            ["Tomorrow at 4 PM", "the 14th at quarter to three"], now
+        ) + extract_batch(["el 15 de marzo a las cuatro y media"], now, "es")
+        assert tomorrow.when == datetime.datetime(2026, 10, 20, 16, 0, tzinfo=now.tzinfo)
+        assert (the_14th.date, the_14th.time) == (datetime.date(2026, 11, 14), datetime.time(14, 45))
+        assert (spanish.date, spanish.time) == (datetime.date(2027, 3, 15), datetime.time(16, 30))
+        september = now.replace(month=9, day=15)
+        assert extract("el 31", september, "es").date == datetime.date(2026, 10, 31), "no Sept 31: next month"
+        assert extract("the 30th", september.replace(month=1, day=31), "en").date == datetime.date(2026, 3, 30)
+        print("[OK] Dates, times and names resolved against the call time")
+        return True
+    except Exception as e:
+        print(f"[X] Entity extraction test failed: {str(e)}")
+        return False
+
+
+def test_response_generator():
+    """Test batched ONNX response generation with a stub model"""
+    print("\nTesting response generator...")
+    try:
+        import asyncio
+        import time
+        import numpy as np
+        from response_generators import OnnxResponseGenerator
+        from tenants import DEFAULT_TENANT
+        
+        class CharTokenizer:
+            """One token per character; id 0 ends the text"""
+            
+            class Encoding:
+                def __init__(self, ids):
+                    self.ids = ids
+            
+            def encode(self, text, add_special_tokens=False):
+                return self.Encoding([ord(c) for c in text])
+            
+            def decode(self, ids):
+                return "".join(chr(i) for i in ids)
+            
+            def token_to_id(self, token):
+                return 0
+        
+        class StubSession:
+            """Answers every prompt with "OK" and a newline, recording the batch size of each step"""
+            
+            def __init__(self, delay=0.0):
+                self.delay = delay
+                self.batches = []
+            
+            def run(self, output_names, feeds):
+                time.sleep(self.delay)
+                input_ids = feeds["input_ids"]
+                self.batches.append(input_ids.shape[0])
+                following = {ord(":"): ord("O"), ord("O"): ord("K")}
+                logits = np.zeros((input_ids.shape[0], input_ids.shape[1], 128), dtype=np.float32)
+                for row, last in enumerate(input_ids[:, -1]):
+                    logits[row, -1, following.get(int(last), ord("\n"))] = 1.0
+                return [logits]
+        
+        class StubGenerator(OnnxResponseGenerator):
+            def __init__(self, session):
+                super().__init__()
+                self.stub_session = session
+                self.batch_wait = 0.05
+            
+            def _load(self):
+                self.session, self.tokenizer = self.stub_session, CharTokenizer()
+                self._input_names = {"input_ids", "attention_mask"}
+                self._past_inputs, self._present_index, self._past_shapes = [], {}, {}
+                self._eos_id = self._pad_id = 0
+                self._newline_ids = {ord("\n")}
+        
+        async def turns(generator, budget):
+            return await asyncio.gather(*(
+                generator.generate(f"CA{number}", DEFAULT_TENANT, "Do you take walk-ins?", budget)
+                for number in range(3)
+            ))
+        
+        session = StubSession()
+        generator = StubGenerator(session)
+        generator.start()
+        assert generator.ready.wait(5)
+        assert asyncio.run(turns(generator, 2.0)) == ["OK", "OK", "OK"]
+        assert session.batches == [3, 3, 3], "concurrent turns must share one batch, decoded in three steps"
+        assert generator._contexts["CA0"][1][-3:] == [ord("O"), ord("K"), ord("\n")], "the reply joins the call's context"
+        preamble, history = generator._contexts["CA0"]
+        for _ in range(200):
+            generator.record_turn("CA0", DEFAULT_TENANT, "Hello?", "Hi there.")
+        assert len(history) == generator.max_context - generator.max_new_tokens - len(preamble), \
+            "history is trimmed to the context window"
+        assert generator._prompt((preamble, history), [])[len(preamble):] == history
+        
+        slow = StubGenerator(StubSession(delay=0.2))
+        slow.start()
+        assert slow.ready.wait(5)
+        started = time.monotonic()
+        assert asyncio.run(turns(slow, 0.1)) == [None, None, None], "late replies fall back to the scripted one"
+        assert time.monotonic() - started < 0.2
+        print("[OK] Concurrent turns batched; replies past the deadline dropped")
+        return True
+    except Exception as e:
+        print(f"[X] Response generator test failed: {str(e)}")
+        return False
+
+
+def test_admission():
+    """Test admission control and per-caller rate limiting"""
+    print("\nTesting admission control...")
+    try:
+        import asyncio
+        from admission import CallerRateLimiter, Overloaded, SHED, Subsystem
+        
+        async def scenario():
+            subsystem = Subsystem("test", max_in_flight=1, max_queue=1, queue_timeout=0.05)
+            await subsystem.acquire()
+            waiter = asyncio.ensure_future(subsystem.acquire())
+            await asyncio.sleep(0)
+            try:
+                await subsystem.acquire()
+                raise AssertionError("a full queue must shed")
+            except Overloaded as e:
+                assert e.reason == "queue_full"
+            subsystem.release()
+            await waiter  # the queued request inherits the slot
+            assert (subsystem.in_flight, subsystem.queued) == (1, 0)
+            try:
+                await subsystem.acquire()
+                raise AssertionError("a wait past queue_timeout must shed")
+            except Overloaded as e:
+                assert e.reason == "timeout"
+            subsystem.release()
+            assert subsystem.in_flight == 0
+        
+        asyncio.run(scenario())
+        assert SHED.value("test", "queue_full") == 1 and SHED.value("test", "timeout") == 1
+        
+        limiter = CallerRateLimiter(rate_per_minute=6, burst=2)
+        assert [limiter.allow("+15551234567", now=0.0) for _ in range(3)] == [True, True, False]
+        assert limiter.allow("+15557654321", now=0.0), "buckets are per caller"
+        assert limiter.allow("+15551234567", now=10.0), "tokens refill over time"
+        limiter = CallerRateLimiter(rate_per_minute=6, burst=1)
+        assert limiter.allow("+15551234567", "CA1", now=0.0)
+        assert limiter.allow("+15551234567", "CA1", now=0.0), "a retried webhook is not charged again"
+        assert not limiter.allow("+15551234567", "CA2", now=0.0)
+        assert not limiter.allow("+15551234567", "CA2", now=60.0), "a rejected call stays rejected on retry"
+        print("[OK] Saturated subsystems shed and floods are rate limited")
+        return True
+    except Exception as e:
+        print(f"[X] Admission test failed: {str(e)}")
+        return False
+
+
 def test_config():
     """Test configuration"""
     print("\nTesting configuration...")
@@ -117,6 +1199,29 @@ def main():
     results.append(("STT Module", test_stt()))
     results.append(("TTS Module", test_tts()))
     results.append(("Conversation Flow", test_conversation()))
+    results.append(("Lazy Imports", test_lazy_imports()))
+    results.append(("Metrics", test_metrics()))
+    results.append(("Sampling Profiler", test_profiler()))
+    results.append(("Audio Codec", test_audio_codec()))
+    results.append(("Audio Probe", test_audio_probe()))
+    results.append(("Phone Numbers", test_phone_numbers()))
+    results.append(("Webhook Replay", test_webhook_replay()))
+    results.append(("Speculative Turns", test_speculation()))
+    results.append(("Storage Engine", test_storage_engine()))
+    results.append(("Tenants", test_tenants()))
+    results.append(("Transcript Search", test_transcript_search()))
+    results.append(("Call Rollups", test_rollups()))
+    results.append(("Retention", test_retention()))
+    results.append(("Media Store", test_media_store()))
+    results.append(("TTS Fragments", test_tts_fragments()))
+    results.append(("TTS Sidecar", test_tts_sidecar()))
+    results.append(("Call Recording", test_call_recording()))
+    results.append(("Batch Transcription", test_batch_transcribe()))
+    results.append(("Language Identification", test_language()))
+    results.append(("STT Decoding Hints", test_decoding_hints()))
+    results.append(("Entity Extraction", test_entities()))
+    results.append(("Response Generator", test_response_generator()))
+    results.append(("Admission Control", test_admission()))
     
     print("\n" + "=" * 50)
     print("Test Results Summary")
@@ -0,0 +1,248 @@
+"""
+Full-text search over call transcripts
+
+SQLite databases use an FTS5 virtual table holding one row per transcript
+turn, appended in the same transaction that writes the turn to CallLog.
+FTS5 cannot index its UNINDEXED call_sid column, so a side table maps
+each call to its FTS rows and a call is removed by rowid.
+Other databases fall back to a LIKE scan until a native backend is
+registered with register_backend().
+"""
+import logging
+import re
+from typing import Dict, List, NamedTuple, Optional, Type
+
+from database import engine, SQLALCHEMY_AVAILABLE
+
+if SQLALCHEMY_AVAILABLE:
+    from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# "quoted phrases", prefix* terms and plain words
+_QUERY_TOKEN = re.compile(r'"([^"]+)"|(\S+)')
+
+
+class SearchPage(NamedTuple):
+    """One page of search results"""
+    hits: List[Dict]  # {"call_sid", "snippet", "rank"} dicts, best match first
+    total: int  # matching calls across all pages
+
+
+class SearchBackend:
+    """Interface for transcript search backends"""
+
+    name = "base"
+
+    def setup(self, bind=None):
+        """Create any tables or indexes the backend needs (on bind, default: the app's engine)"""
+
+    def index_turn(self, db, call_sid: str, turn: str):
+        """
+        Add one transcript turn to the index
+
+        Called inside the caller's transaction; the caller commits.
+        """
+
+    def index_transcript(self, db, call_sid: str, transcript: str):
+        """Index a whole transcript for one call (e.g. from batch transcription)"""
+        self.index_turn(db, call_sid, transcript)
+
+    def remove_call(self, db, call_sid: str):
+        """Drop a call from the index (e.g. when it is archived)"""
+
+    def rebuild(self, db):
+        """Re-index every transcript in call_logs"""
+
+    def search(self, db, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        """
+        Search transcripts, one hit per call
+
+        Returns:
+            The page of calls from offset, and the number of matching calls
+        """
+        raise NotImplementedError
+
+
+def build_fts_query(query: str) -> str:
+    """
+    Translate user input into a safe FTS5 MATCH expression
+
+    Phrases in double quotes stay phrases, a trailing * makes a prefix
+    query, and every other token is quoted so FTS5 syntax typed by users
+    cannot cause errors. Terms are ANDed unless separated by OR.
+    """
+    terms = []
+    for phrase, word in _QUERY_TOKEN.findall(query):
+        if phrase:
+            terms.append('"' + phrase.replace('"', '') + '"')
+            continue
+        if word == "OR":
+            if terms and terms[-1] != "OR":
+                terms.append("OR")
+            continue
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', '')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    if terms and terms[-1] == "OR":
+        terms.pop()
+    return " ".join(terms)
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5 index with bm25 ranking and highlighted snippets"""
+
+    name = "sqlite-fts5"
+    table = "call_transcripts_fts"
+    rows = "call_transcripts_rows"  # call_sid -> FTS rowid
+
+    def setup(self, bind=None):
+        with (bind or engine).begin() as conn:
+            def exists(name):
+                return conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}
+                ).first()
+
+            if not exists(self.table):
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE {self.table} "
+                    "USING fts5(call_sid UNINDEXED, turn, tokenize = 'porter unicode61')"
+                ))
+                # Backfill transcripts written before the index existed
+                conn.execute(text(
+                    f"INSERT INTO {self.table} (call_sid, turn) "
+                    "SELECT call_sid, transcript FROM call_logs WHERE transcript IS NOT NULL"
+                ))
+            if not exists(self.rows):
+                conn.execute(text(
+                    f"CREATE TABLE {self.rows} (fts_rowid INTEGER PRIMARY KEY, call_sid TEXT NOT NULL)"
+                ))
+                conn.execute(text(f"CREATE INDEX ix_{self.rows}_call_sid ON {self.rows} (call_sid)"))
+                # Map rows indexed before the side table existed
+                conn.execute(text(f"INSERT INTO {self.rows} (fts_rowid, call_sid) SELECT rowid, call_sid FROM {self.table}"))
+
+    def index_turn(self, db, call_sid: str, turn: str):
+        db.execute(
+            text(f"INSERT INTO {self.table} (call_sid, turn) VALUES (:call_sid, :turn)"),
+            {"call_sid": call_sid, "turn": turn}
+        )
+        db.execute(
+            text(f"INSERT INTO {self.rows} (fts_rowid, call_sid) VALUES (last_insert_rowid(), :call_sid)"),
+            {"call_sid": call_sid}
+        )
+
+    def index_transcript(self, db, call_sid: str, transcript: str):
+        """Replace the indexed transcript of one call"""
+        self.remove_call(db, call_sid)
+        self.index_turn(db, call_sid, transcript)
+
+    def remove_call(self, db, call_sid: str):
+        # Deleting by rowid; a WHERE on the UNINDEXED call_sid would scan the whole index
+        db.execute(
+            text(f"DELETE FROM {self.table} WHERE rowid IN "
+                 f"(SELECT fts_rowid FROM {self.rows} WHERE call_sid = :call_sid)"),
+            {"call_sid": call_sid}
+        )
+        db.execute(text(f"DELETE FROM {self.rows} WHERE call_sid = :call_sid"), {"call_sid": call_sid})
+
+    def rebuild(self, db):
+        db.execute(text(f"DELETE FROM {self.table}"))
+        db.execute(text(f"DELETE FROM {self.rows}"))
+        db.execute(text(
+            f"INSERT INTO {self.table} (call_sid, turn) "
+            "SELECT call_sid, transcript FROM call_logs WHERE transcript IS NOT NULL"
+        ))
+        db.execute(text(f"INSERT INTO {self.rows} (fts_rowid, call_sid) SELECT rowid, call_sid FROM {self.table}"))
+        db.commit()
+
+    def search(self, db, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        match = build_fts_query(query)
+        if not match:
+            return SearchPage([], 0)
+        # Keep each call's best-ranked turn, then page over calls; the
+        # window count runs before LIMIT, so it counts every matching call
+        page = db.execute(text(
+            "SELECT fts_rowid, call_sid, rank, count(*) OVER () FROM ("
+            f"  SELECT rowid AS fts_rowid, call_sid, rank,"
+            f"         row_number() OVER (PARTITION BY call_sid ORDER BY rank) AS n"
+            f"  FROM {self.table} WHERE {self.table} MATCH :match"
+            ") WHERE n = 1 ORDER BY rank LIMIT :limit OFFSET :offset"
+        ), {"match": match, "limit": limit, "offset": offset}).fetchall()
+        if not page:
+            total = db.execute(text(
+                f"SELECT count(DISTINCT call_sid) FROM {self.table} WHERE {self.table} MATCH :match"
+            ), {"match": match}).scalar() if offset else 0
+            return SearchPage([], total)
+
+        # Snippets only for the turns on this page
+        rowids = ", ".join(str(int(row[0])) for row in page)
+        snippets = dict(db.execute(text(
+            f"SELECT rowid, snippet({self.table}, 1, '<mark>', '</mark>', '…', 12) "
+            f"FROM {self.table} WHERE {self.table} MATCH :match AND rowid IN ({rowids})"
+        ), {"match": match}).fetchall())
+        # bm25 is lower-is-better; expose higher-is-better
+        hits = [{"call_sid": call_sid, "rank": -score, "snippet": snippets.get(rowid, "")}
+                for rowid, call_sid, score, _ in page]
+        return SearchPage(hits, page[0][3])
+
+
+class LikeSearchBackend(SearchBackend):
+    """Portable fallback that scans call_logs.transcript with LIKE"""
+
+    name = "like"
+
+    def search(self, db, query: str, limit: int = 20, offset: int = 0) -> SearchPage:
+        from database import CallLog
+        terms = [phrase or word.rstrip("*") for phrase, word in _QUERY_TOKEN.findall(query)]
+        terms = [term for term in terms if term and term != "OR"]
+        if not terms:
+            return SearchPage([], 0)
+        q = db.query(CallLog.call_sid, CallLog.transcript)
+        for term in terms:
+            q = q.filter(CallLog.transcript.ilike(f"%{term}%"))
+        total = q.count()
+        results = []
+        for call_sid, transcript in q.order_by(CallLog.created_at.desc()).offset(offset).limit(limit):
+            position = transcript.lower().find(terms[0].lower())
+            start = max(position - 40, 0)
+            results.append({
+                "call_sid": call_sid,
+                "rank": 0.0,
+                "snippet": transcript[start:position + len(terms[0]) + 40]
+            })
+        return SearchPage(results, total)
+
+
+# Dialect name -> backend class
+_BACKENDS: Dict[str, Type[SearchBackend]] = {"sqlite": SQLiteFTSBackend}
+
+_backend: Optional[SearchBackend] = None
+
+
+def register_backend(dialect: str, backend_cls: Type[SearchBackend]):
+    """Register a search backend for a SQLAlchemy dialect (e.g. "postgresql")"""
+    _BACKENDS[dialect] = backend_cls
+
+
+def get_backend() -> Optional[SearchBackend]:
+    """Get the search backend for the configured database"""
+    global _backend
+    if _backend is None and SQLALCHEMY_AVAILABLE:
+        backend_cls = _BACKENDS.get(engine.dialect.name, LikeSearchBackend)
+        _backend = backend_cls()
+    return _backend
+
+
+def init_search():
+    """Set up the search backend, falling back to LIKE if it is unavailable"""
+    global _backend
+    backend = get_backend()
+    if backend is None:
+        return
+    try:
+        backend.setup()
+        logger.info(f"Transcript search backend: {backend.name}")
+    except Exception as e:
+        logger.warning(f"Search backend {backend.name} unavailable, using LIKE: {str(e)}")
+        _backend = LikeSearchBackend()
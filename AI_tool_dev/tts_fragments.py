@@ -0,0 +1,205 @@
+"""
+Fragment-level synthesis of templated prompts
+
+Fixed prompts are synthesized once and then served from the media store.
+Templated replies such as the booking confirmation ("... for {name} on
+{date} at {time} ...") differ on nearly every call, so caching whole
+utterances never hits for them and each one used to cost a full
+synthesis on the turn's critical path.
+
+Here a template's static fragments are rendered once, slot values are
+assembled from a cached vocabulary (the words of every spoken date,
+every quarter-hour time, and names as they are first heard), and the
+pieces are joined at the PCM level with a short linear crossfade. During
+a call only words never spoken before reach the TTS model.
+"""
+import collections
+import datetime
+import logging
+import re
+import string
+import threading
+from functools import lru_cache
+from typing import Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+FRAGMENTS = registry.counter(
+    "voice_ai_tts_fragments_total",
+    "Prompt fragment lookups by result",
+    ("result",)
+)
+
+# Slots whose values are cached word by word; other values are cached whole
+_UNIT_SPLIT = {"date": re.compile(r",?\s+")}
+# Punctuation left over at the start of a fragment once a slot is cut out
+_LEADING = " \t\n.,;:"
+_SPOKEN = re.compile(r"\w")
+
+
+@lru_cache(maxsize=64)
+def split_template(template: str) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """'Hi {name}.' -> (('Hi ', 'name'), ('.', None))"""
+    return tuple((literal, field) for literal, field, _, _ in string.Formatter().parse(template))
+
+
+def speech_units(template: str, slots: Mapping[str, str]) -> List[str]:
+    """The separately synthesized pieces of a rendered template, in order"""
+    units = []
+    for literal, field in split_template(template):
+        literal = literal.lstrip(_LEADING).rstrip()
+        if _SPOKEN.search(literal):
+            units.append(literal)
+        if field is None:
+            continue
+        value = str(slots[field]).strip()
+        splitter = _UNIT_SPLIT.get(field)
+        units.extend(word for word in (splitter.split(value) if splitter else [value]) if word)
+    return units
+
+
+def vocabulary(language: str) -> List[str]:
+    """Slot words worth rendering ahead of time: weekdays, months, day numbers and quarter-hour times"""
+    from entities import format_date, format_time
+    words = dict.fromkeys(
+        word
+        for offset in range(366)
+        for word in _UNIT_SPLIT["date"].split(
+            format_date(datetime.date(2024, 1, 1) + datetime.timedelta(days=offset), language))
+    )
+    words.update(dict.fromkeys(
+        format_time(datetime.time(hour, minute), language) for hour in range(24) for minute in (0, 15, 30, 45)
+    ))
+    return list(words)
+
+
+def trim_silence(samples: np.ndarray, keep: int, threshold: float = 0.02) -> np.ndarray:
+    """Cut leading and trailing silence, keeping `keep` samples of it on each side"""
+    peak = float(np.abs(samples).max()) if len(samples) else 0.0
+    if peak == 0.0:
+        return samples[:0]
+    loud = np.flatnonzero(np.abs(samples) > peak * threshold)
+    return samples[max(loud[0] - keep, 0):loud[-1] + keep + 1]
+
+
+def crossfade_concat(pieces: Sequence[np.ndarray], overlap: int) -> np.ndarray:
+    """Concatenate float32 pieces, overlapping each join by up to `overlap` samples with a linear fade"""
+    out = np.empty(sum(len(piece) for piece in pieces), dtype=np.float32)
+    end = 0
+    for piece in pieces:
+        n = min(overlap, end, len(piece))
+        if n:
+            fade_in = np.linspace(0.0, 1.0, n, endpoint=False, dtype=np.float32)
+            joint = out[end - n:end]
+            joint += (piece[:n] - joint) * fade_in
+        out[end:end + len(piece) - n] = piece[n:]
+        end += len(piece) - n
+    return out[:end]
+
+
+class FragmentSynthesizer:
+    """Renders templated prompts from cached fragment audio"""
+
+    def __init__(self, tts_engine, max_entries: int = 2000, crossfade_ms: float = 10.0, keep_ms: float = 30.0):
+        """
+        Args:
+            tts_engine: TTSEngine that renders fragments on a miss
+            max_entries: Fragments kept; the least recently used are dropped first
+            crossfade_ms: Overlap at each join
+            keep_ms: Silence kept at each end of a fragment, so joins sound like word gaps
+        """
+        self.engine = tts_engine
+        self.max_entries = max_entries
+        self.crossfade_ms = crossfade_ms
+        self.keep_ms = keep_ms
+        self.sample_rate: Optional[int] = None
+        self._cache: "collections.OrderedDict[str, np.ndarray]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def fragment(self, text: str, background: bool = False) -> np.ndarray:
+        """Audio of one fragment, synthesized on first use (behind live requests if `background`)"""
+        with self._lock:
+            samples = self._cache.get(text)
+            if samples is not None:
+                self._cache.move_to_end(text)
+                FRAGMENTS.inc("hit")
+                return samples
+        FRAGMENTS.inc("miss")
+        samples, rate = self.engine.synthesize_samples(text, background=background)
+        with self._lock:
+            if self.sample_rate is None:
+                self.sample_rate = rate
+        if rate != self.sample_rate:
+            from audio_codec import resample
+            samples = resample(samples, rate, self.sample_rate)
+        samples = trim_silence(samples, int(self.sample_rate * self.keep_ms / 1000))
+        with self._lock:
+            self._cache[text] = samples
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return samples
+
+    def prerender(self, texts: Iterable[str]) -> int:
+        """
+        Render fragments ahead of the calls that need them
+
+        Each fragment takes the model only while no live request wants it,
+        so prerendering never delays a call by more than one fragment.
+
+        Returns:
+            Number of fragments rendered
+        """
+        rendered = 0
+        for text in texts:
+            try:
+                self.fragment(text, background=True)
+                rendered += 1
+            except Exception as e:
+                logger.warning(f"Could not prerender fragment {text!r}: {str(e)}")
+        return rendered
+
+    def prerender_templates(self, templates: Iterable[str], language: str) -> int:
+        """Render the static fragments of templates and the slot vocabulary of a language"""
+        texts = []
+        for template in templates:
+            texts.extend(speech_units(template, _EMPTY_SLOTS))
+        return self.prerender(list(dict.fromkeys(texts)) + vocabulary(language))
+
+    def render(self, template: str, slots: Mapping[str, str]) -> Tuple[np.ndarray, int]:
+        """
+        Assemble a templated prompt
+
+        Returns:
+            Tuple of (float32 mono samples, sample rate)
+
+        Raises:
+            ValueError: The prompt has nothing to say
+        """
+        pieces = [self.fragment(unit) for unit in speech_units(template, slots)]
+        if not pieces:
+            raise ValueError(f"Template {template!r} renders no speech")
+        overlap = int(self.sample_rate * self.crossfade_ms / 1000)
+        return crossfade_concat(pieces, overlap), self.sample_rate
+
+    def render_mulaw(self, template: str, slots: Mapping[str, str]) -> bytes:
+        """Assemble a templated prompt as 8 kHz μ-law, ready for Twilio media"""
+        from audio_codec import to_twilio
+        samples, rate = self.render(template, slots)
+        return to_twilio(samples, rate)
+
+
+class _EmptySlots(dict):
+    """Slot values for listing a template's static fragments only"""
+
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+_EMPTY_SLOTS = _EmptySlots()
@@ -1,36 +1,61 @@
 """
 Text-to-Speech module using Coqui TTS (optional)
 """
+import contextlib
 import os
 import tempfile
+import threading
 from config import settings
 import logging
+from lazy_imports import is_available, lazy_import
 
 logger = logging.getLogger(__name__)
 
-# Try to import TTS, but make it optional
-try:
-    from TTS.api import TTS
-    TTS_AVAILABLE = True
-except ImportError:
-    TTS_AVAILABLE = False
+# TTS is optional; check for it without importing torch at module import time
+TTS_AVAILABLE = is_available("TTS")
+if not TTS_AVAILABLE:
     logger.warning("Coqui TTS not available. TTS features will be limited.")
 
+# Deferred until the first TTSEngine is created
+tts_api = lazy_import("TTS.api")
+audio_codec = lazy_import("audio_codec")
+
+
+def synthesis_available() -> bool:
+    """True if prompts can be synthesized locally, in this process or in the TTS sidecar"""
+    return TTS_AVAILABLE or bool(settings.tts_sidecar_socket)
+
 
 class TTSEngine:
     """Text-to-Speech engine using Coqui TTS"""
     
-    def __init__(self, model_name: str = None, voice: str = None):
+    def __init__(self, model_name: str = None, voice: str = None, sidecar_socket: str = None):
         """
         Initialize the TTS engine
         
         Args:
             model_name: TTS model name
             voice: Voice name to use
+            sidecar_socket: Unix socket of a TTS sidecar to synthesize in
+                (default: TTS_SIDECAR_SOCKET; empty loads the model in this process)
         """
         self.model_name = model_name or settings.tts_model
         self.voice = voice or settings.tts_voice
         self.tts = None
+        self.sidecar = None
+        # The model is not thread-safe; fragment prerendering runs beside live turns
+        self._lock = threading.Lock()
+        # Live requests waiting for or holding the model; background work yields to them
+        self._live = 0
+        self._live_done = threading.Condition()
+        
+        sidecar_socket = settings.tts_sidecar_socket if sidecar_socket is None else sidecar_socket
+        if sidecar_socket:
+            # Client mode: the model lives in tts_sidecar.py's processes
+            from tts_sidecar import SidecarClient
+            self.sidecar = SidecarClient(sidecar_socket, timeout=settings.tts_sidecar_timeout)
+            logger.info(f"Using TTS sidecar at {sidecar_socket}")
+            return
         
         if not TTS_AVAILABLE:
             logger.warning("TTS library not available. This module is optional for phone calls.")
@@ -38,18 +63,40 @@ class TTSEngine:
         
         logger.info(f"Loading TTS model: {self.model_name}")
         try:
-            self.tts = TTS(model_name=self.model_name, progress_bar=False)
+            self.tts = tts_api.TTS(model_name=self.model_name, progress_bar=False)
             logger.info("TTS model loaded successfully")
         except Exception as e:
             logger.error(f"Error loading TTS model: {str(e)}")
             # Fallback to a simpler model
             logger.info("Trying fallback model...")
             try:
-                self.tts = TTS(model_name="tts_models/en/ljspeech/tacotron2-DDC", progress_bar=False)
+                self.tts = tts_api.TTS(model_name="tts_models/en/ljspeech/tacotron2-DDC", progress_bar=False)
             except Exception as e2:
                 logger.error(f"Fallback TTS model also failed: {str(e2)}")
                 self.tts = None
     
+    @contextlib.contextmanager
+    def _model(self, background: bool = False):
+        """Hold the local model; background work waits until no live request needs it"""
+        with self._live_done:
+            if background:
+                self._live_done.wait_for(lambda: self._live == 0)
+            else:
+                self._live += 1
+        try:
+            with self._lock:
+                yield
+        finally:
+            if not background:
+                with self._live_done:
+                    self._live -= 1
+                    self._live_done.notify_all()
+    
+    @property
+    def available(self) -> bool:
+        """True if the engine can synthesize"""
+        return self.sidecar is not None or (TTS_AVAILABLE and self.tts is not None)
+    
     def synthesize(self, text: str, output_path: str = None) -> str:
         """
         Convert text to speech audio file
@@ -61,7 +108,7 @@ class TTSEngine:
         Returns:
             Path to generated audio file
         """
-        if not TTS_AVAILABLE or self.tts is None:
+        if not self.available:
             raise RuntimeError("TTS engine not available. Install Coqui TTS or use Twilio TTS for phone calls.")
         
         try:
@@ -73,12 +120,20 @@ class TTSEngine:
             
             logger.info(f"Synthesizing speech: {text[:50]}...")
             
+            if self.sidecar is not None:
+                samples, sample_rate = self.sidecar.synthesize(text, self.model_name, self.voice)
+                with open(output_path, 'wb') as f:
+                    f.write(audio_codec.encode_wav(samples, sample_rate))
+                logger.info(f"Speech synthesized: {output_path}")
+                return output_path
+            
             # Generate speech
-            self.tts.tts_to_file(
-                text=text,
-                file_path=output_path,
-                speaker=self.voice if hasattr(self.tts, 'speaker') else None
-            )
+            with self._model():
+                self.tts.tts_to_file(
+                    text=text,
+                    file_path=output_path,
+                    speaker=self.voice if hasattr(self.tts, 'speaker') else None
+                )
             
             logger.info(f"Speech synthesized: {output_path}")
             return output_path
@@ -97,7 +152,7 @@ class TTSEngine:
         Returns:
             Audio data as bytes
         """
-        if not TTS_AVAILABLE or self.tts is None:
+        if not self.available:
             raise RuntimeError("TTS engine not available. Install Coqui TTS or use Twilio TTS for phone calls.")
         
         try:
@@ -117,4 +172,48 @@ class TTSEngine:
         except Exception as e:
             logger.error(f"Error synthesizing to bytes: {str(e)}")
             raise
-
+    
+    def synthesize_samples(self, text: str, background: bool = False):
+        """
+        Convert text to speech without writing a file
+        
+        Args:
+            text: Text to convert to speech
+            background: Wait until no live request is using the local model,
+                and release it again after this text (prerendering)
+            
+        Returns:
+            Tuple of (float32 mono samples, sample rate)
+        """
+        if not self.available:
+            raise RuntimeError("TTS engine not available. Install Coqui TTS or use Twilio TTS for phone calls.")
+        
+        try:
+            logger.info(f"Synthesizing speech: {text[:50]}...")
+            if self.sidecar is not None:
+                return self.sidecar.synthesize(text, self.model_name, self.voice)
+            with self._model(background):
+                wav = self.tts.tts(
+                    text=text,
+                    speaker=self.voice if hasattr(self.tts, 'speaker') else None
+                )
+            synthesizer = getattr(self.tts, 'synthesizer', None)
+            sample_rate = getattr(synthesizer, 'output_sample_rate', audio_codec.COQUI_SAMPLE_RATE)
+            return audio_codec.as_float32(wav), sample_rate
+        
+        except Exception as e:
+            logger.error(f"Error synthesizing samples: {str(e)}")
+            raise
+    
+    def synthesize_to_mulaw(self, text: str) -> bytes:
+        """
+        Convert text to speech as 8 kHz μ-law, ready for Twilio media
+        
+        Args:
+            text: Text to convert to speech
+            
+        Returns:
+            μ-law encoded audio bytes
+        """
+        samples, sample_rate = self.synthesize_samples(text)
+        return audio_codec.to_twilio(samples, sample_rate)
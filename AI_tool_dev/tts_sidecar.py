@@ -0,0 +1,476 @@
+"""
+Out-of-process TTS service
+
+Coqui TTS runs torch, which holds the GIL for long stretches, competes
+with uvicorn for CPU threads and adds hundreds of megabytes to every API
+worker. The sidecar moves synthesis into its own processes: a pool of
+model workers, each limited to a few intra-op threads, behind a Unix
+socket.
+
+Audio is not serialized back over the socket. Each worker writes float32
+samples into its own shared-memory buffer and the reply only names the
+buffer; the client copies the samples out and acknowledges, after which
+the worker takes the next request.
+
+With TTS_SIDECAR_SOCKET set, TTSEngine forwards synthesis here instead of
+loading the model in the API process.
+
+Wire format: each message is a 4-byte big-endian length and a UTF-8 JSON
+object.
+    client -> {"text", "model", "voice"}
+    server -> {"shm", "samples", "rate"} or {"error"}
+    client -> {"done": true}   (after copying the samples)
+
+Usage:
+    python tts_sidecar.py --socket /run/voice-ai/tts.sock --workers 2 --threads 2
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+MAX_FRAME = 1 << 20
+
+
+def send_frame(sock: socket.socket, message: Dict):
+    """Write one length-prefixed JSON message"""
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            if data:
+                raise ConnectionError("Connection closed mid-message")
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def recv_frame(sock: socket.socket) -> Optional[Dict]:
+    """Read one length-prefixed JSON message; None if the peer closed the connection"""
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME:
+        raise ConnectionError(f"Message of {length} bytes exceeds {MAX_FRAME}")
+    data = _recv_exact(sock, length)
+    if data is None:
+        raise ConnectionError("Connection closed mid-message")
+    return json.loads(data)
+
+
+def attach_shared(name: str) -> shared_memory.SharedMemory:
+    """
+    Open another process's shared-memory segment without taking ownership
+
+    Before Python 3.13, SharedMemory registers every segment it opens with
+    the process's resource tracker, which would unlink the segment when
+    this process exits; the registration is withdrawn straight away.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def read_shared(name: str, count: int) -> np.ndarray:
+    """Copy float32 samples out of a worker's shared-memory buffer"""
+    if count == 0:
+        return np.zeros(0, dtype=np.float32)
+    shm = attach_shared(name)
+    try:
+        return np.ndarray(count, dtype=np.float32, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+
+
+# Worker processes
+
+def _local_engine(model_name: str, voice: str):
+    """Default engine factory: Coqui TTS in the worker process"""
+    from tts_module import TTSEngine
+    engine = TTSEngine(model_name, voice, sidecar_socket="")
+    if engine.tts is None:
+        raise RuntimeError(f"TTS model {model_name} could not be loaded")
+    return engine
+
+
+def _limit_threads(threads: int):
+    """Cap the math libraries' thread pools before the model is loaded"""
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except (ImportError, RuntimeError):
+        pass
+
+
+def _create_buffer(size: int) -> shared_memory.SharedMemory:
+    """
+    A worker's audio buffer, left out of the resource tracker
+
+    Clients withdraw the tracker registration of every buffer they
+    attach to; when a client shares this process's tracker (an in-process
+    sidecar), a registration kept here would be withdrawn twice. The
+    worker unlinks its buffers itself with _release_buffer(), and the
+    parent unlinks the buffer of a worker that died.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _release_buffer(shm: shared_memory.SharedMemory):
+    """Close and unlink a buffer from _create_buffer()"""
+    shm.close()
+    if sys.version_info < (3, 13):
+        # unlink() withdraws the registration _create_buffer() already withdrew
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+
+def _worker_main(conn, engine_factory: Callable, model_name: str, voice: str, threads: int, buffer_bytes: int):
+    """Worker process: synthesize texts from the pipe into its shared-memory buffer"""
+    _limit_threads(threads)
+    try:
+        engine = engine_factory(model_name, voice)
+    except Exception as e:
+        conn.send(("error", str(e)))
+        return
+    shm = _create_buffer(buffer_bytes)
+    conn.send(("ready", shm.name))
+    try:
+        while True:
+            try:
+                text = conn.recv()
+            except EOFError:
+                break
+            if text is None:
+                break
+            try:
+                samples, rate = engine.synthesize_samples(text)
+                samples = np.asarray(samples, dtype=np.float32)
+                if samples.nbytes > shm.size:
+                    # Grow once for unusually long prompts; the reply carries the new name
+                    _release_buffer(shm)
+                    shm = _create_buffer(samples.nbytes * 2)
+                np.ndarray(len(samples), dtype=np.float32, buffer=shm.buf)[:] = samples
+                conn.send(("ok", shm.name, len(samples), int(rate)))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    finally:
+        _release_buffer(shm)
+
+
+class _Worker:
+    """Handle on one model process"""
+
+    def __init__(self, index: int, sidecar: "SidecarServer"):
+        self.index = index
+        self.sidecar = sidecar
+        self.process = None
+        self.conn = None
+        self.buffer: Optional[str] = None
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        parent, child = context.Pipe()
+        sidecar = self.sidecar
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child, sidecar.engine_factory, sidecar.model_name, sidecar.voice,
+                  sidecar.threads, sidecar.buffer_bytes),
+            name=f"tts-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        status = parent.recv()
+        if status[0] != "ready":
+            self.process.join()
+            raise RuntimeError(f"TTS worker {self.index} failed to start: {status[1]}")
+        self.conn = parent
+        self.buffer = status[1]
+
+    def synthesize(self, text: str) -> Tuple:
+        self.conn.send(text)
+        reply = self.conn.recv()
+        if reply[0] == "ok":
+            self.buffer = reply[1]
+        return reply
+
+    def stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.conn.close()
+        if self.process is not None:
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+            if self.process.exitcode != 0 and self.buffer is not None:
+                # The worker did not unlink its buffer
+                try:
+                    shared_memory.SharedMemory(name=self.buffer).unlink()
+                except FileNotFoundError:
+                    pass
+        self.buffer = None
+
+
+# Server
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    sidecar: "SidecarServer"
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            self.server.sidecar.serve_connection(self.request)
+        except (ConnectionError, OSError, ValueError) as e:
+            logger.debug(f"TTS client connection ended: {str(e)}")
+
+
+class SidecarServer:
+    """Unix socket front end for a pool of TTS model processes"""
+
+    def __init__(self, socket_path: str, workers: int = 2, threads: int = 0, model_name: Optional[str] = None,
+                 voice: Optional[str] = None, buffer_seconds: float = 30.0,
+                 engine_factory: Callable = _local_engine):
+        """
+        Args:
+            socket_path: Unix socket to listen on
+            workers: Model processes; each serves one request at a time
+            threads: Intra-op threads per worker (default: CPU cores divided among workers)
+            model_name: TTS model (default: TTS_MODEL)
+            voice: Speaker (default: TTS_VOICE)
+            buffer_seconds: Audio each worker's shared-memory buffer holds at 22.05 kHz before it has to grow
+            engine_factory: Called in each worker as factory(model_name, voice) to load its engine
+        """
+        self.socket_path = socket_path
+        self.model_name = model_name or settings.tts_model
+        self.voice = voice or settings.tts_voice
+        self.threads = threads or max(1, (os.cpu_count() or 1) // max(workers, 1))
+        self.buffer_bytes = int(buffer_seconds * 22050) * 4
+        self.engine_factory = engine_factory
+        self.workers = [_Worker(index, self) for index in range(workers)]
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._server: Optional[_UnixServer] = None
+
+    def start(self):
+        """Load the models and bind the socket"""
+        for worker in self.workers:
+            worker.start()
+            self._idle.put(worker)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixServer(self.socket_path, _Handler)
+        self._server.sidecar = self
+        logger.info(f"TTS sidecar on {self.socket_path}: {len(self.workers)} workers x {self.threads} threads")
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """Stop serve_forever (call from another thread)"""
+        self._server.shutdown()
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        for worker in self.workers:
+            worker.stop()
+
+    def serve_connection(self, sock: socket.socket):
+        """Answer requests on one client connection until it closes"""
+        while True:
+            request = recv_frame(sock)
+            if request is None:
+                return
+            # Clients address audio by model and speaker; never serve them another voice
+            if (request.get("model", self.model_name), request.get("voice", self.voice)) != (self.model_name, self.voice):
+                send_frame(sock, {"error": f"sidecar serves {self.model_name} ({self.voice})"})
+                continue
+            worker = self._idle.get()
+            try:
+                try:
+                    reply = worker.synthesize(request["text"])
+                except (EOFError, OSError):
+                    logger.error(f"TTS worker {worker.index} died; restarting it")
+                    worker.stop()
+                    worker.start()
+                    reply = ("error", "TTS worker restarted")
+                if reply[0] != "ok":
+                    send_frame(sock, {"error": reply[1]})
+                    continue
+                _, name, count, rate = reply
+                send_frame(sock, {"shm": name, "samples": count, "rate": rate})
+                # The buffer is reused only after the client has copied it out
+                if recv_frame(sock) is None:
+                    return
+            finally:
+                self._idle.put(worker)
+
+
+# Client
+
+class SidecarClient:
+    """
+    Synthesis through a TTS sidecar; safe to share between threads
+
+    Calls block until the audio is back, so make them from a worker
+    thread, never from the event loop (main.py synthesizes prompts in
+    tts_executor).
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 30.0, max_idle: int = 8):
+        """
+        Args:
+            socket_path: The sidecar's Unix socket
+            timeout: Seconds to wait for a reply, including time queued behind other requests
+            max_idle: Open connections kept for reuse
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle: List[socket.socket] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _checkin(self, sock: socket.socket):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(sock)
+                return
+        sock.close()
+
+    def synthesize(self, text: str, model: str, voice: str) -> Tuple[np.ndarray, int]:
+        """
+        Synthesize text in the sidecar
+
+        A pooled connection the sidecar has since closed is replaced and
+        the request sent again; any other failure, including a timeout,
+        is raised.
+
+        Returns:
+            Tuple of (float32 mono samples, sample rate)
+        """
+        with self._lock:
+            sock = self._idle.pop() if self._idle else None
+        request = {"text": text, "model": model, "voice": voice}
+        if sock is not None:
+            try:
+                send_frame(sock, request)
+                reply = recv_frame(sock)
+            except (BrokenPipeError, ConnectionResetError):
+                reply = None
+            except BaseException:
+                # A timeout means the sidecar is busy, not gone; resending would queue the text twice
+                sock.close()
+                raise
+            if reply is None:
+                # The sidecar restarted since this connection was last used
+                sock.close()
+                sock = None
+        if sock is None:
+            sock = self._connect()
+            try:
+                send_frame(sock, request)
+                reply = recv_frame(sock)
+            except BaseException:
+                sock.close()
+                raise
+            if reply is None:
+                sock.close()
+                raise ConnectionError("TTS sidecar closed the connection")
+
+        if "error" in reply:
+            self._checkin(sock)
+            raise RuntimeError(f"TTS sidecar: {reply['error']}")
+        try:
+            samples = read_shared(reply["shm"], reply["samples"])
+            send_frame(sock, {"done": True})
+        except BaseException:
+            sock.close()
+            raise
+        self._checkin(sock)
+        return samples, reply["rate"]
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for sock in idle:
+            sock.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Serve TTS synthesis to the API over a Unix socket")
+    parser.add_argument("--socket", default=settings.tts_sidecar_socket or "/tmp/voice-ai-tts.sock",
+                        help="Unix socket path (default: TTS_SIDECAR_SOCKET)")
+    parser.add_argument("--workers", type=int, default=settings.tts_sidecar_workers, help="Model processes")
+    parser.add_argument("--threads", type=int, default=settings.tts_sidecar_threads,
+                        help="Intra-op threads per worker (0: divide the CPU cores)")
+    parser.add_argument("--model", help="TTS model (default: TTS_MODEL)")
+    parser.add_argument("--voice", help="Speaker (default: TTS_VOICE)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    server = SidecarServer(args.socket, args.workers, args.threads, args.model, args.voice)
+    server.start()
+    # serve_forever runs in this thread, so shut it down from another one
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -19,44 +19,43 @@ def format_phone_number(phone: str) -> str:
     """
     Format phone number to E.164 format
     
+    Numbers without a country code are read in settings.default_region.
+    
     Args:
         phone: Phone number in various formats
         
     Returns:
-        Formatted phone number
+        Formatted phone number (best effort if it cannot be normalized)
     """
-    # Remove all non-digit characters
-    digits = ''.join(filter(str.isdigit, phone))
-    
-    # Add + if not present and number doesn't start with country code
-    if not phone.startswith('+'):
-        # Assume US number if 10 digits
-        if len(digits) == 10:
-            return f"+1{digits}"
-        else:
-            return f"+{digits}"
+    from phone_numbers import normalize
+    e164, _ = normalize(phone)
+    if e164:
+        return e164
     
-    return phone
+    # Not a valid number; keep the previous best-effort behaviour
+    digits = ''.join(filter(str.isdigit, phone))
+    return phone if phone.startswith('+') else f"+{digits}"
 
 
 def validate_phone_number(phone: str) -> bool:
     """
     Validate phone number format
     
+    Numbers in countries without a rule in phone_numbers.COUNTRY_RULES
+    are only checked for E.164 length (10 to 15 digits).
+    
     Args:
         phone: Phone number to validate
         
     Returns:
         True if valid, False otherwise
     """
-    # Remove formatting
-    digits = ''.join(filter(str.isdigit, phone))
-    
-    # Check length (should be 10-15 digits for international)
-    if len(digits) < 10 or len(digits) > 15:
-        return False
-    
-    return True
+    from phone_numbers import normalize, PhoneError
+    _, error = normalize(phone)
+    if error == PhoneError.UNKNOWN_COUNTRY_CODE:
+        digits = ''.join(filter(str.isdigit, phone))
+        return 10 <= len(digits) <= 15
+    return error == PhoneError.OK
 
 
 def sanitize_text(text: str, max_length: int = 500) -> str:
@@ -87,17 +86,18 @@ def get_audio_duration(audio_path: str) -> Optional[float]:
     """
     Get duration of audio file in seconds
     
+    Reads container headers where possible and only decodes the file
+    when the format is not recognised (see audio_probe).
+    
     Args:
         audio_path: Path to audio file
         
     Returns:
         Duration in seconds, or None if error
     """
-    try:
-        from pydub import AudioSegment
-        audio = AudioSegment.from_file(audio_path)
-        return len(audio) / 1000.0  # Convert milliseconds to seconds
-    except Exception as e:
-        logger.error(f"Error getting audio duration: {str(e)}")
+    from audio_probe import probe
+    info = probe(audio_path)
+    if info is None:
+        logger.error(f"Error getting audio duration: could not probe {audio_path}")
         return None
-
+    return info.duration